@@ -0,0 +1,36 @@
+from zerolan.ump.registry import available_pipelines, create_pipeline, register_pipeline, resolve_pipeline
+
+# 管线与配置类在第一次访问时才导入，例如 from zerolan.ump import ASRPipeline
+_LAZY_ATTRS = {
+    "ASRPipeline": "zerolan.ump.pipeline.asr",
+    "ASRPipelineConfig": "zerolan.ump.pipeline.asr",
+    "LLMPipeline": "zerolan.ump.pipeline.llm",
+    "LLMPipelineConfig": "zerolan.ump.pipeline.llm",
+    "TTSPipeline": "zerolan.ump.pipeline.tts",
+    "TTSPipelineConfig": "zerolan.ump.pipeline.tts",
+    "OCRPipeline": "zerolan.ump.pipeline.ocr",
+    "OCRPipelineConfig": "zerolan.ump.pipeline.ocr",
+    "ImgCapPipeline": "zerolan.ump.pipeline.img_cap",
+    "ImgCapPipelineConfig": "zerolan.ump.pipeline.img_cap",
+    "VidCapPipeline": "zerolan.ump.pipeline.vid_cap",
+    "VidCapPipelineConfig": "zerolan.ump.pipeline.vid_cap",
+    "ShowUIPipeline": "zerolan.ump.pipeline.vla",
+    "ShowUIConfig": "zerolan.ump.pipeline.vla",
+    "MilvusPipeline": "zerolan.ump.pipeline.database",
+    "MilvusDatabaseConfig": "zerolan.ump.pipeline.database",
+}
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
@@ -1,7 +1,10 @@
+import asyncio
+import contextlib
 import os
+import time
 from abc import ABC, abstractmethod
 from http import HTTPStatus
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlsplit
 
 import requests
 from loguru import logger
@@ -9,10 +12,39 @@ from pydantic import BaseModel
 from zerolan.data.data.state import AppStatusEnum, ServiceState
 from zerolan.data.pipeline.abs_data import AbsractImageModelQuery, AbstractModelQuery, AbstractModelPrediction
 
+from zerolan.ump.common.balancer import EndpointGroup, LoadBalancerConfig
+from zerolan.ump.common.capture import capture, get_recorder
+from zerolan.ump.common.hedging import Hedger, HedgingConfig
+from zerolan.ump.common.image_cache import ImageCacheConfig, PerceptualCache
+from zerolan.ump.common.metrics import MetricsSink, get_metrics, instrument, record_exchange
+from zerolan.ump.common.scheduler import get_scheduler, schedule
+from zerolan.ump.common.session import get_async_client, get_session
+from zerolan.ump.common.singleflight import SingleFlight, query_key
+from zerolan.ump.common.utils.img_util import ImageEncodeConfig, ImageLike, encode_image, image_digest
+from zerolan.ump.common.utils.json_util import IncrementalJSONParser, decode
 from zerolan.ump.common.utils.web_util import is_valid_url
 
 
+def _replayable(kwargs: dict) -> bool:
+    """
+    请求体能否被重新发送。生成器或已打开的文件只能读取一次，不能切换服务器重试。
+    """
+    data = kwargs.get("data")
+    if data is not None and not isinstance(data, (bytes, str, dict, list, tuple)):
+        return False
+    files = kwargs.get("files") or {}
+    return not any(hasattr(value, "read") for value in files.values())
+
+
+def _accepted(response) -> bool:
+    return response.status_code < HTTPStatus.INTERNAL_SERVER_ERROR
+
+
 class AbstractPipeline(ABC):
+    # 这些接口可以安全地在另一台服务器上重试
+    idempotent_urls = {"state_url", "predict_url", "search_url", "batch_predict_url", "batch_search_url"}
+    # query.id 标识服务器端的会话时为 True，此时只合并 id 也相同的请求
+    stateful_id = False
 
     def __init__(self, config: any, model_type: str):
         """
@@ -24,11 +56,49 @@ class AbstractPipeline(ABC):
         self.model_type = model_type
         self.is_pipeline_enable()
         self.urls = {"state_url": urljoin(config.server_url, f"/{self.model_type}/state")}
+        self.session = get_session(config.server_url, getattr(config, "session", None))
+        balancer: LoadBalancerConfig | None = getattr(config, "balancer", None)
+        if balancer is not None and balancer.endpoints:
+            self.endpoints = EndpointGroup([config.server_url, *balancer.endpoints],
+                                           state_path=f"/{self.model_type}/state",
+                                           config=balancer,
+                                           session_config=getattr(config, "session", None))
+        else:
+            self.endpoints = None
+        self.metrics: MetricsSink | None = None
+        if (sink := get_metrics()) is not None:
+            instrument(self, sink)
+        if (recorder := get_recorder()) is not None:
+            capture(self, recorder)
+        # 调度包在计时之外，排队的时间不计入请求耗时
+        if (scheduler := get_scheduler()) is not None:
+            schedule(self, scheduler)
+        # 合并同时发出的相同请求
+        self.flight = SingleFlight(on_collapse=self._on_collapse) if getattr(config, "single_flight", False) else None
+        hedging: HedgingConfig | None = getattr(config, "hedging", None)
+        self.hedger = Hedger(hedging, on_hedge=self._on_hedge) if hedging is not None and hedging.enable else None
+
+    def _on_collapse(self):
+        if self.metrics is not None:
+            self.metrics.inc("zerolan_ump_collapsed_total", 1, (("model_type", self.model_type),))
+
+    def _on_hedge(self, outcome: str):
+        if self.metrics is not None:
+            self.metrics.inc("zerolan_ump_hedges_total", 1, (("model_type", self.model_type), ("outcome", outcome)))
 
     def is_pipeline_enable(self):
         if not self.config.enable:
             raise Exception("此管线已被禁用，若要启用，请在配置中将 enable 设为 true")
 
+    def close(self):
+        """
+        释放管线持有的后台资源，例如多服务器时的健康检查线程与对冲请求的线程池。关闭后不应再使用该管线。
+        """
+        if self.endpoints is not None:
+            self.endpoints.close()
+        if self.hedger is not None:
+            self.hedger.close()
+
     def check_urls(self):
         """
         用于检查配置实例中的推理 URL 是否合法。
@@ -42,9 +112,183 @@ class AbstractPipeline(ABC):
             if not is_valid_url(url):
                 raise ValueError(f"无效的 URL：{url}")
 
+    def _request(self, method: str, url_name: str, **kwargs) -> requests.Response:
+        """
+        使用共享的连接池会话向已注册的 URL 发送请求。
+        开启指标上报时会记录网络与服务器耗时以及收发的字节数。
+        :param method: HTTP 方法。
+        :param url_name: self.urls 中的键。
+        :param kwargs: 传递给 requests 的其他参数。
+        :return: 响应实例。
+        """
+        if self.metrics is None:
+            return self._send(method, url_name, **kwargs)
+        start = time.perf_counter()
+        response = self._send(method, url_name, **kwargs)
+        record_exchange(self.metrics, self.model_type, time.perf_counter() - start, response.request.headers,
+                        response, streamed=bool(kwargs.get("stream")))
+        return response
+
+    def _send(self, method: str, url_name: str, **kwargs) -> requests.Response:
+        """
+        配置了多个服务器时，由 self.endpoints 选择服务器；幂等的请求在连接失败或服务器错误时会切换到其他服务器重试。
+        开启对冲时，幂等的请求迟迟没有响应会再发出一个相同的请求，优先发往另一台服务器。
+        :param method: HTTP 方法。
+        :param url_name: self.urls 中的键。
+        :param kwargs: 传递给 requests 的其他参数。
+        :return: 响应实例。
+        """
+        if self.hedger is not None and self._hedgeable(url_name, kwargs):
+            tried = []
+            return self.hedger.call(lambda: self._send_balanced(method, url_name, kwargs, tried), _accepted,
+                                    lambda response: response.close())
+        return self._send_balanced(method, url_name, kwargs, [])
+
+    def _hedgeable(self, url_name: str, kwargs: dict) -> bool:
+        return url_name in self.idempotent_urls and _replayable(kwargs)
+
+    def _exclude(self, tried: list) -> tuple:
+        # 对冲请求与首个请求共享 tried，所有服务器都试过之后不再排除
+        return tuple(tried) if len(tried) < len(self.endpoints.endpoints) else ()
+
+    def _send_balanced(self, method: str, url_name: str, kwargs: dict, tried: list) -> requests.Response:
+        if self.endpoints is None:
+            return self.session.request(method, self.urls[url_name], **kwargs)
+
+        path = urlsplit(self.urls[url_name]).path
+        attempts = self._attempts(url_name, kwargs)
+        for attempt in range(attempts):
+            endpoint = self.endpoints.choose(exclude=self._exclude(tried))
+            tried.append(endpoint)
+            start = time.perf_counter()
+            try:
+                response = self.endpoints.session(endpoint).request(method, endpoint.url(path), **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.endpoints.release(endpoint, None, ok=False)
+                if attempt + 1 >= attempts:
+                    raise
+                logger.warning(f"服务器 {endpoint.base_url} 请求失败，切换到其他服务器：{e}")
+                continue
+            ok = response.status_code < HTTPStatus.INTERNAL_SERVER_ERROR
+            self.endpoints.release(endpoint, time.perf_counter() - start, ok)
+            if ok or attempt + 1 >= attempts:
+                return response
+            logger.warning(f"服务器 {endpoint.base_url} 返回 {response.status_code}，切换到其他服务器")
+            response.close()
+
+    def _attempts(self, url_name: str, kwargs: dict) -> int:
+        if url_name not in self.idempotent_urls or not _replayable(kwargs):
+            return 1
+        return min(1 + self.endpoints.config.max_failover, len(self.endpoints.endpoints))
+
+    def _async_client(self, base_url: str | None = None):
+        """
+        当前事件循环中指向本管线服务器的共享异步客户端。
+        :param base_url: 服务器地址，默认为 config.server_url。
+        :return: httpx.AsyncClient 实例。
+        """
+        return get_async_client(base_url or self.config.server_url, getattr(self.config, "session", None))
+
+    async def _arequest(self, method: str, url_name: str, **kwargs):
+        """
+        _request 的异步版本，使用共享的 httpx.AsyncClient 发送请求，不会阻塞事件循环。
+        :param method: HTTP 方法。
+        :param url_name: self.urls 中的键。
+        :param kwargs: 传递给 httpx 的其他参数。
+        :return: httpx.Response 实例。
+        """
+        if self.metrics is None:
+            return await self._asend(method, url_name, **kwargs)
+        start = time.perf_counter()
+        response = await self._asend(method, url_name, **kwargs)
+        record_exchange(self.metrics, self.model_type, time.perf_counter() - start, response.request.headers,
+                        response, streamed=False)
+        return response
+
+    async def _asend(self, method: str, url_name: str, **kwargs):
+        if self.hedger is not None and self._hedgeable(url_name, kwargs):
+            tried = []
+            return await self.hedger.acall(lambda: self._asend_balanced(method, url_name, kwargs, tried), _accepted)
+        return await self._asend_balanced(method, url_name, kwargs, [])
+
+    async def _asend_balanced(self, method: str, url_name: str, kwargs: dict, tried: list):
+        if self.endpoints is None:
+            return await self._async_client().request(method, self.urls[url_name], **kwargs)
+
+        import httpx
+
+        path = urlsplit(self.urls[url_name]).path
+        attempts = self._attempts(url_name, kwargs)
+        for attempt in range(attempts):
+            endpoint = self.endpoints.choose(exclude=self._exclude(tried))
+            tried.append(endpoint)
+            start = time.perf_counter()
+            try:
+                response = await self._async_client(endpoint.base_url).request(method, endpoint.url(path), **kwargs)
+            except httpx.TransportError as e:
+                self.endpoints.release(endpoint, None, ok=False)
+                if attempt + 1 >= attempts:
+                    raise
+                logger.warning(f"服务器 {endpoint.base_url} 请求失败，切换到其他服务器：{e}")
+                continue
+            ok = response.status_code < HTTPStatus.INTERNAL_SERVER_ERROR
+            self.endpoints.release(endpoint, time.perf_counter() - start, ok)
+            if ok or attempt + 1 >= attempts:
+                return response
+            logger.warning(f"服务器 {endpoint.base_url} 返回 {response.status_code}，切换到其他服务器")
+
+    def _astream(self, method: str, url_name: str, **kwargs):
+        """
+        以流式方式发送异步请求，请配合 async with 使用。
+        流式请求一旦开始便不会切换服务器。
+        :param method: HTTP 方法。
+        :param url_name: self.urls 中的键。
+        :param kwargs: 传递给 httpx 的其他参数。
+        :return: 产生 httpx.Response 的异步上下文管理器。
+        """
+        if self.endpoints is None:
+            stream = self._async_client().stream(method, self.urls[url_name], **kwargs)
+        else:
+            stream = self._abalanced_stream(method, urlsplit(self.urls[url_name]).path, kwargs)
+        if self.metrics is None:
+            return stream
+        return self._ameasured_stream(stream)
+
+    @contextlib.asynccontextmanager
+    async def _ameasured_stream(self, stream):
+        start = time.perf_counter()
+        async with stream as response:
+            record_exchange(self.metrics, self.model_type, time.perf_counter() - start, response.request.headers,
+                            response, streamed=True)
+            yield response
+
+    @contextlib.asynccontextmanager
+    async def _abalanced_stream(self, method: str, path: str, kwargs: dict):
+        endpoint = self.endpoints.choose()
+        start = time.perf_counter()
+        latency, ok = None, False
+        try:
+            async with self._async_client(endpoint.base_url).stream(method, endpoint.url(path), **kwargs) as response:
+                # 以收到响应头的时间作为延迟，而不是整个流的时长
+                latency = time.perf_counter() - start
+                ok = response.status_code < HTTPStatus.INTERNAL_SERVER_ERROR
+                yield response
+        finally:
+            self.endpoints.release(endpoint, latency, ok)
+
     def check_state(self) -> ServiceState:
         try:
-            response = requests.get(url=self.urls["state_url"], stream=True)
+            response = self._request("GET", "state_url", stream=True)
+            if response.status_code == HTTPStatus.OK:
+                state = ServiceState.model_validate_json(response.content)
+                return state
+        except Exception as e:
+            logger.error(e)
+            return ServiceState(state=AppStatusEnum.UNKNOWN, msg=f"{e}")
+
+    async def acheck_state(self) -> ServiceState:
+        try:
+            response = await self._arequest("GET", "state_url")
             if response.status_code == HTTPStatus.OK:
                 state = ServiceState.model_validate_json(response.content)
                 return state
@@ -53,6 +297,22 @@ class AbstractPipeline(ABC):
             return ServiceState(state=AppStatusEnum.UNKNOWN, msg=f"{e}")
 
 
+async def _aread_files(files: dict) -> dict:
+    """
+    在线程中读取并关闭 parse_query 打开的文件，避免阻塞事件循环。
+    :param files: parse_query 返回的 files 字典。
+    :return: 值均为 bytes 的 files 字典。
+    """
+
+    def read(value):
+        if hasattr(value, "read"):
+            with value:
+                return value.read()
+        return value
+
+    return {name: await asyncio.to_thread(read, value) for name, value in files.items()}
+
+
 class CommonModelPipeline(AbstractPipeline):
 
     def __init__(self, config: any, model_type: str):
@@ -69,7 +329,7 @@ class CommonModelPipeline(AbstractPipeline):
         :return: 返回模型的响应实例。
         """
         query_dict = self.parse_query(query)
-        response = requests.post(url=self.urls["predict_url"], stream=True, json=query_dict)
+        response = self._request("POST", "predict_url", stream=True, json=query_dict)
         if response.status_code == HTTPStatus.OK:
             prediction = self.parse_prediction(response.content)
             return prediction
@@ -86,16 +346,66 @@ class CommonModelPipeline(AbstractPipeline):
         :return: 返回模型的响应实例的 Generator。
         """
         query_dict = self.parse_query(query)
-        response = requests.get(url=self.urls["stream_predict_url"], stream=True,
-                                json=query_dict)
+        if self.flight is None:
+            yield from self._stream_predictions(query_dict)
+        else:
+            yield from self.flight.stream(query_key(query, keep_id=self.stateful_id),
+                                          lambda: self._stream_predictions(query_dict))
+
+    def _stream_predictions(self, query_dict: dict):
+        response = self._request("GET", "stream_predict_url", stream=True, json=query_dict)
+
+        if response.status_code == HTTPStatus.OK:
+            # 网络分块的边界与 JSON 对象的边界无关，需要增量切分
+            parser = IncrementalJSONParser()
+            for chunk in response.iter_content(chunk_size=None):
+                for doc in parser.feed(chunk):
+                    yield self.parse_prediction(doc)
+            parser.close()
+        else:
+            response.raise_for_status()
 
+    async def apredict(self, query: AbstractModelQuery) -> AbstractModelPrediction | None:
+        """
+        predict 的异步版本，不会阻塞事件循环。
+        :param query: 对于模型的请求实例。
+        :return: 返回模型的响应实例。
+        """
+        query_dict = self.parse_query(query)
+        response = await self._arequest("POST", "predict_url", json=query_dict)
         if response.status_code == HTTPStatus.OK:
-            for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
-                prediction = self.parse_prediction(chunk)
-                yield prediction
+            prediction = self.parse_prediction(response.content)
+            return prediction
         else:
             response.raise_for_status()
 
+    async def astream_predict(self, query: AbstractModelQuery):
+        """
+        stream_predict 的异步版本，请使用 async for 循环取出其中的值。
+        :param query: 对于模型的请求实例。
+        :return: 返回模型的响应实例的 AsyncGenerator。
+        """
+        query_dict = self.parse_query(query)
+        if self.flight is None:
+            stream = self._astream_predictions(query_dict)
+        else:
+            stream = self.flight.astream(query_key(query, keep_id=self.stateful_id),
+                                         lambda: self._astream_predictions(query_dict))
+        async for prediction in stream:
+            yield prediction
+
+    async def _astream_predictions(self, query_dict: dict):
+        async with self._astream("GET", "stream_predict_url", json=query_dict) as response:
+            if response.status_code == HTTPStatus.OK:
+                parser = IncrementalJSONParser()
+                async for chunk in response.aiter_bytes():
+                    for doc in parser.feed(chunk):
+                        yield self.parse_prediction(doc)
+                parser.close()
+            else:
+                await response.aread()
+                response.raise_for_status()
+
     def parse_query(self, query: any) -> dict:
         """
         尝试将 Query 解析为 Dict，解析失败会抛出 ValueError。
@@ -109,37 +419,108 @@ class CommonModelPipeline(AbstractPipeline):
 
     def parse_prediction(self, json_val: any) -> AbstractModelPrediction:
         """
-        尝试将 JSON 字符串或 Dict 解析为类的实例。
-        :param json_val: JSON 字符串或 Dict。
+        尝试将 JSON 字节、字符串或 Dict 解析为类的实例。
+        :param json_val: JSON 字节、字符串或 Dict。
         :return:
         """
-        if isinstance(json_val, str):
-            return AbstractModelPrediction.model_validate_json(json_val)
-        elif isinstance(json_val, dict):
-            return AbstractModelPrediction.model_validate_dict(json_val)
-        else:
-            raise ValueError("Must be an instance of BaseModel.")
+        return decode(AbstractModelPrediction, json_val)
 
 
 class AbstractImagePipeline(CommonModelPipeline):
     def __init__(self, config: any, model_type: str):
         super().__init__(config, model_type)
+        self.image_config: ImageEncodeConfig = getattr(config, "image", None) or ImageEncodeConfig()
+        cache_config: ImageCacheConfig | None = getattr(config, "cache", None)
+        self.cache = PerceptualCache(cache_config) if cache_config is not None and cache_config.enable else None
 
-    def predict(self, query: AbsractImageModelQuery) -> AbstractModelPrediction | None:
-        # 如果 query.img_path 的路径在本机上是存在的，那么将图片读取为二进制文件，添加到请求的 files 里
-        if os.path.exists(query.img_path):
-            query.img_path = os.path.abspath(query.img_path)
-            files = {'image': open(query.img_path, 'rb')}
+    def _load_image(self, query: AbsractImageModelQuery, image: ImageLike | None) -> ImageLike | None:
+        """
+        取得需要上传的图片。
+        :param query: 图片模型的请求实例。
+        :param image: 内存中的图片，为 None 时读取 query.img_path。
+        :return: 图片；若图片只存在于远程主机上则返回 None。
+        """
+        if image is not None:
+            return image
+        # 如果 query.img_path 的路径在本机上是不存在的，那么认为在远程主机上一定存在
+        if query.img_path is None or not os.path.exists(query.img_path):
+            return None
+        query.img_path = os.path.abspath(query.img_path)
+        with open(query.img_path, 'rb') as f:
+            return f.read()
+
+    def _cache_lookup(self, query: AbsractImageModelQuery, image: ImageLike | None):
+        """
+        :return: (缓存键, 命中的结果)，未启用缓存或图片不在本机时均为 None。
+        """
+        if self.cache is None or image is None:
+            return None, None
+        key = self.cache.key(query, image)
+        return key, self.cache.get(key)
+
+    def _flight_key(self, query: AbsractImageModelQuery, image: ImageLike | None) -> str:
+        return query_key(query, image_digest(image) if image is not None else b"")
+
+    def predict(self, query: AbsractImageModelQuery, image: ImageLike | None = None) -> AbstractModelPrediction | None:
+        """
+        图片模型的推理。
+        :param query: 图片模型的请求实例。
+        :param image: 可选，内存中的图片（已编码的字节或 NumPy 数组），提供时无需先写入磁盘。
+        :return: 返回模型的响应实例。
+        """
+        image = self._load_image(query, image)
+        key, prediction = self._cache_lookup(query, image)
+        if prediction is not None:
+            return prediction
+        if self.flight is None:
+            return self._predict(query, image, key)
+        return self.flight.do(self._flight_key(query, image), lambda: self._predict(query, image, key))
 
+    def _post_image(self, query: AbsractImageModelQuery, image: ImageLike | None):
+        if image is not None:
+            files = {'image': encode_image(image, self.image_config)}
             # 将其他的字段继续序列化为 JSON 字符串
             data = {'json': query.model_dump_json()}
+            return self._request("POST", "predict_url", files=files, data=data)
+        return self._request("POST", "predict_url", json=query.model_dump())
 
-            response = requests.post(url=self.urls["predict_url"], files=files, data=data)
-        # 如果 query.img_path 的路径在本机上是不存在的，那么认为在远程主机上一定存在
+    def _predict(self, query: AbsractImageModelQuery, image: ImageLike | None, key) -> AbstractModelPrediction:
+        response = self._post_image(query, image)
+        if response.status_code == HTTPStatus.OK:
+            prediction = self.parse_prediction(response.content)
+            if key is not None:
+                self.cache.put(key, prediction)
+            return prediction
         else:
-            response = requests.post(url=self.urls["predict_url"], json=query.model_dump())
+            response.raise_for_status()
+
+    async def apredict(self, query: AbsractImageModelQuery,
+                       image: ImageLike | None = None) -> AbstractModelPrediction | None:
+        image = await asyncio.to_thread(self._load_image, query, image)
+        key, prediction = await asyncio.to_thread(self._cache_lookup, query, image)
+        if prediction is not None:
+            return prediction
+        if self.flight is None:
+            return await self._apredict(query, image, key)
+        flight_key = await asyncio.to_thread(self._flight_key, query, image)
+        return await self.flight.ado(flight_key, lambda: self._apredict(query, image, key))
+
+    async def _apost_image(self, query: AbsractImageModelQuery, image: ImageLike | None):
+        if image is not None:
+            filename, content, mime = await asyncio.to_thread(encode_image, image, self.image_config)
+            # httpx 不接受 memoryview
+            files = {'image': (filename, bytes(content), mime)}
+            data = {'json': query.model_dump_json()}
+            return await self._arequest("POST", "predict_url", files=files, data=data)
+        return await self._arequest("POST", "predict_url", json=query.model_dump())
+
+    async def _apredict(self, query: AbsractImageModelQuery, image: ImageLike | None,
+                        key) -> AbstractModelPrediction:
+        response = await self._apost_image(query, image)
         if response.status_code == HTTPStatus.OK:
             prediction = self.parse_prediction(response.content)
+            if key is not None:
+                self.cache.put(key, prediction)
             return prediction
         else:
             response.raise_for_status()
@@ -148,6 +529,10 @@ class AbstractImagePipeline(CommonModelPipeline):
     def stream_predict(self, query: AbstractModelQuery):
         raise NotImplementedError()
 
+    async def astream_predict(self, query: AbstractModelQuery):
+        raise NotImplementedError()
+        yield
+
     @abstractmethod
     def parse_query(self, query: any) -> dict:
         raise NotImplementedError()
@@ -0,0 +1,72 @@
+import argparse
+import json
+import timeit
+from typing import Callable
+
+from zerolan.data.pipeline.milvus import MilvusQueryResult, QueryRow
+from zerolan.data.pipeline.ocr import OCRPrediction, Position, RegionResult, Vector2D
+
+from zerolan.ump.common.utils import json_util
+from zerolan.ump.common.utils.json_util import decode, decode_lazy, decode_list, loads
+
+
+def _ocr_body(regions: int) -> bytes:
+    position = Position(lu=Vector2D(x=0, y=0), ru=Vector2D(x=1, y=0), rd=Vector2D(x=1, y=1), ld=Vector2D(x=0, y=1))
+    prediction = OCRPrediction(region_results=[RegionResult(position=position, content=f"第{i}行文字", confidence=0.9)
+                                               for i in range(regions)])
+    return prediction.model_dump_json().encode()
+
+
+def _milvus_body(hits: int) -> bytes:
+    rows = [QueryRow(id=i, distance=1 - i / hits, entity={"text": "记忆" * 20, "subject": "s"}) for i in range(hits)]
+    return MilvusQueryResult(result=[rows]).model_dump_json().encode()
+
+
+def _time(fn: Callable[[], object], number: int) -> float:
+    fn()
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+def run(regions: int, hits: int, batch: int, number: int) -> list[tuple[str, str, float]]:
+    """
+    :return: [(场景, 方法, 每次耗时（秒）)]。
+    """
+    ocr = _ocr_body(regions)
+    milvus = _milvus_body(hits)
+    batch_body = b"[" + b",".join([ocr] * batch) + b"]"
+    cases = [
+        ("ocr", "json.loads + model_validate", lambda: OCRPrediction.model_validate(json.loads(ocr))),
+        ("ocr", "decode", lambda: decode(OCRPrediction, ocr)),
+        ("ocr", "decode_lazy, first 5", lambda: decode_lazy(RegionResult, ocr, "region_results")[:5]),
+        ("milvus", "json.loads + model_validate", lambda: MilvusQueryResult.model_validate(json.loads(milvus))),
+        ("milvus", "decode", lambda: decode(MilvusQueryResult, milvus)),
+        ("ocr batch", "per-item model_validate", lambda: [OCRPrediction.model_validate(p)
+                                                         for p in json.loads(batch_body)]),
+        ("ocr batch", "decode_list", lambda: decode_list(OCRPrediction, batch_body)),
+    ]
+    results = [(scene, method, _time(fn, number)) for scene, method, fn in cases]
+    for backend in ("json", "orjson"):
+        try:
+            json_util.set_json_backend(backend)
+        except ImportError:
+            continue
+        results.append(("plain json", f"loads ({backend})", _time(lambda: loads(ocr), number)))
+    json_util.set_json_backend()
+    return results
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="比较各种响应解析方式的耗时")
+    parser.add_argument("--regions", type=int, default=500, help="OCR 结果的区域数")
+    parser.add_argument("--hits", type=int, default=100, help="Milvus 检索结果的条数")
+    parser.add_argument("--batch", type=int, default=16, help="批量 OCR 结果的个数")
+    parser.add_argument("--number", type=int, default=50, help="每轮的调用次数")
+    args = parser.parse_args(argv)
+
+    print(f"{'scene':<12}{'method':<32}{'us':>10}")
+    for scene, method, elapsed in run(args.regions, args.hits, args.batch, args.number):
+        print(f"{scene:<12}{method:<32}{elapsed * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
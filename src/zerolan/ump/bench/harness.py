@@ -0,0 +1,292 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from pydantic import BaseModel
+from zerolan.data.pipeline.asr import ASRQuery, ASRStreamQuery
+from zerolan.data.pipeline.img_cap import ImgCapQuery
+from zerolan.data.pipeline.llm import LLMQuery
+from zerolan.data.pipeline.milvus import InsertRow, MilvusInsert, MilvusQuery
+from zerolan.data.pipeline.ocr import OCRQuery
+from zerolan.data.pipeline.tts import TTSQuery
+from zerolan.data.pipeline.vid_cap import VidCapQuery
+from zerolan.data.pipeline.vla import ShowUiQuery
+
+from zerolan.ump.bench.mock_server import MockServerConfig, MockZerolanServer
+from zerolan.ump.common.stats import _pick
+
+# 一张 1x1 的 PNG 图片，无需 Pillow 即可直接上传
+_PNG = bytes.fromhex("89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+                     "1f15c4890000000d49444154789c6300010000050001"
+                     "0d0a2db40000000049454e44ae426082")
+
+
+class BenchCase:
+
+    def __init__(self, name: str, call: Callable[[], Any], is_async: bool = False):
+        """
+        :param name: 用例名，形如 "llm.stream_predict"。
+        :param call: 执行一次调用的函数，异步用例为返回协程的函数；流式调用需要在内部消费完所有结果。
+        :param is_async: 是否为异步用例。
+        """
+        self.name = name
+        self.call = call
+        self.is_async = is_async
+
+
+class BenchResult(BaseModel):
+    name: str
+    concurrency: int
+    requests: int
+    errors: int
+    rps: float
+    p50_ms: float | None
+    p95_ms: float | None
+    p99_ms: float | None
+    cpu_ms_per_call: float  # 客户端进程的 CPU 时间
+    alloc_kib_per_call: float | None  # 单次调用期间 Python 堆的峰值增长
+
+
+def _measure_allocations(case: BenchCase, samples: int) -> float | None:
+    if samples <= 0:
+        return None
+    loop = asyncio.new_event_loop() if case.is_async else None
+    peaks = []
+    tracemalloc.start()
+    try:
+        # 第一次调用会创建连接与客户端，不计入结果
+        for i in range(samples + 1):
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            try:
+                loop.run_until_complete(case.call()) if loop is not None else case.call()
+            except Exception:
+                continue
+            if i:
+                peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+        if loop is not None:
+            loop.close()
+    return sum(peaks) / len(peaks) / 1024 if peaks else None
+
+
+def _run_sync(case: BenchCase, concurrency: int, requests: int) -> tuple[list[float], int]:
+    latencies, errors = [], 0
+
+    def one():
+        start = time.perf_counter()
+        case.call()
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(one) for _ in range(requests)]:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    return latencies, errors
+
+
+async def _run_async(case: BenchCase, concurrency: int, requests: int) -> tuple[list[float], int]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await case.call()
+            return time.perf_counter() - start
+
+    results = await asyncio.gather(*(one() for _ in range(requests)), return_exceptions=True)
+    latencies = [r for r in results if not isinstance(r, BaseException)]
+    return latencies, len(results) - len(latencies)
+
+
+def run_case(case: BenchCase, concurrency: int, requests: int, warmup: int = 5,
+             alloc_samples: int = 20) -> BenchResult:
+    """
+    以给定的并发数执行一个用例。
+    :param case: 用例。
+    :param concurrency: 并发数，同步用例为线程数，异步用例为同时进行的协程数。
+    :param requests: 总调用次数。
+    :param warmup: 预热次数，不计入结果。
+    :param alloc_samples: 单独串行执行并统计内存分配的次数，0 表示不统计。
+    :return: BenchResult 实例。
+    """
+    if case.is_async:
+        def run(n, c):
+            return asyncio.run(_run_async(case, c, n))
+    else:
+        def run(n, c):
+            return _run_sync(case, c, n)
+
+    if warmup:
+        run(warmup, 1)
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    latencies, errors = run(requests, concurrency)
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    latencies.sort()
+
+    def ms(p):
+        value = _pick(latencies, p)
+        return value * 1000 if value is not None else None
+
+    return BenchResult(name=case.name,
+                       concurrency=concurrency,
+                       requests=requests,
+                       errors=errors,
+                       rps=len(latencies) / wall if wall else 0.0,
+                       p50_ms=ms(50),
+                       p95_ms=ms(95),
+                       p99_ms=ms(99),
+                       cpu_ms_per_call=cpu * 1000 / requests,
+                       alloc_kib_per_call=_measure_allocations(case, alloc_samples))
+
+
+def default_cases(server_url: str, workdir: str, payload_size: int = 256) -> list[BenchCase]:
+    """
+    覆盖所有管线的默认用例，全部指向同一个替身服务器。
+    :param server_url: 替身服务器地址。
+    :param workdir: 用于存放临时音频与视频文件的目录。
+    :param payload_size: 上传的音频的字节数。
+    :return: 用例列表。
+    """
+    from zerolan.ump.pipeline.asr import ASRPipeline, ASRPipelineConfig
+    from zerolan.ump.pipeline.database import MilvusDatabaseConfig, MilvusPipeline
+    from zerolan.ump.pipeline.img_cap import ImgCapPipeline, ImgCapPipelineConfig
+    from zerolan.ump.pipeline.llm import LLMPipeline, LLMPipelineConfig
+    from zerolan.ump.pipeline.ocr import OCRPipeline, OCRPipelineConfig
+    from zerolan.ump.pipeline.tts import TTSPipeline, TTSPipelineConfig
+    from zerolan.ump.pipeline.vid_cap import VidCapPipeline, VidCapPipelineConfig
+    from zerolan.ump.pipeline.vla import ShowUIConfig, ShowUIPipeline
+
+    audio = b"\x00" * payload_size
+    audio_path = os.path.join(workdir, "bench.wav")
+    video_path = os.path.join(workdir, "bench.mp4")
+    for path, data in ((audio_path, audio), (video_path, b"\x00" * 64)):
+        with open(path, "wb") as f:
+            f.write(data)
+
+    asr = ASRPipeline(ASRPipelineConfig(server_url=server_url))
+    llm = LLMPipeline(LLMPipelineConfig(server_url=server_url))
+    tts = TTSPipeline(TTSPipelineConfig(server_url=server_url))
+    ocr = OCRPipeline(OCRPipelineConfig(server_url=server_url))
+    img_cap = ImgCapPipeline(ImgCapPipelineConfig(server_url=server_url))
+    vid_cap = VidCapPipeline(VidCapPipelineConfig(server_url=server_url))
+    vla = ShowUIPipeline(ShowUIConfig(server_url=server_url))
+    milvus = MilvusPipeline(MilvusDatabaseConfig(server_url=server_url))
+
+    def llm_query():
+        return LLMQuery(text="你好", history=[])
+
+    def tts_query():
+        return TTSQuery(text="你好", text_language="zh", refer_wav_path="remote.wav", prompt_text="你好",
+                        prompt_language="zh")
+
+    def asr_stream_query():
+        return ASRStreamQuery(is_final=True, audio_data=audio, media_type="float32")
+
+    search = MilvusQuery(collection_name="bench", limit=5, output_fields=["text"], query="你好")
+    insert = MilvusInsert(collection_name="bench", texts=[InsertRow(id=0, text="你好", subject="bench")])
+
+    async def alist(agen):
+        return [item async for item in agen]
+
+    return [
+        BenchCase("asr.predict", lambda: asr.predict(ASRQuery(audio_path=audio_path))),
+        BenchCase("asr.stream_predict", lambda: asr.stream_predict(asr_stream_query())),
+        BenchCase("asr.apredict", lambda: asr.apredict(ASRQuery(audio_path=audio_path)), is_async=True),
+        BenchCase("llm.predict", lambda: llm.predict(llm_query())),
+        BenchCase("llm.stream_predict", lambda: list(llm.stream_predict(llm_query()))),
+        BenchCase("llm.apredict", lambda: llm.apredict(llm_query()), is_async=True),
+        BenchCase("llm.astream_predict", lambda: alist(llm.astream_predict(llm_query())), is_async=True),
+        BenchCase("tts.stream_predict", lambda: list(tts.stream_predict(tts_query()))),
+        BenchCase("tts.stream_frames", lambda: sum(len(f.payload) for f in tts.stream_frames(tts_query()))),
+        BenchCase("tts.astream_predict", lambda: alist(tts.astream_predict(tts_query())), is_async=True),
+        BenchCase("ocr.predict", lambda: ocr.predict(OCRQuery(), image=_PNG)),
+        BenchCase("ocr.apredict", lambda: ocr.apredict(OCRQuery(), image=_PNG), is_async=True),
+        BenchCase("img-cap.predict", lambda: img_cap.predict(ImgCapQuery(), image=_PNG)),
+        BenchCase("vid-cap.predict", lambda: vid_cap.predict(VidCapQuery(vid_path=video_path))),
+        BenchCase("vla.predict", lambda: vla.predict(ShowUiQuery(query="点击"), image=_PNG)),
+        BenchCase("milvus.insert", lambda: milvus.insert(insert)),
+        BenchCase("milvus.search", lambda: milvus.search(search)),
+        BenchCase("milvus.asearch", lambda: milvus.asearch(search), is_async=True),
+    ]
+
+
+def _serve(config: MockServerConfig, urls):
+    server = MockZerolanServer(config)
+    urls.put(server.url)
+    server.serve_forever()
+
+
+def start_mock_server_process(config: MockServerConfig) -> tuple[multiprocessing.Process, str]:
+    """
+    在子进程中启动替身服务器，使服务器的 CPU 与内存开销不计入客户端的测量。
+    :param config: 服务器配置。
+    :return: (子进程, 服务器地址)。
+    """
+    urls = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(config, urls), daemon=True)
+    process.start()
+    return process, urls.get(timeout=30)
+
+
+def format_results(results: list[BenchResult]) -> str:
+    header = f"{'case':<22}{'conc':>5}{'reqs':>6}{'err':>5}{'rps':>10}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}" \
+             f"{'cpu_ms':>9}{'alloc_kib':>11}"
+    lines = [header, "-" * len(header)]
+
+    def fmt(value, width):
+        return f"{value:>{width}.2f}" if value is not None else f"{'-':>{width}}"
+
+    for r in results:
+        lines.append(f"{r.name:<22}{r.concurrency:>5}{r.requests:>6}{r.errors:>5}{fmt(r.rps, 10)}"
+                     f"{fmt(r.p50_ms, 9)}{fmt(r.p95_ms, 9)}{fmt(r.p99_ms, 9)}{fmt(r.cpu_ms_per_call, 9)}"
+                     f"{fmt(r.alloc_kib_per_call, 11)}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="使用本地替身服务器测量各管线的客户端开销")
+    parser.add_argument("--concurrency", default="1,4,16", help="以逗号分隔的并发数")
+    parser.add_argument("--requests", type=int, default=200, help="每个用例在每个并发数下的调用次数")
+    parser.add_argument("--cases", default="", help="只运行名称以这些前缀开头的用例，以逗号分隔")
+    parser.add_argument("--latency", type=float, default=0.0, help="服务器处理耗时（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="服务器处理耗时的随机增量（秒）")
+    parser.add_argument("--payload-size", type=int, default=256, help="文本的字符数或音频的字节数")
+    parser.add_argument("--chunk-count", type=int, default=8, help="流式接口的分块数")
+    parser.add_argument("--chunk-interval", type=float, default=0.0, help="流式接口的分块间隔（秒）")
+    parser.add_argument("--alloc-samples", type=int, default=20, help="统计内存分配的调用次数，0 表示不统计")
+    parser.add_argument("--json", dest="json_path", default=None, help="将结果写入该 JSON 文件")
+    args = parser.parse_args(argv)
+
+    config = MockServerConfig(latency=args.latency, jitter=args.jitter, payload_size=args.payload_size,
+                              chunk_count=args.chunk_count, chunk_interval=args.chunk_interval)
+    process, url = start_mock_server_process(config)
+    prefixes = tuple(p for p in args.cases.split(",") if p)
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            cases = [c for c in default_cases(url, workdir, args.payload_size)
+                     if not prefixes or c.name.startswith(prefixes)]
+            for case in cases:
+                for concurrency in (int(c) for c in args.concurrency.split(",")):
+                    results.append(run_case(case, concurrency, args.requests, alloc_samples=args.alloc_samples))
+    finally:
+        process.terminate()
+
+    print(format_results(results))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            f.write("[" + ",".join(r.model_dump_json() for r in results) + "]")
+
+
+if __name__ == "__main__":
+    main()
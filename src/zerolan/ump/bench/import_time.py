@@ -0,0 +1,57 @@
+import argparse
+import statistics
+import subprocess
+import sys
+
+DEFAULT_TARGETS = [
+    "zerolan.ump",
+    "zerolan.ump.pipeline.asr",
+    "zerolan.ump.pipeline.llm",
+    "zerolan.ump.pipeline.tts",
+    "zerolan.ump.pipeline.ocr",
+    "zerolan.ump.pipeline.img_cap",
+    "zerolan.ump.pipeline.vid_cap",
+    "zerolan.ump.pipeline.vla",
+    "zerolan.ump.pipeline.database",
+]
+
+_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [m for m in ("openai", "httpx", "numpy", "PIL", "cv2", "requests", "loguru") if m in sys.modules]
+print(elapsed, ",".join(heavy))
+"""
+
+
+def measure(module: str, repeat: int = 5) -> tuple[float, list[str]]:
+    """
+    在全新的解释器中导入模块并计时，取多次的中位数。
+    :param module: 模块名。
+    :param repeat: 重复次数。
+    :return: (耗时中位数（秒）, 导入后已加载的重量级依赖)。
+    """
+    samples, heavy = [], []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", _SNIPPET.format(module=module)],
+                                capture_output=True, text=True, check=True).stdout.split()
+        samples.append(float(output[0]))
+        heavy = output[1].split(",") if len(output) > 1 else []
+    return statistics.median(samples), heavy
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="测量各模块的冷启动导入耗时")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_TARGETS, help="要测量的模块")
+    parser.add_argument("--repeat", type=int, default=5, help="每个模块的重复次数")
+    args = parser.parse_args(argv)
+
+    print(f"{'module':<34}{'ms':>9}  loaded")
+    for module in args.modules:
+        elapsed, heavy = measure(module, args.repeat)
+        print(f"{module:<34}{elapsed * 1000:>9.1f}  {', '.join(heavy)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import json
+import random
+import struct
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from pydantic import BaseModel
+from zerolan.data.data.state import AppStatusEnum, ServiceState
+from zerolan.data.pipeline.asr import ASRPrediction
+from zerolan.data.pipeline.img_cap import ImgCapPrediction
+from zerolan.data.pipeline.llm import Conversation, LLMPrediction, RoleEnum
+from zerolan.data.pipeline.milvus import MilvusInsertResult, MilvusQueryResult, QueryRow
+from zerolan.data.pipeline.ocr import OCRPrediction, Position, RegionResult, Vector2D
+from zerolan.data.pipeline.tts import TTSPrediction
+from zerolan.data.pipeline.vid_cap import VidCapPrediction
+from zerolan.data.pipeline.vla import Action, ShowUiPrediction
+
+
+class MockServerConfig(BaseModel):
+    latency: float = 0.0  # 每个请求的服务器处理耗时（秒）
+    jitter: float = 0.0  # 在 latency 基础上随机增加的最大耗时（秒）
+    payload_size: int = 256  # 文本的字符数或音频的字节数
+    chunk_count: int = 8  # 流式接口返回的分块数
+    chunk_interval: float = 0.0  # 流式接口两个分块之间的间隔（秒）
+    regions: int = 8  # OCR 返回的区域数
+    search_hits: int = 5  # Milvus 检索返回的条数
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头与响应体分开写出，不关闭 Nagle 算法会与客户端的延迟确认叠加出约 40 毫秒的延迟
+    disable_nagle_algorithm = True
+    server: "MockZerolanServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return bytes(body)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _dispatch(self):
+        body = self._read_body()
+        self.server.requests += 1
+        self.server.bytes_received += len(body)
+        path = urlsplit(self.path).path
+        model_type, _, action = path.strip("/").rpartition("/")
+        config = self.server.config
+        start = time.perf_counter()
+        time.sleep(config.latency + random.uniform(0, config.jitter))
+
+        if action == "state":
+            self._send_json(ServiceState(state=AppStatusEnum.RUNNING, msg="mock").model_dump_json(), start)
+        elif action == "stream-predict" and model_type in ("llm", "tts"):
+            self._send_stream(model_type)
+        elif action in ("predict", "stream-predict", "insert", "search", "segment-predict") and \
+                (payload := self.server.prediction(model_type, action, body)) is not None:
+            self._send_json(payload, start)
+        elif action in ("batch-predict", "batch-search") and model_type in ("ocr", "milvus"):
+            count = max(1, len(self._batch_items(body)))
+            item = self.server.prediction(model_type, "predict" if model_type == "ocr" else "search", body)
+            self._send_json("[" + ",".join([item] * count) + "]", start)
+        else:
+            self.send_response(HTTPStatus.NOT_FOUND)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def _batch_items(self, body: bytes) -> list:
+        # milvus 的请求体是 JSON 列表，OCR 是 multipart 中名为 json 的字段
+        try:
+            return json.loads(body)
+        except ValueError:
+            marker = body.find(b'name="json"')
+            if marker < 0:
+                return []
+            start = body.find(b"\r\n\r\n", marker) + 4
+            return json.loads(body[start:body.find(b"\r\n--", start)])
+
+    def _send_json(self, payload: str, start: float):
+        data = payload.encode("utf-8")
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Server-Timing", f"mock;dur={(time.perf_counter() - start) * 1000:.3f}")
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.bytes_sent += len(data)
+
+    def _send_stream(self, model_type: str):
+        config = self.server.config
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/json" if model_type == "llm" else "audio/wav")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, chunk in enumerate(self.server.stream_chunks(model_type)):
+            if i and config.chunk_interval:
+                time.sleep(config.chunk_interval)
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+            self.server.bytes_sent += len(chunk)
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class MockZerolanServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config: MockServerConfig | None = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        本地的 ZerolanCore 替身服务器，实现各模型的 predict、stream-predict 与 state 接口，
+        以及 Milvus 的 insert、search 与批量接口。响应由 ZerolanData 的模型序列化而来，
+        延迟、负载大小与分块方式均可配置，无需 GPU 即可测试管线的客户端开销。
+        :param config: 服务器配置。
+        :param host: 监听地址。
+        :param port: 监听端口，0 表示随机选择。
+        """
+        super().__init__((host, port), _Handler)
+        self.config = config or MockServerConfig()
+        self.requests = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self._thread: threading.Thread | None = None
+        self._cache: dict[tuple[str, str], str] = {}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockZerolanServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-zerolan-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _text(self) -> str:
+        return ("测试" * (self.config.payload_size // 2 + 1))[:self.config.payload_size]
+
+    def prediction(self, model_type: str, action: str, body: bytes) -> str | None:
+        """
+        :return: 序列化后的预测结果；不支持的模型返回 None。
+        """
+        if model_type == "milvus" and action == "insert":
+            # 插入的条数取决于请求，不能缓存
+            count = max(1, len(json.loads(body).get("texts", []))) if body else 1
+            return MilvusInsertResult(insert_count=count, ids=list(range(count))).model_dump_json()
+        key = (model_type, action)
+        if key not in self._cache:
+            prediction = self._make_prediction(model_type, action)
+            if prediction is None:
+                return None
+            self._cache[key] = prediction.model_dump_json()
+        return self._cache[key]
+
+    def _make_prediction(self, model_type: str, action: str) -> BaseModel | None:
+        text = self._text()
+        if model_type == "asr":
+            return ASRPrediction(transcript=text)
+        if model_type == "llm":
+            return LLMPrediction(response=text, history=[Conversation(role=RoleEnum.assistant, content=text)])
+        if model_type == "tts":
+            return TTSPrediction(wave_data=b"\x00" * self.config.payload_size, audio_type="wav")
+        if model_type == "img-cap":
+            return ImgCapPrediction(caption=text, lang="zh")
+        if model_type == "vid-cap":
+            return VidCapPrediction(caption=text, lang="zh")
+        if model_type == "vla/showui":
+            return ShowUiPrediction(actions=[Action(action="CLICK", value=text, position=[0.5, 0.5])])
+        if model_type == "ocr":
+            position = Position(lu=Vector2D(x=0, y=0), ru=Vector2D(x=1, y=0),
+                                rd=Vector2D(x=1, y=1), ld=Vector2D(x=0, y=1))
+            return OCRPrediction(region_results=[RegionResult(position=position, content=text, confidence=0.99)
+                                                 for _ in range(self.config.regions)])
+        if model_type == "milvus" and action == "search":
+            rows = [QueryRow(id=i, distance=1.0 - i / 10, entity={"text": text})
+                    for i in range(self.config.search_hits)]
+            return MilvusQueryResult(result=[rows])
+        return None
+
+    def stream_chunks(self, model_type: str):
+        """
+        LLM 以 JSON 文档逐块返回截至目前的完整回复，TTS 返回 WAV 音频字节。
+        """
+        count = max(1, self.config.chunk_count)
+        if model_type == "llm":
+            text = self._text()
+            step = max(1, len(text) // count)
+            for end in range(step, len(text) + step, step):
+                partial = text[:end]
+                yield LLMPrediction(response=partial,
+                                    history=[Conversation(role=RoleEnum.assistant, content=partial)]
+                                    ).model_dump_json().encode("utf-8")
+        else:
+            # 与流式合成的服务器一样，先返回 data 长度未知的 WAV 头（16 位单声道 32kHz），再返回 PCM
+            yield struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 0xFFFFFFFF, b"WAVE", b"fmt ", 16, 1, 1, 32000,
+                              64000, 2, 16, b"data", 0xFFFFFFFF)
+            size = max(2, self.config.payload_size // count // 2 * 2)
+            for _ in range(count):
+                yield b"\x00" * size
@@ -0,0 +1,374 @@
+import argparse
+import asyncio
+import inspect
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from loguru import logger
+from pydantic import BaseModel
+
+from zerolan.ump.common.capture import dumps, loads
+from zerolan.ump.common.stats import _pick
+
+
+class CapturedCall:
+    __slots__ = ("offset", "model_type", "method", "args", "kwargs", "duration", "result", "chunks", "error", "note")
+
+    def __init__(self, record: dict, t0: float):
+        """
+        记录文件中的一次调用。
+        :param record: TrafficRecorder 写入的一条记录。
+        :param t0: 记录中最早的开始时间。
+        """
+        self.offset = record["t"] - t0  # 相对于第一次调用的开始时间（秒）
+        self.model_type: str = record["p"]
+        self.method: str = record["f"]
+        self.args: list | None = record.get("a")
+        self.kwargs: dict = record.get("kw") or {}
+        self.duration: float = record["d"]
+        self.result = record.get("r")
+        self.chunks: list | None = record.get("c")
+        self.error: str | None = record.get("e")
+        self.note: str | None = record.get("x")
+
+    @property
+    def replayable(self) -> bool:
+        return self.args is not None
+
+
+def read_capture(path: str) -> list[CapturedCall]:
+    """
+    读取记录文件，按开始时间排序。写到一半的行会被忽略。
+    :param path: 记录文件的路径。
+    :return: CapturedCall 列表。
+    """
+    records = []
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                records.append(loads(line))
+            except ValueError:
+                continue
+    if not records:
+        return []
+    t0 = min(record["t"] for record in records)
+    return sorted((CapturedCall(record, t0) for record in records), key=lambda call: call.offset)
+
+
+class ReplayStub:
+
+    def __init__(self, calls: list[CapturedCall], latency_scale: float = 1.0):
+        """
+        进程内的替身，按记录的响应与耗时应答，不发出任何网络请求。
+        参数相同的调用按记录的顺序依次应答，找不到相同参数时使用同一方法的其他记录。
+        记录中出错的调用会以 RuntimeError 重现；被截断的记录只重现耗时，返回值与分块为 None。
+        :param calls: 记录的调用。
+        :param latency_scale: 应答耗时相对于记录耗时的倍数，0 表示立即应答。
+        """
+        self.latency_scale = latency_scale
+        self._exact: dict[tuple, deque[CapturedCall]] = defaultdict(deque)
+        self._any: dict[tuple, list[CapturedCall]] = defaultdict(list)
+        self._cursor: dict[tuple, int] = defaultdict(int)
+        for call in calls:
+            if call.replayable:
+                self._exact[self._key(call.model_type, call.method, call.args, call.kwargs)].append(call)
+                self._any[(call.model_type, call.method)].append(call)
+
+    @staticmethod
+    def _key(model_type: str, method: str, args, kwargs) -> tuple:
+        try:
+            return model_type, method, dumps({"a": list(args), "kw": kwargs})
+        except TypeError:
+            return model_type, method, None
+
+    def _lookup(self, model_type: str, method: str, args, kwargs) -> CapturedCall:
+        exact = self._exact.get(self._key(model_type, method, args, kwargs))
+        if exact:
+            return exact.popleft()
+        candidates = self._any.get((model_type, method))
+        if not candidates:
+            raise LookupError(f"记录中没有 {model_type}.{method} 的响应")
+        cursor = self._cursor[(model_type, method)]
+        self._cursor[(model_type, method)] = cursor + 1
+        return candidates[cursor % len(candidates)]
+
+    def pipeline(self, model_type: str) -> "_StubPipeline":
+        return _StubPipeline(self, model_type)
+
+
+def _raise_captured(call: CapturedCall):
+    if call.error is not None:
+        raise RuntimeError(call.error)
+
+
+class _StubPipeline:
+
+    def __init__(self, stub: ReplayStub, model_type: str):
+        self._stub = stub
+        self.model_type = model_type
+
+    def __getattr__(self, method: str):
+        if method.startswith("_"):
+            raise AttributeError(method)
+        stub, model_type = self._stub, self.model_type
+        scale = stub.latency_scale
+        streaming = "stream" in method
+
+        if method.startswith("a") and streaming:
+            async def astream(*args, **kwargs):
+                call = stub._lookup(model_type, method, args, kwargs)
+                start = time.perf_counter()
+                for offset, item in call.chunks or ():
+                    await asyncio.sleep(max(0.0, start + offset * scale - time.perf_counter()))
+                    yield item
+                await asyncio.sleep(max(0.0, start + call.duration * scale - time.perf_counter()))
+                _raise_captured(call)
+
+            return astream
+        if method.startswith("a"):
+            async def arun(*args, **kwargs):
+                call = stub._lookup(model_type, method, args, kwargs)
+                await asyncio.sleep(call.duration * scale)
+                _raise_captured(call)
+                return call.result
+
+            return arun
+        if streaming:
+            def stream(*args, **kwargs):
+                call = stub._lookup(model_type, method, args, kwargs)
+                start = time.perf_counter()
+                for offset, item in call.chunks or ():
+                    time.sleep(max(0.0, start + offset * scale - time.perf_counter()))
+                    yield item
+                time.sleep(max(0.0, start + call.duration * scale - time.perf_counter()))
+                _raise_captured(call)
+
+            return stream
+
+        if method.startswith("submit"):
+            def submit(*args, **kwargs):
+                call = stub._lookup(model_type, method, args, kwargs)
+                future = Future()
+
+                def finish():
+                    if call.error is not None:
+                        future.set_exception(RuntimeError(call.error))
+                    else:
+                        future.set_result(call.result)
+
+                timer = threading.Timer(call.duration * scale, finish)
+                timer.daemon = True
+                timer.start()
+                return future
+
+            return submit
+
+        def run(*args, **kwargs):
+            call = stub._lookup(model_type, method, args, kwargs)
+            time.sleep(call.duration * scale)
+            _raise_captured(call)
+            return call.result
+
+        return run
+
+
+class MethodReport(BaseModel):
+    name: str  # 形如 "tts.stream_predict"
+    calls: int
+    errors: int  # 重放时出错的调用数
+    capture_p50_ms: float | None
+    capture_p95_ms: float | None
+    capture_p99_ms: float | None
+    replay_p50_ms: float | None
+    replay_p95_ms: float | None
+    replay_p99_ms: float | None
+
+
+class ReplayReport(BaseModel):
+    calls: int  # 重放的调用数
+    skipped: int  # 无法重放的调用数，例如参数过大未被记录或没有对应的管线
+    errors: int
+    capture_seconds: float
+    replay_seconds: float
+    capture_rps: float
+    replay_rps: float
+    max_lag_ms: float  # 调用实际发出的时间相对于计划时间的最大延迟，过大说明客户端跟不上记录的负载
+    methods: list[MethodReport]
+
+
+def _consume(method: Callable, args: list, kwargs: dict):
+    result = method(*args, **kwargs)
+    if inspect.isgenerator(result):
+        for _ in result:
+            pass
+    elif isinstance(result, Future):
+        # submit 等方法的耗时以 Future 完成为准
+        result.result()
+
+
+def _ms(samples: list[float], p: float) -> float | None:
+    value = _pick(samples, p)
+    return value * 1000 if value is not None else None
+
+
+async def areplay(calls: list[CapturedCall], targets: dict[str, Any] | Callable[[str], Any],
+                  speed: float | None = 1.0, concurrency: int = 64) -> ReplayReport:
+    """
+    按记录的时间重新发出调用，并与记录中的耗时比较。
+    同步方法在线程池中执行，异步方法在当前事件循环中执行；同时进行的调用不超过 concurrency 个。
+    :param calls: read_capture 返回的调用。
+    :param targets: 模型类型到管线（或 ReplayStub.pipeline）的映射，或根据模型类型创建管线的函数。
+    :param speed: 相对于记录的速度倍数，例如 2 表示两倍速；None 或 0 表示不等待，尽快发出。
+    :param concurrency: 同时进行的调用数上限。
+    :return: ReplayReport 实例。
+    """
+    resolve = targets.get if isinstance(targets, dict) else targets
+    pipelines: dict[str, Any] = {}
+    planned = []
+    skipped = 0
+    for call in calls:
+        if call.model_type not in pipelines:
+            try:
+                pipelines[call.model_type] = resolve(call.model_type)
+            except Exception as e:
+                logger.warning(f"无法创建 {call.model_type} 管线，跳过其调用：{e}")
+                pipelines[call.model_type] = None
+        method = getattr(pipelines[call.model_type], call.method, None)
+        if not call.replayable or method is None:
+            skipped += 1
+            continue
+        planned.append((call, method))
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay")
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    lags = [0.0]
+    start = time.perf_counter()
+
+    async def one(call: CapturedCall, method: Callable):
+        name = f"{call.model_type}.{call.method}"
+        due = start + call.offset / speed if speed else start
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        async with semaphore:
+            begin = time.perf_counter()
+            lags.append(begin - due)
+            try:
+                if inspect.isasyncgenfunction(method):
+                    async for _ in method(*call.args, **call.kwargs):
+                        pass
+                elif inspect.iscoroutinefunction(method):
+                    await method(*call.args, **call.kwargs)
+                else:
+                    await loop.run_in_executor(executor, _consume, method, call.args, call.kwargs)
+            except Exception as e:
+                logger.debug(f"重放 {name} 出错：{e}")
+                errors[name] += 1
+                return
+            latencies[name].append(time.perf_counter() - begin)
+
+    try:
+        await asyncio.gather(*(one(call, method) for call, method in planned))
+    finally:
+        executor.shutdown(wait=False)
+    replay_seconds = time.perf_counter() - start
+
+    captured: dict[str, list[float]] = defaultdict(list)
+    for call, _ in planned:
+        if call.error is None:
+            captured[f"{call.model_type}.{call.method}"].append(call.duration)
+    capture_seconds = max((call.offset + call.duration for call, _ in planned), default=0.0)
+    methods = []
+    for name in sorted(captured.keys() | latencies.keys() | errors.keys()):
+        capture_samples, replay_samples = sorted(captured[name]), sorted(latencies[name])
+        methods.append(MethodReport(
+            name=name, calls=sum(1 for call, _ in planned if f"{call.model_type}.{call.method}" == name),
+            errors=errors[name],
+            capture_p50_ms=_ms(capture_samples, 50), capture_p95_ms=_ms(capture_samples, 95),
+            capture_p99_ms=_ms(capture_samples, 99),
+            replay_p50_ms=_ms(replay_samples, 50), replay_p95_ms=_ms(replay_samples, 95),
+            replay_p99_ms=_ms(replay_samples, 99)))
+    return ReplayReport(calls=len(planned), skipped=skipped, errors=sum(errors.values()),
+                        capture_seconds=capture_seconds, replay_seconds=replay_seconds,
+                        capture_rps=len(planned) / capture_seconds if capture_seconds else 0.0,
+                        replay_rps=len(planned) / replay_seconds if replay_seconds else 0.0,
+                        max_lag_ms=max(lags) * 1000, methods=methods)
+
+
+def replay(calls: list[CapturedCall], targets: dict[str, Any] | Callable[[str], Any],
+           speed: float | None = 1.0, concurrency: int = 64) -> ReplayReport:
+    """
+    areplay 的同步版本，在新的事件循环中运行。
+    """
+    return asyncio.run(areplay(calls, targets, speed, concurrency))
+
+
+def format_report(report: ReplayReport) -> str:
+    def fmt(value, width):
+        return f"{value:>{width}.2f}" if value is not None else f"{'-':>{width}}"
+
+    def delta(capture, replay):
+        return replay - capture if capture is not None and replay is not None else None
+
+    header = f"{'method':<24}{'calls':>6}{'err':>5}{'cap_p50':>9}{'rep_p50':>9}{'d_p50':>9}" \
+             f"{'cap_p99':>9}{'rep_p99':>9}{'d_p99':>9}"
+    lines = [header, "-" * len(header)]
+    for m in report.methods:
+        lines.append(f"{m.name:<24}{m.calls:>6}{m.errors:>5}{fmt(m.capture_p50_ms, 9)}{fmt(m.replay_p50_ms, 9)}"
+                     f"{fmt(delta(m.capture_p50_ms, m.replay_p50_ms), 9)}{fmt(m.capture_p99_ms, 9)}"
+                     f"{fmt(m.replay_p99_ms, 9)}{fmt(delta(m.capture_p99_ms, m.replay_p99_ms), 9)}")
+    lines.append("-" * len(header))
+    lines.append(f"calls {report.calls}, skipped {report.skipped}, errors {report.errors}, "
+                 f"max lag {report.max_lag_ms:.1f} ms")
+    lines.append(f"throughput: capture {report.capture_rps:.2f} rps over {report.capture_seconds:.2f} s, "
+                 f"replay {report.replay_rps:.2f} rps over {report.replay_seconds:.2f} s "
+                 f"({report.replay_rps - report.capture_rps:+.2f})")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="重放记录的流量，并与记录中的吞吐量和延迟比较")
+    parser.add_argument("path", help="TrafficRecorder 写入的记录文件")
+    parser.add_argument("--speed", type=float, default=1.0, help="相对于记录的速度倍数，0 表示尽快发出")
+    parser.add_argument("--target", default="stub",
+                        help="stub 为进程内替身，mock 为本地替身服务器，其他值视为 ZerolanCore 的地址")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="stub 的应答耗时相对于记录的倍数")
+    parser.add_argument("--latency", type=float, default=0.0, help="mock 服务器的处理耗时（秒）")
+    parser.add_argument("--concurrency", type=int, default=64, help="同时进行的调用数上限")
+    parser.add_argument("--json", dest="json_path", default=None, help="将报告写入该 JSON 文件")
+    args = parser.parse_args(argv)
+
+    calls = read_capture(args.path)
+    process = None
+    if args.target == "stub":
+        targets = ReplayStub(calls, args.latency_scale).pipeline
+    else:
+        from zerolan.ump.registry import create_pipeline
+
+        url = args.target
+        if url == "mock":
+            from zerolan.ump.bench.harness import start_mock_server_process
+            from zerolan.ump.bench.mock_server import MockServerConfig
+
+            process, url = start_mock_server_process(MockServerConfig(latency=args.latency))
+
+        def targets(model_type: str):
+            return create_pipeline(model_type, server_url=url)
+    try:
+        report = replay(calls, targets, args.speed or None, args.concurrency)
+    finally:
+        if process is not None:
+            process.terminate()
+
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            f.write(report.model_dump_json())
+
+
+if __name__ == "__main__":
+    main()
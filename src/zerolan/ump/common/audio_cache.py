@@ -0,0 +1,217 @@
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Generator, Iterable
+
+from pydantic import BaseModel
+from zerolan.data.pipeline.tts import TTSQuery, TTSStreamPrediction
+
+
+class TTSCacheConfig(BaseModel):
+    enable: bool = False
+    directory: str = os.path.join("~", ".cache", "zerolan-ump", "tts")
+    max_bytes: int = 512 * 1024 * 1024  # 缓存目录的总大小上限
+    chunk_size: int = 1024  # 命中时重放的每块字节数，与服务器流式返回的块大小一致
+    namespace: str = ""  # 更换 TTS 模型或音色时修改，使旧的缓存失效
+
+
+class TTSAudioCache:
+    _SUFFIX = ".audio"
+    _MAX_REFER_DIGESTS = 256  # 记住摘要的参考音频数，超过时淘汰最久未用的
+
+    def __init__(self, config: TTSCacheConfig):
+        """
+        以内容寻址的 TTS 音频磁盘缓存。
+        键由除 id 以外的所有请求字段（文本、语言、音频类型等）与参考音频的内容摘要计算，
+        文件以内存映射的方式读取，按最近使用时间淘汰以限制目录大小。
+        :param config: 缓存配置。
+        """
+        self.config = config
+        self.directory = os.path.expanduser(config.directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self._index: OrderedDict[str, int] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._refer_digests: OrderedDict[tuple[str, float, int], str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._scan()
+
+    def _scan(self):
+        # 以修改时间作为持久化的最近使用时间，重启后仍能按 LRU 淘汰
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(self._SUFFIX):
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, name[:-len(self._SUFFIX)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._bytes += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + self._SUFFIX)
+
+    def _refer_digest(self, path: str) -> str:
+        if not os.path.isfile(path):
+            # 参考音频在远程主机上，只能以路径区分
+            return path
+        stat = os.stat(path)
+        memo = (path, stat.st_mtime, stat.st_size)
+        with self._lock:
+            digest = self._refer_digests.get(memo)
+            if digest is not None:
+                self._refer_digests.move_to_end(memo)
+                return digest
+        # 在锁外读取文件，同时计算同一文件的摘要只是重复一次工作
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._refer_digests[memo] = digest
+            self._refer_digests.move_to_end(memo)
+            while len(self._refer_digests) > self._MAX_REFER_DIGESTS:
+                self._refer_digests.popitem(last=False)
+        return digest
+
+    def key(self, query: TTSQuery) -> str:
+        """
+        :param query: TTSQuery 实例。
+        :return: 缓存键。
+        """
+        fields = query.model_dump_json(exclude={"id", "refer_wav_path"})
+        h = hashlib.blake2b(digest_size=20)
+        for part in (self.config.namespace, fields, self._refer_digest(query.refer_wav_path)):
+            h.update(part.encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def get(self, key: str) -> mmap.mmap | bytes | None:
+        """
+        :param key: 缓存键。
+        :return: 内存映射的音频（空音频为 b""），未命中时返回 None。使用完毕后请关闭 mmap。
+        """
+        path = self._path(key)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                if self._index.pop(key, None) is not None:
+                    self._bytes = sum(self._index.values())
+            return None
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        with self._lock:
+            self.hits += 1
+            if key not in self._index:
+                # 可能由其他进程写入
+                self._bytes += size
+                self._index[key] = size
+            self._index.move_to_end(key)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, chunks: Iterable[bytes]):
+        """
+        写入一段音频。先写入临时文件再原子地替换，读取方不会看到写了一半的文件。
+        :param key: 缓存键。
+        :param chunks: 音频数据块。
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        with self._lock:
+            self._bytes += size - self._index.pop(key, 0)
+            self._index[key] = size
+            self._evict()
+
+    def _evict(self):
+        while self._bytes > self.config.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.unlink(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def replay(self, key: str, audio_type: str) -> Generator[TTSStreamPrediction, None, None] | None:
+        """
+        以与服务器相同的分块方式重放缓存的音频。
+        :param key: 缓存键。
+        :param audio_type: 音频类型。
+        :return: TTSStreamPrediction 的 Generator，未命中时返回 None。
+        """
+        data = self.get(key)
+        if data is None:
+            return None
+        return self._replay(data, audio_type)
+
+    def _replay(self, data: mmap.mmap | bytes, audio_type: str) -> Generator[TTSStreamPrediction, None, None]:
+        id = str(uuid.uuid4())
+        step = self.config.chunk_size
+        seq = 0
+        try:
+            for seq, offset in enumerate(range(0, len(data), step)):
+                yield TTSStreamPrediction(seq=seq, id=id, is_final=False, wave_data=data[offset:offset + step],
+                                          audio_type=audio_type)
+            yield TTSStreamPrediction(seq=seq + 1 if len(data) else 0, id=id, is_final=True, wave_data=b"",
+                                      audio_type=audio_type)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+    def read(self, key: str) -> bytes | None:
+        """
+        :return: 完整的音频，未命中时返回 None。
+        """
+        data = self.get(key)
+        if data is None or isinstance(data, bytes):
+            return data
+        with data:
+            return data[:]
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._index)
+            self._index.clear()
+            self._bytes = 0
+        for key in keys:
+            try:
+                os.unlink(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._index),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "updated_at": time.time(),
+            }
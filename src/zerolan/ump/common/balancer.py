@@ -0,0 +1,161 @@
+import random
+import threading
+import time
+from typing import Literal
+from urllib.parse import urljoin
+
+from loguru import logger
+from pydantic import BaseModel
+
+from zerolan.ump.common.session import HTTPSessionConfig, get_session
+
+
+class LoadBalancerConfig(BaseModel):
+    endpoints: list[str] = []  # 除 server_url 以外的服务器地址，为空时不启用负载均衡
+    strategy: Literal["least_outstanding", "latency"] = "least_outstanding"
+    probe_interval: float = 5.0  # 后台健康检查的间隔（秒）
+    failure_threshold: int = 3  # 连续失败多少次后熔断
+    base_backoff: float = 1.0  # 首次熔断的时长（秒），之后每次熔断翻倍
+    max_backoff: float = 60.0
+    max_failover: int = 2  # 幂等请求失败后最多切换到其他服务器的次数
+
+
+class NoAvailableEndpoint(Exception):
+    pass
+
+
+class Endpoint:
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.outstanding = 0
+        self.latency: float | None = None  # 指数加权移动平均（秒）
+        self.failures = 0
+        self.open_until = 0.0  # 熔断结束的时间，0 表示未熔断
+        self.backoff = 0.0
+        self.healthy = True
+
+    def url(self, path: str) -> str:
+        return urljoin(self.base_url, path)
+
+    def available(self, now: float) -> bool:
+        return self.healthy and self.open_until <= now
+
+
+class EndpointGroup:
+
+    def __init__(self, base_urls: list[str], state_path: str, config: LoadBalancerConfig,
+                 session_config: HTTPSessionConfig | None = None):
+        """
+        同一模型的多个服务器。
+        根据在途请求数或延迟选择服务器，连续失败的服务器会被熔断并指数退避，
+        后台线程定期访问 /{model_type}/state 探测服务器是否恢复。
+        :param base_urls: 服务器地址列表。
+        :param state_path: 健康检查的路径。
+        :param config: 负载均衡配置。
+        :param session_config: 各服务器共享会话的连接池配置。
+        """
+        self.config = config
+        self.session_config = session_config
+        self.state_path = state_path
+        self.endpoints = [Endpoint(url) for url in dict.fromkeys(base_urls)]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._prober = threading.Thread(target=self._probe_loop, name="endpoint-prober", daemon=True)
+        self._prober.start()
+
+    def session(self, endpoint: Endpoint):
+        return get_session(endpoint.base_url, self.session_config)
+
+    def choose(self, exclude: tuple[Endpoint, ...] = ()) -> Endpoint:
+        """
+        选择一个可用的服务器，并将其在途请求数加一。
+        所有服务器都被熔断时，选择最早恢复的那个（半开状态下的试探请求）。
+        :param exclude: 本次请求已经尝试过的服务器。
+        :return: 服务器。
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [e for e in self.endpoints if e not in exclude and e.available(now)]
+            if not candidates:
+                candidates = sorted((e for e in self.endpoints if e not in exclude), key=lambda e: e.open_until)[:1]
+            if not candidates:
+                raise NoAvailableEndpoint("没有可用的服务器")
+            if self.config.strategy == "latency":
+                # 未测得延迟的服务器优先，以便尽快获得其延迟
+                def score(e: Endpoint):
+                    return (e.latency or 0.0) * (e.outstanding + 1)
+            else:
+                def score(e: Endpoint):
+                    return e.outstanding, e.latency or 0.0
+            best = min(score(e) for e in candidates)
+            endpoint = random.choice([e for e in candidates if score(e) == best])
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, latency: float | None, ok: bool):
+        """
+        结束一次请求。
+        :param endpoint: choose 返回的服务器。
+        :param latency: 请求耗时（秒），失败时为 None。
+        :param ok: 服务器是否正常响应。
+        """
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok:
+                self._record_success(endpoint, latency)
+            else:
+                self._record_failure(endpoint)
+
+    def _record_success(self, endpoint: Endpoint, latency: float | None):
+        if latency is not None:
+            endpoint.latency = latency if endpoint.latency is None else 0.8 * endpoint.latency + 0.2 * latency
+        endpoint.failures = 0
+        endpoint.open_until = 0.0
+        endpoint.backoff = 0.0
+        endpoint.healthy = True
+
+    def _record_failure(self, endpoint: Endpoint):
+        endpoint.failures += 1
+        if endpoint.failures >= self.config.failure_threshold:
+            endpoint.backoff = min(self.config.max_backoff,
+                                   endpoint.backoff * 2 if endpoint.backoff else self.config.base_backoff)
+            endpoint.open_until = time.monotonic() + endpoint.backoff
+            logger.warning(f"服务器 {endpoint.base_url} 连续失败 {endpoint.failures} 次，熔断 {endpoint.backoff:.1f} 秒")
+
+    def _probe_loop(self):
+        while not self._stop.wait(self.config.probe_interval):
+            for endpoint in self.endpoints:
+                start = time.perf_counter()
+                try:
+                    response = self.session(endpoint).get(endpoint.url(self.state_path))
+                    ok = response.status_code < 500
+                except Exception:
+                    ok = False
+                with self._lock:
+                    endpoint.healthy = ok
+                    if ok:
+                        self._record_success(endpoint, None)
+                    else:
+                        self._record_failure(endpoint)
+                if not ok:
+                    logger.debug(f"健康检查失败：{endpoint.base_url}，耗时 {time.perf_counter() - start:.3f} 秒")
+
+    def close(self):
+        """
+        停止健康检查线程，正在进行的一轮检查结束后线程退出。
+        """
+        self._stop.set()
+        if self._prober is not threading.current_thread():
+            self._prober.join(timeout=self.config.probe_interval)
+
+    def stats(self) -> list[dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "url": e.base_url,
+                "outstanding": e.outstanding,
+                "latency": e.latency,
+                "failures": e.failures,
+                "available": e.available(now),
+            } for e in self.endpoints]
@@ -0,0 +1,145 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Hashable
+
+from loguru import logger
+from pydantic import BaseModel
+
+from zerolan.ump.common.stats import Histogram
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class BatchingConfig(BaseModel):
+    max_batch_size: int = 16
+    max_wait: float = 0.005  # 第一个请求到达后最多等待多少秒以凑成一批
+    max_workers: int = 4  # 同时发出的批量请求（或回退后的单个请求）数
+
+
+class BatchUnsupported(Exception):
+    """
+    服务器没有批量接口时由 batch_fn 抛出，调度器随后改为并行发送单个请求。
+    """
+    pass
+
+
+class MicroBatcher:
+
+    def __init__(self, single_fn: Callable[[Any], Any],
+                 batch_fn: Callable[[list], list] | None = None,
+                 config: BatchingConfig | None = None,
+                 key_fn: Callable[[Any], Hashable] | None = None,
+                 name: str = "batcher"):
+        """
+        客户端的微批处理调度器。
+        调用方逐个提交请求并得到 Future，调度器把时间窗口内（或达到数量上限时）的请求合并为一次批量请求。
+        请求在提交时所在的上下文中发送（例如 use_priority 指定的优先级），批量请求使用其中第一个请求的上下文。
+        :param single_fn: 发送单个请求的函数。
+        :param batch_fn: 发送批量请求的函数，返回与输入一一对应的结果列表；为 None 时总是并行发送单个请求。
+        :param config: 批处理配置。
+        :param key_fn: 只有键相同的请求才会被合并到同一批，键为 None 的请求总是单独发送。
+        :param name: 线程名前缀。
+        """
+        self.single_fn = single_fn
+        self.batch_fn = batch_fn
+        self.config = config or BatchingConfig()
+        self.key_fn = key_fn or (lambda item: ())
+        self.batch_size = Histogram(buckets=BATCH_SIZE_BUCKETS)
+        self.queue_delay = Histogram()
+        self._pending: list[tuple[Any, Future, float, contextvars.Context]] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=self.config.max_workers, thread_name_prefix=name)
+        self._dispatcher = threading.Thread(target=self._run, name=f"{name}-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, item: Any) -> Future:
+        """
+        提交一个请求。
+        :param item: 请求实例。
+        :return: 结果的 Future。
+        """
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("批处理调度器已关闭")
+            self._pending.append((item, future, time.perf_counter(), contextvars.copy_context()))
+            self._cond.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+                deadline = time.perf_counter() + self.config.max_wait
+                while len(self._pending) < self.config.max_batch_size and not self._closed:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                pending = self._pending[:self.config.max_batch_size]
+                self._pending = self._pending[self.config.max_batch_size:]
+
+            now = time.perf_counter()
+            groups: dict[Hashable, list] = {}
+            for item, future, submitted_at, context in pending:
+                self.queue_delay.observe(now - submitted_at)
+                groups.setdefault(self.key_fn(item), []).append((item, future, context))
+            for key, group in groups.items():
+                if key is None:
+                    for entry in group:
+                        self.batch_size.observe(1)
+                        self._executor.submit(self._dispatch_single, *entry)
+                    continue
+                self.batch_size.observe(len(group))
+                self._executor.submit(self._dispatch, group)
+
+    def _dispatch(self, group: list[tuple[Any, Future, contextvars.Context]]):
+        if self.batch_fn is not None and len(group) > 1:
+            try:
+                results = group[0][2].run(self.batch_fn, [item for item, _, _ in group])
+                if len(results) != len(group):
+                    raise ValueError(f"批量请求返回了 {len(results)} 个结果，但提交了 {len(group)} 个请求")
+                for (_, future, _), result in zip(group, results):
+                    future.set_result(result)
+                return
+            except BatchUnsupported:
+                logger.info("服务器不支持批量请求，回退为并行的单个请求")
+                self.batch_fn = None
+            except Exception as e:
+                for _, future, _ in group:
+                    future.set_exception(e)
+                return
+        for entry in group:
+            try:
+                self._executor.submit(self._dispatch_single, *entry)
+            except RuntimeError:
+                # 调度器正在关闭，直接在当前线程发送
+                self._dispatch_single(*entry)
+
+    def _dispatch_single(self, item: Any, future: Future, context: contextvars.Context):
+        try:
+            future.set_result(context.run(self.single_fn, item))
+        except Exception as e:
+            future.set_exception(e)
+
+    def close(self):
+        """
+        停止接收新的请求，已提交的请求仍会被发送。
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        """
+        :return: 批大小与排队延迟（秒）的直方图摘要。
+        """
+        return {"batch_size": self.batch_size.snapshot(), "queue_delay": self.queue_delay.snapshot()}
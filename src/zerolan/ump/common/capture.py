@@ -0,0 +1,341 @@
+import asyncio
+import base64
+import contextvars
+import inspect
+import json
+import os
+import random
+import threading
+import time
+from collections.abc import Sequence
+from concurrent.futures import Future
+from functools import wraps
+
+from loguru import logger
+from pydantic import BaseModel
+
+from zerolan.ump.common.metrics import INSTRUMENTED_METHODS
+
+# 会被记录的公开方法：除了推理方法，还有批量插入、微批提交、分段描述与播放等后台或组合路径
+CAPTURED_METHODS = INSTRUMENTED_METHODS + ("predict_regions", "apredict_regions", "submit", "submit_insert",
+                                           "submit_search", "bulk_insert", "abulk_insert", "stream_segments",
+                                           "astream_segments", "stream_playback", "astream_playback")
+# 正在被记录的调用中发出的调用（例如 submit 中的 predict、stream_playback 中的 stream_predict）不再单独记录，
+# 否则重放时会发出重复的请求
+_recording: contextvars.ContextVar[bool] = contextvars.ContextVar("zerolan_ump_recording", default=False)
+
+
+class CaptureConfig(BaseModel):
+    path: str = "~/.cache/zerolan-ump/capture.jsonl"  # 追加写入的记录文件
+    sample_rate: float = 1.0  # 被记录的调用的比例
+    max_bytes: int = 256 * 1024 * 1024  # 文件达到该大小后停止记录
+    max_record_bytes: int = 1024 * 1024  # 单条记录的上限，超过时只保留请求与耗时，不保留响应内容
+    flush_interval: float = 1.0  # 写入磁盘的间隔（秒）
+
+
+def _class_name(cls: type) -> str:
+    return f"{cls.__module__}:{cls.__qualname__}"
+
+
+def _default(value):
+    if isinstance(value, BaseModel):
+        return {"$m": _class_name(type(value)), "v": value.model_dump()}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"$b": base64.b64encode(value).decode("ascii")}
+    cls = type(value)
+    if cls.__module__.startswith("zerolan.") and "__slots__" in vars(cls):
+        # 例如 PlaybackFrame：构造参数与 __slots__ 同名的轻量对象
+        return {"$o": _class_name(cls), "v": {name: getattr(value, name) for name in cls.__slots__}}
+    if isinstance(value, Sequence) and not isinstance(value, str):
+        # 例如 LazyList
+        return list(value)
+    raise TypeError(f"无法记录的类型：{cls.__name__}")
+
+
+def _load_class(name: str, base: type | None) -> type:
+    # 记录文件可能来自他处，只还原本库与 zerolan-data 中的类，不导入任意模块
+    if not name.startswith("zerolan."):
+        raise ValueError(f"记录中的类不属于 zerolan：{name}")
+    from zerolan.ump.registry import _import
+
+    cls = _import(name)
+    if not isinstance(cls, type) or (base is not None and not issubclass(cls, base)) \
+            or (base is None and "__slots__" not in vars(cls)):
+        raise ValueError(f"记录中的类无法还原：{name}")
+    return cls
+
+
+def _object_hook(obj: dict):
+    if "$b" in obj and len(obj) == 1:
+        return base64.b64decode(obj["$b"])
+    if "$m" in obj and len(obj) == 2:
+        return _load_class(obj["$m"], BaseModel).model_validate(obj["v"])
+    if "$o" in obj and len(obj) == 2:
+        return _load_class(obj["$o"], None)(**obj["v"])
+    return obj
+
+
+def dumps(record: dict) -> str:
+    """
+    将一条记录编码为一行 JSON。pydantic 实例与 zerolan 中的轻量对象会连同类名一起保存，bytes 以 Base64 保存。
+    """
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=_default)
+
+
+def loads(line: str | bytes) -> dict:
+    """
+    dumps 的逆操作，pydantic 实例与 bytes 会被还原。
+    :raise ValueError: 记录中的类不属于 zerolan 或无法还原。
+    """
+    return json.loads(line, object_hook=_object_hook)
+
+
+class TrafficRecorder:
+
+    def __init__(self, config: CaptureConfig):
+        """
+        流量记录器。
+        按 sample_rate 抽样记录管线的公开方法的请求、响应、流式分块及其时间，每次调用一行 JSON，只追加写入。
+        记录包含：t 开始时间（Unix 时间戳），p 模型类型，f 方法名，a/kw 参数，d 耗时，
+        r 返回值，c 流式分块 [[相对开始的秒数, 分块], ...]，e 异常，x 记录被截断的原因。
+        文件达到 max_bytes 后不再记录，已有的内容不会被改写。
+        :param config: 记录配置。
+        """
+        self.config = config
+        self.path = os.path.expanduser(config.path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "ab")
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.bytes = self._file.tell()
+        self.records = 0
+        self.truncated = 0
+        self.full = self.bytes >= config.max_bytes
+
+    def sampled(self) -> bool:
+        return not self.full and (self.config.sample_rate >= 1 or random.random() < self.config.sample_rate)
+
+    def _encode(self, record: dict) -> bytes:
+        try:
+            line = dumps(record).encode("utf-8")
+        except TypeError:
+            # 例如 NumPy 数组，无法重放，只保留耗时
+            record = {k: v for k, v in record.items() if k not in ("a", "kw", "r", "c")}
+            record["x"] = "unrecordable"
+            return dumps(record).encode("utf-8")
+        if len(line) <= self.config.max_record_bytes:
+            return line
+        self.truncated += 1
+        if "c" in record:
+            record["c"] = [[offset, None] for offset, _ in record["c"]]
+        record.pop("r", None)
+        record["x"] = "truncated"
+        line = dumps(record).encode("utf-8")
+        if len(line) <= self.config.max_record_bytes:
+            return line
+        record = {k: v for k, v in record.items() if k not in ("a", "kw", "c")}
+        record["x"] = "too_large"
+        return dumps(record).encode("utf-8")
+
+    def write(self, record: dict):
+        line = self._encode(record) + b"\n"
+        with self._lock:
+            if self.full:
+                return
+            if self.bytes + len(line) > self.config.max_bytes:
+                self.full = True
+                logger.warning(f"流量记录文件已达到 {self.config.max_bytes} 字节，停止记录：{self.path}")
+                return
+            self._file.write(line)
+            self.bytes += len(line)
+            self.records += 1
+            now = time.monotonic()
+            if now - self._last_flush >= self.config.flush_interval:
+                self._file.flush()
+                self._last_flush = now
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self.full = True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"path": self.path, "records": self.records, "truncated": self.truncated, "bytes": self.bytes,
+                    "full": self.full}
+
+
+_recorder: TrafficRecorder | None = None
+
+
+def set_recorder(recorder: TrafficRecorder | None):
+    """
+    设置全局的流量记录器，此后创建的管线都会被记录；设为 None 则关闭。
+    已创建的管线可以使用 capture 单独开启。
+    :param recorder: TrafficRecorder 实例。
+    """
+    global _recorder
+    _recorder = recorder
+
+
+def get_recorder() -> TrafficRecorder | None:
+    return _recorder
+
+
+def capture(pipeline, recorder: TrafficRecorder):
+    """
+    为管线实例开启流量记录，记录 CAPTURED_METHODS 中的公开方法。
+    返回 Future 的方法（例如 submit）在 Future 完成时才写入记录，耗时包括排队的时间。
+    未被抽中的调用只多一次随机数判断。
+    :param pipeline: 管线实例。
+    :param recorder: 流量记录器。
+    """
+    model_type = pipeline.model_type
+    for name in CAPTURED_METHODS:
+        method = getattr(type(pipeline), name, None)
+        if method is not None and not getattr(method, "__isabstractmethod__", False):
+            setattr(pipeline, name, _captured_method(getattr(pipeline, name), recorder, model_type, name))
+
+
+def _snapshot(value):
+    return value.model_copy(deep=True) if isinstance(value, BaseModel) else value
+
+
+class _Record:
+    __slots__ = ("recorder", "data", "start", "chunks")
+
+    def __init__(self, recorder: TrafficRecorder, model_type: str, name: str, args: tuple, kwargs: dict):
+        self.recorder = recorder
+        # 管线可能会修改传入的请求，例如清空 audio_data，因此先复制一份
+        self.data = {"t": time.time(), "p": model_type, "f": name, "a": [_snapshot(arg) for arg in args]}
+        if kwargs:
+            self.data["kw"] = {key: _snapshot(value) for key, value in kwargs.items()}
+        self.start = time.perf_counter()
+        self.chunks = None
+
+    def chunk(self, item):
+        if self.chunks is None:
+            self.chunks = []
+        self.chunks.append([time.perf_counter() - self.start, item])
+
+    def end(self, result=None, error: BaseException | None = None):
+        self.data["d"] = time.perf_counter() - self.start
+        if isinstance(error, GeneratorExit):
+            # 调用方提前结束了流，这不是错误
+            self.data["x"] = "closed"
+            error = None
+        if self.chunks is not None:
+            self.data["c"] = self.chunks
+        elif error is None:
+            self.data["r"] = result
+        if error is not None:
+            self.data["e"] = f"{type(error).__name__}: {error}"
+        try:
+            self.recorder.write(self.data)
+        except Exception as e:
+            logger.warning(f"写入流量记录失败：{e}")
+
+    async def aend(self, result=None, error: BaseException | None = None):
+        # 编码与写入文件可能需要数毫秒，不在事件循环中进行
+        await asyncio.to_thread(self.end, result, error)
+
+
+def _outcome(future: Future) -> tuple:
+    if future.cancelled():
+        return None, RuntimeError("cancelled")
+    error = future.exception()
+    return (None, error) if error is not None else (future.result(), None)
+
+
+def _captured_method(func, recorder: TrafficRecorder, model_type: str, name: str):
+    def track_gen(record: _Record, gen):
+        try:
+            while True:
+                token = _recording.set(True)
+                try:
+                    item = next(gen)
+                except StopIteration:
+                    break
+                finally:
+                    _recording.reset(token)
+                record.chunk(item)
+                yield item
+        except BaseException as e:
+            gen.close()
+            record.end(error=e)
+            raise
+        record.end()
+
+    if inspect.isasyncgenfunction(func):
+        @wraps(func)
+        async def async_gen_wrapper(*args, **kwargs):
+            if _recording.get() or not recorder.sampled():
+                async for item in func(*args, **kwargs):
+                    yield item
+                return
+            record = _Record(recorder, model_type, name, args, kwargs)
+            gen = func(*args, **kwargs)
+            try:
+                while True:
+                    token = _recording.set(True)
+                    try:
+                        item = await gen.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        _recording.reset(token)
+                    record.chunk(item)
+                    yield item
+            except BaseException as e:
+                await gen.aclose()
+                await record.aend(error=e)
+                raise
+            await record.aend()
+
+        return async_gen_wrapper
+
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if _recording.get() or not recorder.sampled():
+                return await func(*args, **kwargs)
+            record = _Record(recorder, model_type, name, args, kwargs)
+            token = _recording.set(True)
+            try:
+                result = await func(*args, **kwargs)
+            except BaseException as e:
+                await record.aend(error=e)
+                raise
+            finally:
+                _recording.reset(token)
+            await record.aend(result)
+            return result
+
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _recording.get() or not recorder.sampled():
+            return func(*args, **kwargs)
+        record = _Record(recorder, model_type, name, args, kwargs)
+        token = _recording.set(True)
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            record.end(error=e)
+            raise
+        finally:
+            _recording.reset(token)
+        if inspect.isgenerator(result):
+            return track_gen(record, result)
+        if isinstance(result, Future):
+            result.add_done_callback(lambda future: record.end(*_outcome(future)))
+            return result
+        record.end(result)
+        return result
+
+    return wrapper
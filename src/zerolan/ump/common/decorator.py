@@ -1,9 +1,11 @@
+import inspect
 import json
+import sys
 from functools import wraps
 
 from loguru import logger
 from pydantic import ValidationError
-from requests import HTTPError
+from requests import ConnectionError as RequestsConnectionError
 
 from zerolan.ump.common.utils.web_util import is_html_string
 
@@ -37,31 +39,80 @@ html_content_err_msg = """
 """
 
 
+def _is_connection_error(e: Exception) -> bool:
+    if isinstance(e, (ConnectionError, RequestsConnectionError)):
+        return True
+    # 只有在异步客户端已被加载时才可能出现 httpx 的异常
+    httpx = sys.modules.get("httpx")
+    return httpx is not None and isinstance(e, httpx.TransportError)
+
+
+def _log_resolution(e: Exception):
+    if isinstance(e, json.decoder.JSONDecodeError):
+        logger.error(json_decode_err_msg)
+    elif isinstance(e, ValidationError):
+        if is_html_string(e.json()):
+            logger.error(html_content_err_msg)
+    elif _is_connection_error(e):
+        logger.error(conn_err_msg)
+    else:
+        # requests.HTTPError 与 httpx.HTTPStatusError 都携带 response
+        status_code = getattr(getattr(e, "response", None), "status_code", None)
+        if status_code == 404:
+            logger.error(http_err_404_msg)
+        if status_code == 500:
+            logger.error(http_err_500_msg)
+
+
 def pipeline_resolve():
     """
     为用户提供可能的报错解决方案的装饰器，只读取异常而不会拦截。
+    同时支持普通函数、生成器、协程与异步生成器。
     :return:
     """
 
     def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @wraps(func)
+            async def async_gen_wrapper(*args, **kwargs):
+                try:
+                    async for item in func(*args, **kwargs):
+                        yield item
+                except Exception as e:
+                    _log_resolution(e)
+                    raise e
+
+            return async_gen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    _log_resolution(e)
+                    raise e
+
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @wraps(func)
+            def gen_wrapper(*args, **kwargs):
+                try:
+                    return (yield from func(*args, **kwargs))
+                except Exception as e:
+                    _log_resolution(e)
+                    raise e
+
+            return gen_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             try:
                 ret = func(*args, **kwargs)
                 return ret
             except Exception as e:
-                if isinstance(e, json.decoder.JSONDecodeError):
-                    logger.error(json_decode_err_msg)
-                elif isinstance(e, ValidationError):
-                    if is_html_string(e.json()):
-                        logger.error(html_content_err_msg)
-                elif isinstance(e, ConnectionError):
-                    logger.error(conn_err_msg)
-                elif isinstance(e, HTTPError):
-                    if e.response.status_code == 404:
-                        logger.error(http_err_500_msg)
-                    if e.response.status_code == 500:
-                        logger.error(http_err_500_msg)
+                _log_resolution(e)
                 raise e
 
         return wrapper
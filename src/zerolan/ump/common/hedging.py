@@ -0,0 +1,207 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Awaitable, Callable, TypeVar
+
+from pydantic import BaseModel
+
+from zerolan.ump.common.stats import Histogram
+
+R = TypeVar("R")
+
+
+class HedgingConfig(BaseModel):
+    enable: bool = False  # 只对幂等且请求体可以重发的请求生效
+    percentile: float = 95  # 等待超过最近响应耗时的该分位数仍未返回时发出对冲请求
+    min_delay: float = 0.01  # 对冲延迟的下限（秒）
+    max_delay: float = 5.0  # 对冲延迟的上限（秒）
+    min_samples: int = 20  # 测得这么多次响应耗时之前不对冲
+    window: int = 512  # 用于计算分位数的最近响应数
+    max_rate: float = 0.05  # 对冲请求占全部请求的比例上限
+    burst: float = 5  # 可以连续发出的对冲请求数
+    # 同步调用中同时在线程池里进行的请求数（含对冲请求）上限；线程池已满时请求直接在调用方线程中发送，不再对冲
+    max_workers: int = 32
+
+
+class Hedger:
+
+    def __init__(self, config: HedgingConfig, on_hedge: Callable[[str], None] | None = None):
+        """
+        对冲请求。
+        请求在最近响应耗时的 percentile 分位数之内仍未返回时，再发出一个相同的请求，先正常返回的那个胜出，另一个被取消。
+        对冲请求的比例由令牌桶限制：每个请求积累 max_rate 个令牌，每次对冲消耗一个，最多积累 burst 个。
+        同步请求无法中断，落败的请求会在返回后被关闭；异步请求会被直接取消。
+        同步请求需要在该对冲器自己的线程池中发送才能等待超时，线程池没有空闲的线程时不会排队，而是在调用方线程中发送且不对冲。
+        :param config: 对冲配置。
+        :param on_hedge: 每次对冲结束或因比例上限被跳过时调用，参数为 "won"、"lost" 或 "skipped"。
+        """
+        self.config = config
+        self.on_hedge = on_hedge
+        self._latency = Histogram(window=config.window)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(config.max_workers)
+        self._executor: ThreadPoolExecutor | None = None
+        self._budget = 0.0
+        self.requests = 0
+        self.hedged = 0
+        self.won = 0
+        self.skipped = 0
+
+    def delay(self) -> float | None:
+        """
+        :return: 当前的对冲延迟（秒）；样本不足时为 None，表示不对冲。
+        """
+        if self._latency.count < self.config.min_samples:
+            return None
+        delay = self._latency.percentile(self.config.percentile)
+        return min(self.config.max_delay, max(self.config.min_delay, delay))
+
+    def _admit(self) -> float | None:
+        with self._lock:
+            self.requests += 1
+            self._budget = min(self.config.burst, self._budget + self.config.max_rate)
+        return self.delay()
+
+    def _take(self, slot: bool = False) -> bool:
+        """
+        :param slot: 是否还需要线程池中的一个空闲线程。
+        """
+        if slot and not self._slots.acquire(blocking=False):
+            taken = False
+        else:
+            with self._lock:
+                taken = self._budget >= 1
+                if taken:
+                    self._budget -= 1
+            if slot and not taken:
+                self._slots.release()
+        with self._lock:
+            if taken:
+                self.hedged += 1
+            else:
+                self.skipped += 1
+        if not taken and self.on_hedge is not None:
+            self.on_hedge("skipped")
+        return taken
+
+    def _finish(self, won: bool):
+        if won:
+            with self._lock:
+                self.won += 1
+        if self.on_hedge is not None:
+            self.on_hedge("won" if won else "lost")
+
+    def _observe(self, start: float):
+        # 只统计首个请求的耗时，对冲本身不会使分布变短
+        self._latency.observe(time.perf_counter() - start)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.config.max_workers,
+                                                        thread_name_prefix="hedge")
+        return self._executor
+
+    def _submit(self, fn: Callable[[], R], start: float | None) -> Future:
+        # 调用前已占用一个空闲线程，因此任务不会在线程池中排队
+        def run():
+            try:
+                return fn()
+            finally:
+                self._slots.release()
+                if start is not None:
+                    self._observe(start)
+
+        return self._get_executor().submit(contextvars.copy_context().run, run)
+
+    def call(self, fn: Callable[[], R], ok: Callable[[R], bool],
+             discard: Callable[[R], None] = lambda result: None) -> R:
+        """
+        :param fn: 发送一次请求，每次调用都会发送一个新的请求。
+        :param ok: 判断结果能否胜出，例如服务器没有返回 5xx。
+        :param discard: 释放落败的结果，例如关闭响应。
+        :return: 胜出的结果；都不能胜出时返回首个请求的结果或抛出其异常。
+        """
+        start = time.perf_counter()
+        delay = self._admit()
+        if delay is None or not self._slots.acquire(blocking=False):
+            try:
+                return fn()
+            finally:
+                self._observe(start)
+        primary = self._submit(fn, start)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeoutError:
+            pass
+        if not self._take(slot=True):
+            return primary.result()
+        hedge = self._submit(fn, None)
+        winner = self._first_ok([primary, hedge], ok)
+        self._finish(winner is hedge)
+        chosen = winner or primary
+        for future in (primary, hedge):
+            if future is not chosen:
+                future.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+        return chosen.result()
+
+    @staticmethod
+    def _first_ok(futures: list[Future], ok: Callable) -> Future | None:
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in futures:
+                if future in done and future.exception() is None and ok(future.result()):
+                    return future
+        return None
+
+    async def acall(self, fn: Callable[[], Awaitable[R]], ok: Callable[[R], bool]) -> R:
+        """
+        call 的异步版本，落败的请求会被取消。
+        """
+        start = time.perf_counter()
+        delay = self._admit()
+        if delay is None:
+            try:
+                return await fn()
+            finally:
+                self._observe(start)
+        primary = asyncio.ensure_future(fn())
+        primary.add_done_callback(lambda task: self._observe(start))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self._take():
+                return await primary
+            hedge = asyncio.ensure_future(fn())
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in (primary, hedge):
+                    if task in done and not task.cancelled() and task.exception() is None and ok(task.result()):
+                        self._finish(task is hedge)
+                        return task.result()
+            self._finish(False)
+            return primary.result()
+        finally:
+            primary.cancel()
+            if hedge is not None:
+                hedge.cancel()
+
+    def close(self):
+        """
+        关闭同步对冲使用的线程池，进行中的请求仍会完成。
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "hedged": self.hedged, "won": self.won, "skipped": self.skipped,
+                    "rate": self.hedged / self.requests if self.requests else 0.0, "delay": self.delay()}
@@ -0,0 +1,127 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from pydantic import BaseModel
+from zerolan.data.pipeline.abs_data import AbsractImageModelQuery, AbstractModelPrediction
+
+from zerolan.ump.common.utils.img_util import ImageLike, dhash
+
+
+class ImageCacheConfig(BaseModel):
+    enable: bool = False
+    max_distance: int = 4  # 64 位 dHash 的汉明距离不超过该值时视为同一画面
+    ttl: float = 5.0  # 结果的有效期（秒）
+    max_entries: int = 256
+    max_bytes: int = 16 * 1024 * 1024  # 缓存结果占用内存的上限（按 JSON 大小估算）
+
+
+class _Entry:
+    __slots__ = ("phash", "prediction", "expires_at", "size")
+
+    def __init__(self, phash: int, prediction: AbstractModelPrediction, expires_at: float, size: int):
+        self.phash = phash
+        self.prediction = prediction
+        self.expires_at = expires_at
+        self.size = size
+
+
+class PerceptualCache:
+
+    def __init__(self, config: ImageCacheConfig):
+        """
+        以感知哈希为键的图片模型结果缓存。
+        除图片外的其他请求字段必须完全一致，图片只需足够相似即可命中。
+        使用 LRU 与 TTL 淘汰，并限制总内存占用。
+        :param config: 缓存配置。
+        """
+        self.config = config
+        self._entries: OrderedDict[tuple[str, int], _Entry] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, query: AbsractImageModelQuery, image: ImageLike) -> tuple[str, int]:
+        """
+        计算缓存键。
+        :param query: 图片模型的请求实例。
+        :param image: 内存中的图片。
+        :return: (其他请求字段的摘要, 图片的感知哈希)。
+        """
+        fields = query.model_dump_json(exclude={"id", "img_path"})
+        digest = hashlib.blake2b(f"{type(query).__name__}:{fields}".encode(), digest_size=16).hexdigest()
+        return digest, dhash(image)
+
+    def get(self, key: tuple[str, int]) -> AbstractModelPrediction | None:
+        """
+        查找与该键足够相似的缓存结果。
+        :param key: key() 返回的缓存键。
+        :return: 命中时返回结果的副本，否则返回 None。
+        """
+        digest, phash = key
+        now = time.monotonic()
+        with self._lock:
+            best, best_distance = None, self.config.max_distance + 1
+            for entry_key, entry in list(self._entries.items()):
+                if entry.expires_at <= now:
+                    self._remove(entry_key)
+                    continue
+                if entry_key[0] != digest:
+                    continue
+                distance = (entry.phash ^ phash).bit_count()
+                if distance < best_distance:
+                    best, best_distance = entry_key, distance
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best].prediction.model_copy(deep=True)
+
+    def put(self, key: tuple[str, int], prediction: AbstractModelPrediction):
+        """
+        写入缓存，必要时淘汰最久未使用的结果。
+        :param key: key() 返回的缓存键。
+        :param prediction: 模型的响应实例。
+        """
+        size = len(prediction.model_dump_json())
+        if size > self.config.max_bytes:
+            return
+        # 调用方仍持有 prediction，保存副本以免其后的修改影响缓存
+        prediction = prediction.model_copy(deep=True)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(key[1], prediction, time.monotonic() + self.config.ttl, size)
+            self._bytes += size
+            while len(self._entries) > self.config.max_entries or self._bytes > self.config.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: tuple[str, int]):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        缓存的命中统计。
+        :return: 包含 hits、misses、hit_rate、evictions、entries 与 bytes 的字典。
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
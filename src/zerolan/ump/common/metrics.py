@@ -0,0 +1,307 @@
+import inspect
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import wraps
+
+from zerolan.ump.common.stats import Histogram
+
+Labels = tuple[tuple[str, str], ...]
+
+# 会被计时的公开方法
+INSTRUMENTED_METHODS = ("predict", "stream_predict", "apredict", "astream_predict",
+                        "insert", "search", "ainsert", "asearch")
+# 会被计时的解析阶段
+INSTRUMENTED_PHASES = ("parse_query", "parse_prediction")
+
+_SERVER_TIMING_DUR = re.compile(r"dur=([0-9.]+)")
+
+
+class MetricsSink(ABC):
+    """
+    指标的接收者。实现这三个方法即可把管线的指标接入任意监控系统。
+    labels 是由 (键, 值) 组成的元组，可以直接作为字典的键。
+    """
+
+    @abstractmethod
+    def observe(self, name: str, value: float, labels: Labels):
+        """
+        记录一个耗时或大小的样本。
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def inc(self, name: str, value: float, labels: Labels):
+        """
+        增加一个计数器。
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def gauge(self, name: str, delta: float, labels: Labels):
+        """
+        增减一个仪表值，例如在途请求数。
+        """
+        raise NotImplementedError()
+
+
+class InProcessMetrics(MetricsSink):
+
+    def __init__(self, window: int = 2048):
+        """
+        进程内的指标存储，样本保存在直方图中。
+        可以通过 snapshot 取得 p50/p95/p99，或通过 to_prometheus 导出 Prometheus 文本格式。
+        :param window: 每个直方图用于计算分位数的最近样本数。
+        """
+        self.window = window
+        self._histograms: dict[tuple[str, Labels], Histogram] = {}
+        self._counters: dict[tuple[str, Labels], float] = {}
+        self._gauges: dict[tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, labels: Labels):
+        histogram = self._histograms.get((name, labels))
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault((name, labels), Histogram(window=self.window))
+        histogram.observe(value)
+
+    def inc(self, name: str, value: float, labels: Labels):
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0) + value
+
+    def gauge(self, name: str, delta: float, labels: Labels):
+        with self._lock:
+            self._gauges[(name, labels)] = self._gauges.get((name, labels), 0) + delta
+
+    def snapshot(self) -> dict:
+        """
+        :return: {"histograms": {...}, "counters": {...}, "gauges": {...}}，键为 "名称{标签}" 形式的字符串。
+        """
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        return {
+            "histograms": {_series(name, labels): h.snapshot() for (name, labels), h in histograms.items()},
+            "counters": {_series(name, labels): v for (name, labels), v in counters.items()},
+            "gauges": {_series(name, labels): v for (name, labels), v in gauges.items()},
+        }
+
+    def to_prometheus(self) -> str:
+        """
+        :return: Prometheus 文本格式的指标。
+        """
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+        lines, typed = [], set()
+
+        def declare(name: str, kind: str):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), histogram in histograms:
+            declare(name, "histogram")
+            for bound, count in histogram.cumulative_counts():
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f"{_series(name + '_bucket', labels + (('le', le),))} {count}")
+            lines.append(f"{_series(name + '_sum', labels)} {histogram.sum}")
+            lines.append(f"{_series(name + '_count', labels)} {histogram.count}")
+        for (name, labels), value in counters:
+            declare(name, "counter")
+            lines.append(f"{_series(name, labels)} {value}")
+        for (name, labels), value in gauges:
+            declare(name, "gauge")
+            lines.append(f"{_series(name, labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _series(name: str, labels: Labels) -> str:
+    if not labels:
+        return name
+    escaped = ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                       for k, v in labels)
+    return f"{name}{{{escaped}}}"
+
+
+_metrics: MetricsSink | None = None
+
+
+def set_metrics(sink: MetricsSink | None):
+    """
+    设置全局的指标接收者，此后创建的管线都会上报指标；设为 None 则关闭。
+    已创建的管线可以使用 instrument 单独开启。
+    :param sink: MetricsSink 实例。
+    """
+    global _metrics
+    _metrics = sink
+
+
+def get_metrics() -> MetricsSink | None:
+    return _metrics
+
+
+def server_time(headers) -> float | None:
+    """
+    从响应头中读取服务器的处理耗时（秒）。
+    支持 Server-Timing（dur 以毫秒为单位，多项时相加）与 X-Process-Time（秒）。
+    :param headers: 响应头。
+    :return: 耗时；服务器未提供时返回 None。
+    """
+    timing = headers.get("Server-Timing")
+    if timing:
+        durations = _SERVER_TIMING_DUR.findall(timing)
+        if durations:
+            return sum(float(d) for d in durations) / 1000
+    process_time = headers.get("X-Process-Time")
+    if process_time:
+        try:
+            return float(process_time)
+        except ValueError:
+            return None
+    return None
+
+
+def record_exchange(sink: MetricsSink, model_type: str, elapsed: float, request_headers, response,
+                    streamed: bool):
+    """
+    记录一次 HTTP 往返的网络与服务器耗时以及收发的字节数。
+    服务器未在响应头中提供处理耗时时，elapsed 全部计为网络阶段。
+    :param sink: 指标接收者。
+    :param model_type: 管线的模型类型。
+    :param elapsed: 从发送请求到收到响应头的耗时（秒）。
+    :param request_headers: 请求头。
+    :param response: requests 或 httpx 的响应实例。
+    :param streamed: 响应体是否以流的方式读取；此时只能依靠 Content-Length 统计接收字节数。
+    """
+    server = server_time(response.headers)
+    if server is not None:
+        sink.observe("zerolan_ump_phase_seconds", server, (("model_type", model_type), ("phase", "server")))
+        elapsed = max(0.0, elapsed - server)
+    sink.observe("zerolan_ump_phase_seconds", elapsed, (("model_type", model_type), ("phase", "network")))
+
+    sent = request_headers.get("Content-Length")
+    if sent:
+        sink.inc("zerolan_ump_bytes_total", int(sent), (("model_type", model_type), ("direction", "sent")))
+    received = response.headers.get("Content-Length")
+    if received:
+        received = int(received)
+    elif not streamed:
+        received = len(response.content)
+    if received:
+        sink.inc("zerolan_ump_bytes_total", received, (("model_type", model_type), ("direction", "received")))
+
+
+def instrument(pipeline, sink: MetricsSink):
+    """
+    为管线实例开启指标上报。
+    公开的推理方法会记录总耗时、请求数、在途请求数以及流式方法的首块耗时，
+    parse_query 与 parse_prediction 会记录各自的耗时，HTTP 往返由 _request 记录。
+    未开启时管线不会有任何额外开销。
+    :param pipeline: 管线实例。
+    :param sink: 指标接收者。
+    """
+    pipeline.metrics = sink
+    model_type = pipeline.model_type
+    for name in INSTRUMENTED_METHODS:
+        method = getattr(type(pipeline), name, None)
+        if method is not None and not getattr(method, "__isabstractmethod__", False):
+            setattr(pipeline, name, _timed_method(getattr(pipeline, name), sink, model_type, name))
+    for name in INSTRUMENTED_PHASES:
+        method = getattr(pipeline, name, None)
+        if method is not None:
+            setattr(pipeline, name, _timed_phase(method, sink, (("model_type", model_type), ("phase", name))))
+
+
+def _timed_phase(func, sink: MetricsSink, labels: Labels):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sink.observe("zerolan_ump_phase_seconds", time.perf_counter() - start, labels)
+
+    return wrapper
+
+
+class _Call:
+    __slots__ = ("sink", "labels", "start", "first")
+
+    def __init__(self, sink: MetricsSink, labels: Labels):
+        self.sink = sink
+        self.labels = labels
+        self.start = time.perf_counter()
+        self.first = True
+        sink.gauge("zerolan_ump_in_flight", 1, labels)
+
+    def chunk(self):
+        if self.first:
+            self.first = False
+            self.sink.observe("zerolan_ump_ttfc_seconds", time.perf_counter() - self.start, self.labels)
+
+    def end(self, outcome: str):
+        self.sink.gauge("zerolan_ump_in_flight", -1, self.labels)
+        self.sink.observe("zerolan_ump_request_seconds", time.perf_counter() - self.start, self.labels)
+        self.sink.inc("zerolan_ump_requests_total", 1, self.labels + (("outcome", outcome),))
+
+
+def _timed_method(func, sink: MetricsSink, model_type: str, name: str):
+    labels = (("model_type", model_type), ("method", name))
+
+    def track_gen(call: _Call, gen):
+        outcome = "error"
+        try:
+            for item in gen:
+                call.chunk()
+                yield item
+            outcome = "ok"
+        finally:
+            call.end(outcome)
+
+    if inspect.isasyncgenfunction(func):
+        @wraps(func)
+        async def async_gen_wrapper(*args, **kwargs):
+            call, outcome = _Call(sink, labels), "error"
+            try:
+                async for item in func(*args, **kwargs):
+                    call.chunk()
+                    yield item
+                outcome = "ok"
+            finally:
+                call.end(outcome)
+
+        return async_gen_wrapper
+
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            call, outcome = _Call(sink, labels), "error"
+            try:
+                result = await func(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                call.end(outcome)
+
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        call = _Call(sink, labels)
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            call.end("error")
+            raise
+        # 生成器函数或返回生成器的函数在迭代结束时才算完成
+        if inspect.isgenerator(result):
+            return track_gen(call, result)
+        call.end("ok")
+        return result
+
+    return wrapper
@@ -0,0 +1,421 @@
+import asyncio
+import contextvars
+import struct
+import threading
+import time
+from collections import deque
+from typing import AsyncGenerator, AsyncIterable, Generator, Iterable
+
+from pydantic import BaseModel
+
+from zerolan.ump.common.metrics import Labels, MetricsSink
+from zerolan.ump.common.stats import Histogram
+from zerolan.ump.common.utils.audio_util import check_audio_format
+
+_CHUNK = struct.Struct("<4sI")
+_FMT = struct.Struct("<HHIIHH")
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# 流式合成的 WAV 头中 data 块的长度通常是占位值
+_UNKNOWN_SIZES = (0, 0xFFFFFFFF)
+
+
+class PlaybackConfig(BaseModel):
+    frame_ms: float = 20  # 每个 PCM 帧的时长（毫秒）
+    min_buffer_ms: float = 40  # 收到第一块音频后至少等待的时长
+    max_buffer_ms: float = 1500  # 目标缓冲的上限
+    percentile: float = 95  # 以最近各次合成所需缓冲的该分位数作为目标
+    history: int = 64  # 用于估计目标缓冲的最近合成次数
+    underrun_step_ms: float = 100  # 每次欠载后本次播放的目标缓冲增加的时长
+    lead_ms: float = 40  # 提前于播放时刻交给播放器的时长，用于填充声卡自身的缓冲
+
+
+class PCMFormat:
+    __slots__ = ("sample_rate", "channels", "sample_width", "is_float")
+
+    def __init__(self, sample_rate: int, channels: int, sample_width: int, is_float: bool):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width  # 每个采样的字节数
+        self.is_float = is_float
+
+    @property
+    def block_align(self) -> int:
+        return self.channels * self.sample_width
+
+    @property
+    def byte_rate(self) -> int:
+        return self.sample_rate * self.block_align
+
+    def __repr__(self):
+        kind = "float" if self.is_float else "int"
+        return f"PCMFormat({self.sample_rate}Hz, {self.channels}ch, {kind}{self.sample_width * 8})"
+
+
+class PlaybackFrame:
+    __slots__ = ("seq", "pcm", "start", "duration", "format")
+
+    def __init__(self, seq: int, pcm: bytes, start: float, duration: float, format: PCMFormat):
+        """
+        固定时长的 PCM 帧，可以直接写入声卡。
+        除了最后一帧可能较短之外，每帧的时长都是 frame_ms。
+        :param seq: 帧序号。
+        :param pcm: 交错排列的 PCM 数据。
+        :param start: 该帧在音频中的起始时间（秒）。
+        :param duration: 该帧的时长（秒）。
+        :param format: PCM 格式。
+        """
+        self.seq = seq
+        self.pcm = pcm
+        self.start = start
+        self.duration = duration
+        self.format = format
+
+
+class PCMFramer:
+
+    def __init__(self, frame_ms: float):
+        """
+        将任意切分的 WAV 字节流重新切分为固定时长的 PCM 帧。
+        音频格式由 check_audio_format 识别，目前只支持 PCM 与浮点 WAV。
+        :param frame_ms: 每帧的时长（毫秒）。
+        """
+        self.frame_ms = frame_ms
+        self.format: PCMFormat | None = None
+        self._buf = bytearray()
+        self._frame_bytes = 0
+        self._remaining: int | None = None  # data 块中尚未读到的字节数，未知时为 None
+        self._position = 0  # 已切出的 PCM 字节数
+        self._seq = 0
+
+    def feed(self, data: bytes) -> list[PlaybackFrame]:
+        """
+        :param data: 音频流中的下一段字节。
+        :return: 已经凑满的帧。
+        """
+        if self.format is None:
+            self._buf += data
+            if not self._parse_header():
+                return []
+        else:
+            self._append(data)
+        return self._take(final=False)
+
+    def close(self) -> list[PlaybackFrame]:
+        """
+        :return: 剩余的不足一帧的音频。
+        """
+        if self.format is None:
+            if self._buf:
+                raise ValueError("音频流在 WAV 头结束之前中断")
+            return []
+        return self._take(final=True)
+
+    def _append(self, data: bytes):
+        if self._remaining is not None:
+            data = data[:self._remaining]
+            self._remaining -= len(data)
+        self._buf += data
+
+    def _parse_header(self) -> bool:
+        buf = self._buf
+        if len(buf) < 12:
+            return False
+        audio_format = check_audio_format(bytes(buf[:12]))
+        if audio_format != "wav":
+            raise NotImplementedError(f"播放缓冲只支持 WAV 音频，而不是 {audio_format}")
+        offset = 12
+        pcm_format = None
+        while len(buf) >= offset + _CHUNK.size:
+            chunk_id, size = _CHUNK.unpack_from(buf, offset)
+            if chunk_id == b"data":
+                if pcm_format is None:
+                    raise ValueError("WAV 缺少 fmt 块")
+                self.format = pcm_format
+                self._frame_bytes = max(1, round(pcm_format.sample_rate * self.frame_ms / 1000)) \
+                    * pcm_format.block_align
+                rest = bytes(buf[offset + _CHUNK.size:])
+                self._buf = bytearray()
+                self._remaining = None if size in _UNKNOWN_SIZES else size
+                self._append(rest)
+                return True
+            end = offset + _CHUNK.size + size + (size & 1)
+            if len(buf) < end:
+                return False
+            if chunk_id == b"fmt ":
+                pcm_format = self._parse_fmt(buf, offset + _CHUNK.size, size)
+            offset = end
+        return False
+
+    @staticmethod
+    def _parse_fmt(buf: bytearray, offset: int, size: int) -> PCMFormat:
+        tag, channels, sample_rate, _, block_align, bits = _FMT.unpack_from(buf, offset)
+        if tag == _WAVE_FORMAT_EXTENSIBLE and size >= 26:
+            # 子格式 GUID 的前两个字节即实际的格式编号
+            tag = struct.unpack_from("<H", buf, offset + 24)[0]
+        if tag not in (_WAVE_FORMAT_PCM, _WAVE_FORMAT_IEEE_FLOAT):
+            raise NotImplementedError(f"不支持的 WAV 编码：0x{tag:04x}")
+        if not channels or not sample_rate:
+            raise ValueError("WAV 的声道数或采样率无效")
+        return PCMFormat(sample_rate, channels, block_align // channels or bits // 8,
+                         tag == _WAVE_FORMAT_IEEE_FLOAT)
+
+    def _take(self, final: bool) -> list[PlaybackFrame]:
+        frames = []
+        size = self._frame_bytes
+        available = len(self._buf)
+        if final:
+            # 丢弃不完整的采样
+            available -= available % self.format.block_align
+        offset = 0
+        while available - offset >= size or (final and offset < available):
+            length = min(size, available - offset)
+            frames.append(self._frame(bytes(self._buf[offset:offset + length])))
+            offset += length
+        del self._buf[:offset]
+        return frames
+
+    def _frame(self, pcm: bytes) -> PlaybackFrame:
+        byte_rate = self.format.byte_rate
+        frame = PlaybackFrame(self._seq, pcm, self._position / byte_rate, len(pcm) / byte_rate, self.format)
+        self._position += len(pcm)
+        self._seq += 1
+        return frame
+
+
+class JitterEstimator:
+
+    def __init__(self, config: PlaybackConfig):
+        """
+        根据以往各次合成的到达时间估计开始播放前需要缓冲的时长。
+        一次合成所需的缓冲是各块到达时刻相对于其播放时刻的最大迟到量，
+        取最近 history 次的 percentile 分位数作为之后的目标，因此网络平稳时启动延迟接近 min_buffer_ms。
+        同一个管线的多次播放共享一个实例。
+        :param config: 播放配置。
+        """
+        self.config = config
+        self._needed = Histogram(window=config.history)
+
+    def observe(self, needed: float):
+        self._needed.observe(needed)
+
+    def target(self) -> float:
+        """
+        :return: 目标缓冲时长（秒）。
+        """
+        needed = self._needed.percentile(self.config.percentile) or 0.0
+        return min(self.config.max_buffer_ms / 1000,
+                   max(self.config.min_buffer_ms / 1000, needed + self.config.frame_ms / 1000))
+
+
+class _End:
+    pass
+
+
+_END = _End()
+
+
+class JitterBuffer:
+
+    def __init__(self, config: PlaybackConfig, estimator: JitterEstimator | None = None,
+                 metrics: MetricsSink | None = None, labels: Labels = ()):
+        """
+        一次播放的抖动缓冲。
+        后台读取音频流并切分为固定时长的帧，第一块到达后等待目标时长再按播放时钟交出帧；
+        帧在应当播放时还未到达即为欠载，此时暂停时钟、提高目标并重新缓冲，而不是插入静音。
+        开启指标时上报缓冲时长、欠载次数与启动延迟。
+        :param config: 播放配置。
+        :param estimator: 共享的 JitterEstimator，为 None 时只使用 min_buffer_ms。
+        :param metrics: 指标接收者。
+        :param labels: 指标的标签。
+        """
+        self.config = config
+        self.estimator = estimator
+        self.metrics = metrics
+        self.labels = labels
+        self.target = estimator.target() if estimator is not None else config.min_buffer_ms / 1000
+        self.underruns = 0
+        self.startup: float | None = None
+        self.needed = 0.0
+        self.frames_played = 0
+        self._framer = PCMFramer(config.frame_ms)
+        self._frames: deque[PlaybackFrame] = deque()
+        self._buffered = 0.0
+        self._finished = False
+        self._error: BaseException | None = None
+        self._created = time.perf_counter()
+        self._first_arrival: float | None = None
+        self._playing = False
+        self._clock = 0.0  # 音频 0 时刻对应的时钟
+        self._position = 0.0  # 下一帧在音频中的起始时间
+
+    def stats(self) -> dict:
+        return {"target": self.target, "needed": self.needed, "buffered": self._buffered,
+                "underruns": self.underruns, "startup": self.startup, "frames": self.frames_played}
+
+    def _push(self, data: bytes, now: float):
+        frames = self._framer.feed(data)
+        if frames:
+            self._enqueue(frames, now)
+
+    def _enqueue(self, frames: list[PlaybackFrame], now: float):
+        if self._first_arrival is None:
+            self._first_arrival = now
+        # 该批帧中第一帧最晚需要在 first_arrival + 缓冲 + start 时到达
+        self.needed = max(self.needed, now - self._first_arrival - frames[0].start)
+        self._frames.extend(frames)
+        self._buffered += sum(frame.duration for frame in frames)
+
+    def _finish(self, now: float, error: BaseException | None = None):
+        if error is None:
+            try:
+                frames = self._framer.close()
+                if frames:
+                    self._enqueue(frames, now)
+            except BaseException as e:
+                error = e
+        self._error = error
+        self._finished = True
+        if error is None and self.estimator is not None and self._first_arrival is not None:
+            self.estimator.observe(self.needed)
+
+    def _step(self, now: float):
+        """
+        :return: 可以交出的帧；_END；或需要等待的秒数（None 表示等待新数据）。
+        """
+        if not self._playing:
+            if not self._frames:
+                return _END if self._finished else None
+            if not self._finished:
+                if self.startup is None:
+                    # 首次启动按到达时间计：第一块到达后等待 target 秒，之后到达的块都不会迟到
+                    wait = self._first_arrival + self.target - now
+                    if wait > 0:
+                        return wait
+                elif self._buffered < self.target:
+                    # 欠载后重新缓冲到 target 秒的音频
+                    return None
+            self._playing = True
+            self._clock = now - self._position
+            if self.startup is None:
+                self.startup = now - self._created
+                if self.metrics is not None:
+                    self.metrics.observe("zerolan_ump_playback_startup_seconds", self.startup, self.labels)
+        lead = self.config.lead_ms / 1000
+        if self._frames:
+            wait = self._clock + self._frames[0].start - lead - now
+            if wait > 0:
+                return wait
+            frame = self._frames.popleft()
+            self._buffered -= frame.duration
+            self._position = frame.start + frame.duration
+            self.frames_played += 1
+            if self.metrics is not None:
+                self.metrics.observe("zerolan_ump_playback_buffer_seconds", self._buffered, self.labels)
+            return frame
+        if self._finished:
+            return _END
+        wait = self._clock + self._position - now
+        if wait > 0:
+            return wait
+        self.underruns += 1
+        self._playing = False
+        self.target = min(self.config.max_buffer_ms / 1000, self.target + self.config.underrun_step_ms / 1000)
+        if self.metrics is not None:
+            self.metrics.inc("zerolan_ump_playback_underruns_total", 1, self.labels)
+        return None
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise self._error
+
+    def play(self, chunks: Iterable[bytes]) -> Generator[PlaybackFrame, None, None]:
+        """
+        在后台线程中读取音频流，并按播放时钟产出 PlaybackFrame。
+        音频流出错时，先交出已缓冲的帧再抛出异常。
+        :param chunks: WAV 字节流，例如 TTSStreamPrediction.wave_data 的序列。
+        :return: PlaybackFrame 的 Generator。
+        """
+        cond = threading.Condition()
+        stopped = threading.Event()
+
+        def read():
+            iterator = iter(chunks)
+            error = None
+            try:
+                for chunk in iterator:
+                    if stopped.is_set():
+                        break
+                    if chunk:
+                        with cond:
+                            self._push(chunk, time.perf_counter())
+                            cond.notify()
+            except BaseException as e:
+                error = e
+            finally:
+                if hasattr(iterator, "close"):
+                    iterator.close()
+                with cond:
+                    self._finish(time.perf_counter(), error)
+                    cond.notify()
+
+        reader = threading.Thread(target=contextvars.copy_context().run, args=(read,), name="playback-reader",
+                                  daemon=True)
+        reader.start()
+        try:
+            while True:
+                with cond:
+                    step = self._step(time.perf_counter())
+                    if step is None or isinstance(step, float):
+                        cond.wait(step)
+                        continue
+                if step is _END:
+                    self._raise_if_failed()
+                    return
+                yield step
+        finally:
+            stopped.set()
+
+    async def aplay(self, chunks: AsyncIterable[bytes]) -> AsyncGenerator[PlaybackFrame, None]:
+        """
+        play 的异步版本，在同一事件循环的任务中读取音频流。
+        :param chunks: WAV 字节流的 AsyncIterable。
+        :return: PlaybackFrame 的 AsyncGenerator。
+        """
+        changed = asyncio.Event()
+
+        async def read():
+            error = None
+            try:
+                async for chunk in chunks:
+                    if chunk:
+                        self._push(chunk, time.perf_counter())
+                        changed.set()
+            except asyncio.CancelledError:
+                raise
+            except BaseException as e:
+                error = e
+            finally:
+                if hasattr(chunks, "aclose"):
+                    await chunks.aclose()
+                self._finish(time.perf_counter(), error)
+                changed.set()
+
+        reader = asyncio.ensure_future(read())
+        try:
+            while True:
+                step = self._step(time.perf_counter())
+                if step is None or isinstance(step, float):
+                    changed.clear()
+                    try:
+                        await asyncio.wait_for(changed.wait(), step)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if step is _END:
+                    self._raise_if_failed()
+                    return
+                yield step
+        finally:
+            reader.cancel()
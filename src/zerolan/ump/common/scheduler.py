@@ -0,0 +1,488 @@
+import asyncio
+import contextlib
+import contextvars
+import inspect
+import threading
+import time
+from collections import deque
+from functools import wraps
+from typing import Literal
+
+from pydantic import BaseModel
+
+from zerolan.ump.common.metrics import INSTRUMENTED_METHODS, get_metrics
+from zerolan.ump.common.stats import Histogram
+
+Priority = Literal["interactive", "background"]
+
+# 会被调度的方法：公开的推理方法，以及后台路径中逐个发出请求的方法。
+# 后者（微批、分段描述、批量插入）按单次请求排队，长时间的后台任务不会一直占用名额
+SCHEDULED_METHODS = INSTRUMENTED_METHODS + ("predict_regions", "apredict_regions",
+                                            "_batch_predict", "_batch_search", "_remote_search",
+                                            "_predict_segment", "_apredict_segment",
+                                            "_insert_body", "_ainsert_body")
+
+
+class LaneLimits(BaseModel):
+    concurrency: int | None = 4  # 同时进行的调用数上限，None 表示不限制
+    # 为交互类调用保留的并发数，后台调用最多只能占用 concurrency - reserved 个
+    reserved: int = 1
+    rate: float | None = None  # 令牌桶每秒补充的调用数，None 表示不限速，适合付费的 API
+    burst: int = 1  # 令牌桶的容量
+
+
+class SchedulerConfig(BaseModel):
+    default: LaneLimits = LaneLimits()
+    lanes: dict[str, LaneLimits] = {}  # 以 model_type（或 schedule 时指定的通道名）为键的限制
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    调用在排队期间超过了截止时间，因此被跳过。
+    """
+    pass
+
+
+class _TokenBucket:
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def delay(self, now: float) -> float:
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class _Waiter:
+    __slots__ = ("priority", "enqueued_at", "expires_at", "admitted", "expired", "event", "loop", "future")
+
+    def __init__(self, priority: Priority, expires_at: float | None):
+        self.priority = priority
+        self.enqueued_at = time.perf_counter()
+        self.expires_at = expires_at
+        self.admitted = False
+        self.expired = False
+        self.event: threading.Event | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.future: asyncio.Future | None = None
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        elif self.future is not None:
+            self.loop.call_soon_threadsafe(self._resolve, self.future)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+
+class _Lane:
+
+    def __init__(self, name: str, limits: LaneLimits):
+        self.name = name
+        self.limits = limits
+        self.queues: dict[str, deque[_Waiter]] = {"interactive": deque(), "background": deque()}
+        self.in_flight = {"interactive": 0, "background": 0}
+        self.bucket = _TokenBucket(limits.rate, limits.burst) if limits.rate else None
+        self.wait = {"interactive": Histogram(), "background": Histogram()}
+        self.admitted = 0
+        self.expired = 0
+        self.reported_depth = 0
+
+    def _has_capacity(self, priority: Priority) -> bool:
+        limit = self.limits.concurrency
+        if limit is None:
+            return True
+        total = self.in_flight["interactive"] + self.in_flight["background"]
+        if priority == "background":
+            limit = max(1, limit - self.limits.reserved)
+            return total < self.limits.concurrency and self.in_flight["background"] < limit
+        return total < limit
+
+    def dispatch(self, now: float):
+        """
+        按优先级依次放行排在队首的调用，同一优先级内先到先得。需要在持有调度器的锁时调用。
+        """
+        for priority, queue in self.queues.items():
+            if any(w.expires_at is not None and w.expires_at <= now for w in queue):
+                kept = deque()
+                for waiter in queue:
+                    if waiter.expires_at is not None and waiter.expires_at <= now:
+                        waiter.expired = True
+                        self.expired += 1
+                        waiter.wake()
+                    else:
+                        kept.append(waiter)
+                self.queues[priority] = kept
+        while True:
+            if self.queues["interactive"]:
+                priority = "interactive"
+            elif self.queues["background"]:
+                priority = "background"
+            else:
+                return
+            if not self._has_capacity(priority) or (self.bucket is not None and not self.bucket.take(now)):
+                return
+            waiter = self.queues[priority].popleft()
+            waiter.admitted = True
+            self.in_flight[priority] += 1
+            self.admitted += 1
+            self.wait[priority].observe(time.perf_counter() - waiter.enqueued_at)
+            waiter.wake()
+
+    def next_wakeup(self, waiter: _Waiter, now: float) -> float | None:
+        # 只有令牌与截止时间会随时间变化，其余情况由 release 唤醒
+        timeouts = []
+        if self.bucket is not None:
+            timeouts.append(self.bucket.delay(now))
+        if waiter.expires_at is not None:
+            timeouts.append(max(0.0, waiter.expires_at - now))
+        return min(timeouts) if timeouts else None
+
+    def depth(self) -> int:
+        return len(self.queues["interactive"]) + len(self.queues["background"])
+
+
+class _Override:
+    __slots__ = ("priority", "deadline")
+
+    def __init__(self, priority: Priority | None, deadline: float | None):
+        self.priority = priority
+        self.deadline = deadline
+
+
+_override: contextvars.ContextVar[_Override | None] = contextvars.ContextVar("zerolan_ump_priority", default=None)
+# 当前上下文已占用的通道，嵌套的调用直接放行，避免在同一通道上等待自己
+_held: contextvars.ContextVar[frozenset] = contextvars.ContextVar("zerolan_ump_held_lanes", default=frozenset())
+
+
+@contextlib.contextmanager
+def use_priority(priority: Priority | None = None, deadline: float | None = None):
+    """
+    在该上下文中发起的被调度调用使用指定的优先级与截止时间，覆盖 schedule 时的默认值。
+    对 asyncio 任务有效；新线程不会继承上下文，本库内部的线程池（微批、感知、LLM→TTS 等）提交任务时
+    会复制调用方的上下文，自行创建的线程需要通过 contextvars.copy_context().run 提交。
+    :param priority: 优先级。
+    :param deadline: 排队的截止时间（秒，从调用开始计时）。
+    """
+    token = _override.set(_Override(priority, deadline))
+    try:
+        yield
+    finally:
+        _override.reset(token)
+
+
+class Scheduler:
+
+    def __init__(self, config: SchedulerConfig | None = None):
+        """
+        客户端的调用调度器。
+        每个通道（默认为 model_type）有各自的并发上限与令牌桶；交互类调用总是先于后台调用放行，
+        并保留一部分并发给交互类调用，使后台的描述、OCR 扫描与记忆插入不会拖慢 ASR→LLM→TTS 的回复。
+        排队超过截止时间的调用会抛出 DeadlineExceeded 而不再发出。
+        :param config: 调度器配置。
+        """
+        self.config = config or SchedulerConfig()
+        self._lanes: dict[str, _Lane] = {}
+        self._lock = threading.Lock()
+
+    def _lane(self, name: str) -> _Lane:
+        lane = self._lanes.get(name)
+        if lane is None:
+            lane = self._lanes[name] = _Lane(name, self.config.lanes.get(name, self.config.default))
+        return lane
+
+    def _enqueue(self, lane_name: str, priority: Priority, deadline: float | None) -> tuple[_Lane, _Waiter]:
+        override = _override.get()
+        if override is not None:
+            priority = override.priority or priority
+            deadline = override.deadline if override.deadline is not None else deadline
+        expires_at = None if deadline is None else time.monotonic() + deadline
+        waiter = _Waiter(priority, expires_at)
+        with self._lock:
+            lane = self._lane(lane_name)
+            lane.queues[priority].append(waiter)
+            self._report_depth(lane)
+        return lane, waiter
+
+    def _poll(self, lane: _Lane, waiter: _Waiter) -> float | None:
+        """
+        :return: 下一次检查前最多等待的秒数。
+        :raise DeadlineExceeded: 排队超过截止时间。
+        """
+        now = time.monotonic()
+        with self._lock:
+            lane.dispatch(now)
+            self._report_depth(lane)
+            if waiter.admitted:
+                return 0.0
+            if waiter.expired:
+                raise DeadlineExceeded(f"{lane.name} 的调用在排队时超过了截止时间")
+            return lane.next_wakeup(waiter, now)
+
+    def _abandon(self, lane: _Lane, waiter: _Waiter):
+        # 等待被中断（例如任务被取消）时离开队列；若恰好已被放行则归还名额
+        with self._lock:
+            if waiter.admitted:
+                self._release_locked(lane, waiter.priority)
+                return
+            try:
+                lane.queues[waiter.priority].remove(waiter)
+            except ValueError:
+                pass
+            self._report_depth(lane)
+
+    def _release_locked(self, lane: _Lane, priority: Priority):
+        lane.in_flight[priority] -= 1
+        lane.dispatch(time.monotonic())
+        self._report_depth(lane)
+
+    def _release(self, lane: _Lane, priority: Priority):
+        with self._lock:
+            self._release_locked(lane, priority)
+
+    @staticmethod
+    def _report_depth(lane: _Lane):
+        sink = get_metrics()
+        if sink is not None:
+            depth = lane.depth()
+            sink.gauge("zerolan_ump_queue_depth", depth - lane.reported_depth, (("lane", lane.name),))
+            lane.reported_depth = depth
+
+    def _acquire(self, lane: str, priority: Priority, deadline: float | None) -> tuple[_Lane, _Waiter]:
+        lane_, waiter = self._enqueue(lane, priority, deadline)
+        waiter.event = threading.Event()
+        try:
+            while (timeout := self._poll(lane_, waiter)) != 0.0:
+                waiter.event.wait(timeout)
+                waiter.event.clear()
+        except BaseException:
+            self._abandon(lane_, waiter)
+            raise
+        self._observe_wait(lane_, waiter)
+        return lane_, waiter
+
+    async def _aacquire(self, lane: str, priority: Priority, deadline: float | None) -> tuple[_Lane, _Waiter]:
+        lane_, waiter = self._enqueue(lane, priority, deadline)
+        waiter.loop = asyncio.get_running_loop()
+        try:
+            while True:
+                waiter.future = waiter.loop.create_future()
+                timeout = self._poll(lane_, waiter)
+                if timeout == 0.0:
+                    break
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(waiter.future, timeout)
+        except BaseException:
+            self._abandon(lane_, waiter)
+            raise
+        self._observe_wait(lane_, waiter)
+        return lane_, waiter
+
+    @contextlib.contextmanager
+    def slot(self, lane: str, priority: Priority = "interactive", deadline: float | None = None):
+        """
+        在通道上占用一个名额，阻塞直到被放行。
+        :param lane: 通道名，通常为 model_type。
+        :param priority: 优先级。
+        :param deadline: 排队的截止时间（秒）。
+        :raise DeadlineExceeded: 排队超过截止时间。
+        """
+        if lane in _held.get():
+            yield
+            return
+        lane_, waiter = self._acquire(lane, priority, deadline)
+        token = _held.set(_held.get() | {lane})
+        try:
+            yield
+        finally:
+            _held.reset(token)
+            self._release(lane_, waiter.priority)
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, lane: str, priority: Priority = "interactive", deadline: float | None = None):
+        """
+        slot 的异步版本，等待时不会阻塞事件循环。
+        """
+        if lane in _held.get():
+            yield
+            return
+        lane_, waiter = await self._aacquire(lane, priority, deadline)
+        token = _held.set(_held.get() | {lane})
+        try:
+            yield
+        finally:
+            _held.reset(token)
+            self._release(lane_, waiter.priority)
+
+    @staticmethod
+    def _observe_wait(lane: _Lane, waiter: _Waiter):
+        sink = get_metrics()
+        if sink is not None:
+            sink.observe("zerolan_ump_queue_wait_seconds", time.perf_counter() - waiter.enqueued_at,
+                         (("lane", lane.name), ("priority", waiter.priority)))
+
+    def stats(self) -> dict:
+        """
+        :return: 每个通道的排队数、在途调用数、已放行与因超时跳过的调用数，以及各优先级的排队耗时分位数。
+        """
+        with self._lock:
+            lanes = list(self._lanes.values())
+            result = {lane.name: {"queued": {p: len(q) for p, q in lane.queues.items()},
+                                  "in_flight": dict(lane.in_flight),
+                                  "admitted": lane.admitted,
+                                  "expired": lane.expired} for lane in lanes}
+        for lane in lanes:
+            result[lane.name]["wait"] = {p: h.snapshot() for p, h in lane.wait.items()}
+        return result
+
+
+def _scheduled_method(func, scheduler: Scheduler, lane: str, priority: Priority, deadline: float | None):
+    target = inspect.unwrap(func)
+
+    # 生成器与调用方共享上下文，不能标记为已占用通道，否则迭代期间调用方的其他调用都会绕过调度
+    if inspect.isasyncgenfunction(target):
+        @wraps(func)
+        async def async_gen_wrapper(*args, **kwargs):
+            if lane in _held.get():
+                async for item in func(*args, **kwargs):
+                    yield item
+                return
+            lane_, waiter = await scheduler._aacquire(lane, priority, deadline)
+            try:
+                async for item in func(*args, **kwargs):
+                    yield item
+            finally:
+                scheduler._release(lane_, waiter.priority)
+
+        return async_gen_wrapper
+
+    if inspect.iscoroutinefunction(target):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            async with scheduler.aslot(lane, priority, deadline):
+                return await func(*args, **kwargs)
+
+        return async_wrapper
+
+    if inspect.isgeneratorfunction(target):
+        # 生成器在开始迭代时才排队，名额一直占用到迭代结束
+        @wraps(func)
+        def gen_wrapper(*args, **kwargs):
+            if lane in _held.get():
+                yield from func(*args, **kwargs)
+                return
+            lane_, waiter = scheduler._acquire(lane, priority, deadline)
+            try:
+                yield from func(*args, **kwargs)
+            finally:
+                scheduler._release(lane_, waiter.priority)
+
+        return gen_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if lane in _held.get():
+            return func(*args, **kwargs)
+        lane_, waiter = scheduler._acquire(lane, priority, deadline)
+        token = _held.set(_held.get() | {lane})
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            scheduler._release(lane_, waiter.priority)
+            raise
+        finally:
+            _held.reset(token)
+        # 返回生成器的函数（例如先建立连接再返回流）在迭代结束时才归还名额
+        if inspect.isgenerator(result):
+            return _HeldStream(result, lambda: scheduler._release(lane_, waiter.priority))
+        scheduler._release(lane_, waiter.priority)
+        return result
+
+    return wrapper
+
+
+class _HeldStream:
+
+    def __init__(self, source, release):
+        self._source = source
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._source)
+        except BaseException:
+            self.close()
+            raise
+
+    def send(self, value):
+        return self._source.send(value)
+
+    def throw(self, *args):
+        return self._source.throw(*args)
+
+    def close(self):
+        # 未迭代就被丢弃的生成器不会执行 finally，因此由这里保证名额只归还一次
+        release, self._release = self._release, None
+        try:
+            self._source.close()
+        finally:
+            if release is not None:
+                release()
+
+    def __del__(self):
+        if self._release is not None:
+            self.close()
+
+
+def schedule(pipeline, scheduler: Scheduler, priority: Priority = "interactive", deadline: float | None = None,
+             lane: str | None = None):
+    """
+    让管线实例的推理方法（见 SCHEDULED_METHODS）经过调度器。
+    可用 use_priority 为某一段代码中的调用临时指定优先级与截止时间。
+    :param pipeline: 管线实例。
+    :param scheduler: 调度器。
+    :param priority: 该管线调用的默认优先级。
+    :param deadline: 默认的排队截止时间（秒）。
+    :param lane: 通道名，默认为 model_type；例如可为不同的付费 API 分别限速。
+    """
+    lane = lane or pipeline.model_type
+    for name in SCHEDULED_METHODS:
+        method = getattr(type(pipeline), name, None)
+        if method is not None and not getattr(method, "__isabstractmethod__", False):
+            setattr(pipeline, name, _scheduled_method(getattr(pipeline, name), scheduler, lane, priority, deadline))
+
+
+_scheduler: Scheduler | None = None
+
+
+def set_scheduler(scheduler: Scheduler | None):
+    """
+    设置全局的调度器，此后创建的管线都会经过它，默认为交互类调用；设为 None 则关闭。
+    :param scheduler: Scheduler 实例。
+    """
+    global _scheduler
+    _scheduler = scheduler
+
+
+def get_scheduler() -> Scheduler | None:
+    return _scheduler
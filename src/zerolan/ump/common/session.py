@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import weakref
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+import requests
+from loguru import logger
+from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+if TYPE_CHECKING:
+    import httpx
+
+
+class HTTPSessionConfig(BaseModel):
+    pool_connections: int = 4  # 缓存的连接池（主机）数量
+    pool_maxsize: int = 16  # 每个主机最多保持的 keep-alive 连接数
+    connect_timeout: float = 5.0
+    read_timeout: float | None = 120.0  # 大模型推理可能很慢，None 表示不限制
+    max_retries: int = 2
+    backoff_factor: float = 0.2
+    # 只有幂等的方法才会被自动重试，POST 默认不在其中
+    retry_methods: list[str] = ["GET", "HEAD", "PUT", "DELETE", "OPTIONS", "TRACE"]
+    retry_status: list[int] = [502, 503, 504]
+    max_connections: int | None = None  # 异步客户端的最大并发连接数，None 表示不限制
+
+
+class PooledSession(requests.Session):
+
+    def __init__(self, config: HTTPSessionConfig):
+        """
+        带连接池与 keep-alive 的 HTTP 会话，同一个服务器地址的所有管线共享同一个实例。
+        :param config: 连接池配置。
+        """
+        super().__init__()
+        self.config = config
+        retry = Retry(total=config.max_retries,
+                      connect=config.max_retries,
+                      read=config.max_retries,
+                      backoff_factor=config.backoff_factor,
+                      allowed_methods=frozenset(m.upper() for m in config.retry_methods),
+                      status_forcelist=config.retry_status,
+                      raise_on_status=False)
+        self._adapter = HTTPAdapter(pool_connections=config.pool_connections,
+                                    pool_maxsize=config.pool_maxsize,
+                                    max_retries=retry)
+        self.mount("http://", self._adapter)
+        self.mount("https://", self._adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", (self.config.connect_timeout, self.config.read_timeout))
+        return super().request(method, url, *args, **kwargs)
+
+    def stats(self) -> dict:
+        """
+        统计连接池的复用情况。
+        :return: 包含 requests（请求总数）、fresh（新建连接数）与 reused（复用连接的请求数）的字典。
+        """
+        num_requests, num_connections = 0, 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            num_requests += pool.num_requests
+            num_connections += pool.num_connections
+        return {
+            "requests": num_requests,
+            "fresh": num_connections,
+            "reused": max(num_requests - num_connections, 0),
+        }
+
+
+_sessions: dict[str, PooledSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def _session_key(server_url: str) -> str:
+    parts = urlsplit(server_url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def get_session(server_url: str, config: HTTPSessionConfig | None = None) -> PooledSession:
+    """
+    获取指向该服务器的共享会话，不存在时按照配置创建。
+    同一服务器仅以第一次创建时的配置为准。
+    :param server_url: 服务器地址。
+    :param config: 连接池配置。
+    :return: 共享的会话实例。
+    """
+    key = _session_key(server_url)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = PooledSession(config or HTTPSessionConfig())
+            _sessions[key] = session
+        elif config is not None and config != session.config:
+            logger.warning(f"服务器 {key} 已存在共享会话，将忽略新的连接池配置")
+        return session
+
+
+def session_stats() -> dict[str, dict]:
+    """
+    所有共享会话的连接复用统计。
+    :return: 以服务器地址为键的统计字典。
+    """
+    with _sessions_lock:
+        return {key: session.stats() for key, session in _sessions.items()}
+
+
+def close_sessions():
+    """
+    关闭并移除所有共享会话。
+    """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]]" = \
+    weakref.WeakKeyDictionary()
+
+
+def get_async_client(server_url: str, config: HTTPSessionConfig | None = None) -> "httpx.AsyncClient":
+    """
+    获取当前事件循环中指向该服务器的共享异步客户端，不存在时按照配置创建。
+    异步客户端与事件循环绑定，因此每个事件循环各自持有一份。
+    :param server_url: 服务器地址。
+    :param config: 连接池配置。
+    :return: 共享的 httpx.AsyncClient 实例。
+    """
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    key = _session_key(server_url)
+    clients = _async_clients.setdefault(loop, {})
+    client = clients.get(key)
+    if client is None:
+        config = config or HTTPSessionConfig()
+        limits = httpx.Limits(max_connections=config.max_connections,
+                              max_keepalive_connections=config.pool_maxsize)
+        timeout = httpx.Timeout(config.read_timeout, connect=config.connect_timeout)
+        transport = httpx.AsyncHTTPTransport(retries=config.max_retries, limits=limits)
+        client = httpx.AsyncClient(transport=transport, timeout=timeout)
+        clients[key] = client
+    return client
+
+
+async def aclose_async_clients():
+    """
+    关闭并移除当前事件循环中的所有共享异步客户端。
+    """
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import threading
+from typing import AsyncGenerator, Awaitable, Callable, Generator, Hashable
+
+from pydantic import BaseModel
+
+
+def query_key(query: BaseModel, extra: bytes = b"", keep_id: bool = False) -> str:
+    """
+    计算请求的规范摘要，默认忽略每次请求都不同的 id 字段。
+    :param query: 请求实例。
+    :param extra: 额外参与计算的内容，例如内存中图片的摘要。
+    :param keep_id: id 是否参与计算。id 标识服务器端的会话时（例如 LLM 按 id 保存历史）需要保留。
+    :return: 十六进制摘要。
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(type(query).__name__.encode())
+    h.update(query.model_dump_json(exclude=None if keep_id else {"id"}).encode())
+    h.update(extra)
+    return h.hexdigest()
+
+
+def _copy(result):
+    # 合并的调用各自得到一份结果，调用方修改结果时不会影响其他调用
+    return result.model_copy(deep=True) if isinstance(result, BaseModel) else result
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class _SharedStream:
+
+    def __init__(self, source: Generator, on_finish: Callable[[], None]):
+        # 当前需要下一项的消费者负责从源中取出，因此任何一个消费者提前退出都不会阻塞其他消费者
+        self.source = source
+        self.items = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.consumers = 0
+        self.lock = threading.Lock()
+        self.on_finish = on_finish
+
+    def _pull(self):
+        try:
+            self.items.append(next(self.source))
+        except StopIteration:
+            self.done = True
+        except BaseException as e:
+            self.error = e
+            self.done = True
+        if self.done:
+            self.on_finish()
+
+    def consume(self) -> Generator:
+        index = 0
+        try:
+            while True:
+                with self.lock:
+                    if index == len(self.items) and not self.done:
+                        self._pull()
+                    if index < len(self.items):
+                        item = self.items[index]
+                    elif self.error is not None:
+                        raise self.error
+                    else:
+                        return
+                index += 1
+                yield item
+        finally:
+            with self.lock:
+                self.consumers -= 1
+                if self.consumers == 0 and not self.done:
+                    # 所有消费者都已退出，不再需要继续读取
+                    self.done = True
+                    self.source.close()
+                    self.on_finish()
+
+
+class _ASharedStream:
+
+    def __init__(self, source: AsyncGenerator, on_finish: Callable[[], None]):
+        self.source = source
+        self.items = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.consumers = 0
+        self.lock = asyncio.Lock()
+        self.on_finish = on_finish
+        self._next: asyncio.Task | None = None
+
+    async def _pull(self):
+        # 源在独立的 Task 中读取，正在等待的消费者被取消时不会中断源，其他消费者继续等待同一个 Task
+        if self._next is None:
+            self._next = asyncio.ensure_future(self._advance())
+        await asyncio.shield(self._next)
+
+    async def _advance(self):
+        try:
+            self.items.append(await self.source.__anext__())
+        except StopAsyncIteration:
+            self.done = True
+        except BaseException as e:
+            self.error = e
+            self.done = True
+        finally:
+            self._next = None
+        if self.done:
+            self.on_finish()
+
+    async def consume(self) -> AsyncGenerator:
+        index = 0
+        try:
+            while True:
+                async with self.lock:
+                    if index == len(self.items) and not self.done:
+                        await self._pull()
+                    if index < len(self.items):
+                        item = self.items[index]
+                    elif self.error is not None:
+                        raise self.error
+                    else:
+                        return
+                index += 1
+                yield item
+        finally:
+            self.consumers -= 1
+            if self.consumers == 0 and not self.done:
+                self.done = True
+                self.on_finish()
+                pending = self._next
+                if pending is not None:
+                    # 源正在读取时无法直接关闭，先取消读取
+                    pending.cancel()
+                    await asyncio.wait({pending})
+                await self.source.aclose()
+
+
+class SingleFlight:
+
+    def __init__(self, on_collapse: Callable[[], None] | None = None):
+        """
+        合并同时进行的相同请求：同一时刻相同键的请求只会真正发出一次，其余调用得到其结果的副本或同一个异常。
+        请求完成后立即从表中移除，因此不会缓存结果。
+        :param on_collapse: 每合并一个请求时调用，可用于上报指标。
+        """
+        self.on_collapse = on_collapse
+        self._calls: dict[Hashable, _Call] = {}
+        self._streams: dict[Hashable, _SharedStream] = {}
+        self._tasks: dict[tuple, asyncio.Task] = {}
+        self._astreams: dict[tuple, _ASharedStream] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.collapsed = 0
+
+    def _collapse(self):
+        self.collapsed += 1
+        if self.on_collapse is not None:
+            self.on_collapse()
+
+    def do(self, key: Hashable, fn: Callable[[], any]):
+        """
+        :param key: 请求的键，通常由 query_key 计算。
+        :param fn: 真正发出请求的函数。
+        :return: fn 的返回值。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self._collapse()
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return _copy(call.result)
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def stream(self, key: Hashable, fn: Callable[[], Generator]) -> Generator:
+        """
+        流式请求的合并，后加入的调用会先重放已产出的项，再与其他调用一同接收后续的项。
+        :param key: 请求的键。
+        :param fn: 返回 Generator 的函数。
+        :return: Generator。
+        """
+        with self._lock:
+            shared = self._streams.get(key)
+            if shared is None:
+                shared = self._streams[key] = _SharedStream(fn(), lambda: self._finish(self._streams, key, shared))
+                self.leaders += 1
+            else:
+                self._collapse()
+            shared.consumers += 1
+        return shared.consume()
+
+    def _finish(self, table: dict, key, value):
+        # 只移除自己，避免误删同一个键上新开始的请求
+        if table.get(key) is value:
+            table.pop(key, None)
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable]):
+        """
+        do 的异步版本。请求在独立的 Task 中进行，取消某一个调用不会影响其他调用。
+        :param key: 请求的键。
+        :param fn: 返回协程的函数。
+        :return: 协程的结果。
+        """
+        loop_key = (asyncio.get_running_loop(), key)
+        task = self._tasks.get(loop_key)
+        if task is None:
+            task = self._tasks[loop_key] = asyncio.ensure_future(fn())
+            self.leaders += 1
+            task.add_done_callback(self._task_done(loop_key))
+            return await asyncio.shield(task)
+        self._collapse()
+        return _copy(await asyncio.shield(task))
+
+    def _task_done(self, loop_key: tuple):
+        def callback(task: asyncio.Task):
+            self._finish(self._tasks, loop_key, task)
+            # 所有调用都已取消时，避免出现异常未被读取的警告
+            if not task.cancelled():
+                task.exception()
+
+        return callback
+
+    def astream(self, key: Hashable, fn: Callable[[], AsyncGenerator]) -> AsyncGenerator:
+        """
+        stream 的异步版本。
+        :param key: 请求的键。
+        :param fn: 返回 AsyncGenerator 的函数。
+        :return: AsyncGenerator。
+        """
+        loop_key = (asyncio.get_running_loop(), key)
+        shared = self._astreams.get(loop_key)
+        if shared is None:
+            shared = self._astreams[loop_key] = _ASharedStream(
+                fn(), lambda: self._finish(self._astreams, loop_key, shared))
+            self.leaders += 1
+        else:
+            self._collapse()
+        shared.consumers += 1
+        return shared.consume()
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "collapsed": self.collapsed}
@@ -0,0 +1,73 @@
+import bisect
+import threading
+from collections import deque
+
+# 以秒为单位的默认桶边界，覆盖从亚毫秒到分钟级的推理耗时
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _pick(samples: list[float], p: float) -> float | None:
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, max(0, round(p / 100 * (len(samples) - 1))))]
+
+
+class Histogram:
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS, window: int = 2048):
+        """
+        线程安全的直方图。
+        分桶计数用于导出，最近 window 个样本用于估计分位数。
+        :param buckets: 递增的桶上界。
+        :param window: 用于计算分位数的最近样本数。
+        """
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._recent.append(value)
+            self.count += 1
+            self.sum += value
+
+    def percentile(self, p: float) -> float | None:
+        """
+        :param p: 0 到 100 之间的百分位。
+        :return: 最近样本的百分位数，无样本时返回 None。
+        """
+        with self._lock:
+            samples = sorted(self._recent)
+        return _pick(samples, p)
+
+    def cumulative_counts(self) -> list[tuple[float, int]]:
+        """
+        :return: [(桶上界, 累计计数)]，最后一项的上界为 inf。
+        """
+        with self._lock:
+            counts = list(self._counts)
+        result, total = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def snapshot(self) -> dict:
+        """
+        :return: 包含 count、sum、mean、p50、p95 与 p99 的字典。
+        """
+        with self._lock:
+            samples = sorted(self._recent)
+            count, total = self.count, self.sum
+        return {
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else None,
+            "p50": _pick(samples, 50),
+            "p95": _pick(samples, 95),
+            "p99": _pick(samples, 99),
+        }
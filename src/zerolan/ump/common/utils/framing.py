@@ -0,0 +1,217 @@
+import struct
+import threading
+from enum import IntEnum
+from typing import Generator
+
+FRAME_CONTENT_TYPE = "application/x-zerolan-audio-frames"
+FRAME_MAGIC = b"ZA"
+FRAME_VERSION = 1
+FLAG_FINAL = 0x01
+
+# magic, version, codec, flags, channels, sample_rate, seq, payload_length
+_HEADER = struct.Struct("<2sBBBBIII")
+HEADER_SIZE = _HEADER.size
+_RIFF_CHUNK = struct.Struct("<4sI")
+_WAV_FMT = struct.Struct("<HHI")  # format_tag, channels, sample_rate
+
+
+class AudioCodec(IntEnum):
+    RAW = 0
+    PCM_F32 = 1
+    PCM_S16 = 2
+    OPUS = 3
+    WAV = 4
+    OGG = 5
+
+    @classmethod
+    def from_name(cls, name: str) -> "AudioCodec":
+        return {
+            "float32": cls.PCM_F32,
+            "int16": cls.PCM_S16,
+            "opus": cls.OPUS,
+            "wav": cls.WAV,
+            "ogg": cls.OGG,
+        }.get(name.lower(), cls.RAW)
+
+
+class BufferPool:
+
+    def __init__(self, buffer_size: int, count: int = 8):
+        """
+        预分配的可复用缓冲区池，避免为每个音频帧分配内存。
+        池耗尽时会临时分配新的缓冲区，归还后同样会被复用（不超过 count 个）。
+        :param buffer_size: 每个缓冲区的字节数。
+        :param count: 预分配的缓冲区数量。
+        """
+        self.buffer_size = buffer_size
+        self.count = count
+        self._free = [bytearray(buffer_size) for _ in range(count)]
+        self._lock = threading.Lock()
+        self.allocations = count
+
+    def acquire(self, size: int | None = None) -> bytearray:
+        """
+        :param size: 需要的最小字节数，超过 buffer_size 时单独分配且不会被回收。
+        :return: 缓冲区。
+        """
+        if size is not None and size > self.buffer_size:
+            self.allocations += 1
+            return bytearray(size)
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            self.allocations += 1
+        return bytearray(self.buffer_size)
+
+    def release(self, buf: bytearray):
+        if len(buf) != self.buffer_size:
+            return
+        with self._lock:
+            if len(self._free) < self.count:
+                self._free.append(buf)
+
+
+class AudioFrame:
+    __slots__ = ("seq", "codec", "is_final", "sample_rate", "channels", "payload")
+
+    def __init__(self, seq: int, codec: AudioCodec, is_final: bool, sample_rate: int, channels: int,
+                 payload: memoryview):
+        """
+        一个二进制音频帧。
+        payload 通常引用缓冲区池中的内存，只在取得下一帧之前有效，如需保留请使用 bytes(frame.payload)。
+        """
+        self.seq = seq
+        self.codec = codec
+        self.is_final = is_final
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.payload = payload
+
+
+def pack_header(seq: int, codec: AudioCodec, is_final: bool, sample_rate: int, channels: int,
+                length: int, buf: bytearray, offset: int = 0):
+    _HEADER.pack_into(buf, offset, FRAME_MAGIC, FRAME_VERSION, int(codec), FLAG_FINAL if is_final else 0,
+                      channels, sample_rate, seq, length)
+
+
+def unpack_header(buf) -> tuple[AudioCodec, bool, int, int, int, int]:
+    """
+    :return: (codec, is_final, channels, sample_rate, seq, payload_length)。
+    """
+    magic, version, codec, flags, channels, sample_rate, seq, length = _HEADER.unpack_from(buf)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError(f"无效的音频帧头：{bytes(buf[:HEADER_SIZE])!r}")
+    return AudioCodec(codec), bool(flags & FLAG_FINAL), channels, sample_rate, seq, length
+
+
+def iter_encoded_frames(payload: bytes | memoryview, codec: AudioCodec, sample_rate: int, channels: int,
+                        chunk_size: int, pool: BufferPool) -> Generator[memoryview, None, None]:
+    """
+    将一段音频切分为带帧头的二进制帧，最后一帧带有结束标记。
+    帧写入缓冲区池中的内存，上一帧的缓冲区在取得下一帧时归还，适合直接作为流式请求体。
+    :param payload: 音频数据。
+    :param codec: 音频编码。
+    :param sample_rate: 采样率。
+    :param channels: 声道数。
+    :param chunk_size: 每帧负载的最大字节数。
+    :param pool: 缓冲区池，缓冲区大小至少为 HEADER_SIZE + chunk_size。
+    :return: 帧的 Generator。
+    """
+    view = memoryview(payload).cast("B")
+    total = len(view)
+    offset, seq = 0, 0
+    while True:
+        length = min(chunk_size, total - offset)
+        is_final = offset + length >= total
+        buf = pool.acquire(HEADER_SIZE + length)
+        pack_header(seq, codec, is_final, sample_rate, channels, length, buf)
+        buf[HEADER_SIZE:HEADER_SIZE + length] = view[offset:offset + length]
+        try:
+            yield memoryview(buf)[:HEADER_SIZE + length]
+        finally:
+            pool.release(buf)
+        offset += length
+        seq += 1
+        if is_final:
+            return
+
+
+def _readinto_exactly(raw, view: memoryview) -> bool:
+    filled = 0
+    while filled < len(view):
+        n = raw.readinto(view[filled:])
+        if not n:
+            if filled == 0:
+                return False
+            raise EOFError("音频帧在中途被截断")
+        filled += n
+    return True
+
+
+def read_frames(raw, pool: BufferPool) -> Generator[AudioFrame, None, None]:
+    """
+    从支持 readinto 的流中逐帧读取二进制音频帧。
+    每帧的负载读入缓冲区池，上一帧的缓冲区在取得下一帧时归还。
+    :param raw: 支持 readinto 的流，例如 requests 的 response.raw。
+    :param pool: 缓冲区池。
+    :return: AudioFrame 的 Generator。
+    """
+    header = memoryview(bytearray(HEADER_SIZE))
+    while _readinto_exactly(raw, header):
+        codec, is_final, channels, sample_rate, seq, length = unpack_header(header)
+        buf = pool.acquire(length)
+        view = memoryview(buf)[:length]
+        if length and not _readinto_exactly(raw, view):
+            raise EOFError("音频帧在中途被截断")
+        try:
+            yield AudioFrame(seq, codec, is_final, sample_rate, channels, view)
+        finally:
+            pool.release(buf)
+        if is_final:
+            return
+
+
+def _wav_format(data: memoryview, sample_rate: int, channels: int) -> tuple[int, int]:
+    # fmt 块不在这段数据中时保留调用方给出的值
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return sample_rate, channels
+    offset = 12
+    while len(data) >= offset + _RIFF_CHUNK.size:
+        chunk_id, size = _RIFF_CHUNK.unpack_from(data, offset)
+        offset += _RIFF_CHUNK.size
+        if chunk_id == b"fmt ":
+            if len(data) < offset + _WAV_FMT.size:
+                break
+            _, fmt_channels, fmt_sample_rate = _WAV_FMT.unpack_from(data, offset)
+            return sample_rate or fmt_sample_rate, channels or fmt_channels
+        if chunk_id == b"data":
+            break
+        offset += size + (size & 1)
+    return sample_rate, channels
+
+
+def read_raw_frames(raw, codec: AudioCodec, sample_rate: int, channels: int,
+                    pool: BufferPool) -> Generator[AudioFrame, None, None]:
+    """
+    服务器返回的不是二进制帧而是原始音频流时，按缓冲区大小切分为 AudioFrame，最后附加一个空的结束帧。
+    :param raw: 支持 readinto 的流。
+    :param codec: 音频编码。
+    :param sample_rate: 采样率，未知时为 0。WAV 流会尝试从第一帧的文件头中读取。
+    :param channels: 声道数，未知时为 0。WAV 流会尝试从第一帧的文件头中读取。
+    :param pool: 缓冲区池。
+    :return: AudioFrame 的 Generator。
+    """
+    seq = 0
+    while True:
+        buf = pool.acquire()
+        try:
+            n = raw.readinto(buf)
+            if not n:
+                break
+            if seq == 0 and codec == AudioCodec.WAV and not (sample_rate and channels):
+                sample_rate, channels = _wav_format(memoryview(buf)[:n], sample_rate, channels)
+            yield AudioFrame(seq, codec, False, sample_rate, channels, memoryview(buf)[:n])
+        finally:
+            pool.release(buf)
+        seq += 1
+    yield AudioFrame(seq, codec, True, sample_rate, channels, memoryview(b""))
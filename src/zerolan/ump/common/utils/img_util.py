@@ -0,0 +1,116 @@
+import hashlib
+import io
+from typing import Literal, Union
+
+from pydantic import BaseModel
+
+# 内存中的图片：已编码的图片字节（PNG、JPEG 等），或形状为 (H, W) / (H, W, 3) / (H, W, 4) 的 uint8 RGB(A) NumPy 数组
+ImageLike = Union[bytes, bytearray, memoryview, "numpy.ndarray"]
+
+_MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+_PIL_FORMATS = {"jpeg": "JPEG", "webp": "WEBP", "png": "PNG"}
+
+
+class ImageEncodeConfig(BaseModel):
+    # original 表示尽量原样上传；ZerolanCore 没有格式协商接口，因此由配置决定上传格式
+    format: Literal["original", "jpeg", "webp", "png"] = "original"
+    quality: int = 85  # jpeg 与 webp 的压缩质量
+    max_resolution: int | None = None  # 最长边的像素数，超过时等比缩小
+
+
+def _require_pil():
+    try:
+        from PIL import Image
+    except ImportError as e:
+        raise ImportError("重新编码或缩放图片需要 Pillow，请执行 pip install pillow") from e
+    return Image
+
+
+def _is_ndarray(image) -> bool:
+    return type(image).__module__ == "numpy" and type(image).__name__ == "ndarray"
+
+
+def encode_image(image: ImageLike, config: ImageEncodeConfig) -> tuple[str, bytes | memoryview, str]:
+    """
+    将内存中的图片整理为可以直接上传的 multipart 文件。
+    已编码的图片在无需转码与缩放时原样返回，不产生任何拷贝。
+    :param image: 内存中的图片。
+    :param config: 图片编码配置。
+    :return: (文件名, 数据, MIME 类型)。
+    """
+    is_array = _is_ndarray(image)
+    if not is_array and config.format == "original" and config.max_resolution is None:
+        return "image", image, "application/octet-stream"
+
+    Image = _require_pil()
+    if is_array:
+        img = Image.fromarray(image)
+    else:
+        img = Image.open(io.BytesIO(image))
+
+    fmt = config.format
+    if fmt == "original":
+        # 数组没有原始格式，使用无损的 PNG；已编码的图片保持原格式
+        fmt = "png" if is_array else (img.format or "PNG").lower()
+        fmt = fmt if fmt in _PIL_FORMATS else "png"
+    if config.max_resolution is not None and max(img.size) > config.max_resolution:
+        img.thumbnail((config.max_resolution, config.max_resolution))
+    if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    buf = io.BytesIO()
+    img.save(buf, format=_PIL_FORMATS[fmt], quality=config.quality)
+    return f"image.{fmt}", buf.getbuffer(), _MIME_TYPES[fmt]
+
+
+def _dhash_array(image) -> int:
+    import numpy as np
+
+    a = np.asarray(image)
+    # 先按步长抽样到约 64 像素，避免对整帧做浮点运算
+    step = max(1, min(a.shape[0], a.shape[1]) // 64)
+    a = a[::step, ::step].astype(np.float32)
+    if a.ndim == 3:
+        a = a[..., :3].mean(axis=2)
+    h, w = a.shape
+    rows = np.linspace(0, h, 8, endpoint=False).astype(int)
+    cols = np.linspace(0, w, 9, endpoint=False).astype(int)
+    small = np.add.reduceat(np.add.reduceat(a, rows, axis=0), cols, axis=1)
+    small /= np.outer(np.diff(np.append(rows, h)), np.diff(np.append(cols, w)))
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def dhash(image: ImageLike) -> int:
+    """
+    计算图片的 64 位差异哈希（dHash），相似的图片哈希之间的汉明距离很小。
+    :param image: 内存中的图片。
+    :return: 64 位整数。
+    """
+    if _is_ndarray(image):
+        return _dhash_array(image)
+
+    Image = _require_pil()
+    img = Image.open(io.BytesIO(image))
+    img.draft("L", (64, 64))  # JPEG 可以直接以低分辨率解码
+    pixels = list(img.convert("L").resize((9, 8), Image.Resampling.BILINEAR).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col + 1] > pixels[row * 9 + col])
+    return value
+
+
+def image_digest(image: ImageLike) -> bytes:
+    """
+    计算图片内容的精确摘要，只有完全相同的图片才会得到相同的摘要。
+    :param image: 内存中的图片。
+    :return: 16 字节的摘要。
+    """
+    h = hashlib.blake2b(digest_size=16)
+    if _is_ndarray(image):
+        h.update(f"{image.shape}{image.dtype}".encode())
+        h.update(image if image.flags.c_contiguous else image.tobytes())
+    else:
+        h.update(image)
+    return h.digest()
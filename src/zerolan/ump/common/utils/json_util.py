@@ -0,0 +1,192 @@
+import codecs
+import functools
+import json
+from typing import Any, Literal, Sequence, TypeVar
+
+from pydantic import TypeAdapter
+
+
+class IncrementalJSONParser:
+
+    def __init__(self):
+        """
+        流式响应的增量 JSON 解析器。
+        服务器连续输出多个 JSON 对象时，网络分块的边界可能落在任意位置（甚至是一个 UTF-8 字符的中间），
+        该解析器只在一个顶层对象完整到达后才将其切分出来。
+        """
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0  # 已扫描到的位置
+        self._start = -1  # 当前顶层对象的起始位置
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, data: bytes | str) -> list[str]:
+        """
+        输入一个数据块。
+        :param data: 网络中读取的原始数据块。
+        :return: 本次输入后变得完整的 JSON 文本列表，可能为空。
+        """
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = self._decoder.decode(data)
+        self._buf += data
+
+        docs = []
+        buf = self._buf
+        i = self._pos
+        n = len(buf)
+        while i < n:
+            c = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c == "{" or c == "[":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif c == "}" or c == "]":
+                self._depth -= 1
+                if self._depth == 0:
+                    docs.append(buf[self._start:i + 1])
+                    self._start = -1
+            i += 1
+
+        # 丢弃已经切分出的部分，只保留未完整的对象
+        if self._start >= 0:
+            self._buf = buf[self._start:]
+            self._pos = n - self._start
+            self._start = 0
+        else:
+            self._buf = ""
+            self._pos = 0
+        return docs
+
+    def close(self):
+        """
+        结束输入，若仍有未完整的对象则抛出 ValueError。
+        """
+        self.feed(self._decoder.decode(b"", final=True))
+        if self._buf.strip():
+            raise ValueError(f"流在 JSON 对象中途结束：{self._buf[:64]}")
+
+
+M = TypeVar("M")
+Raw = bytes | bytearray | memoryview | str
+
+_backend = None
+
+
+def set_json_backend(name: Literal["auto", "orjson", "json"] = "auto"):
+    """
+    选择解析普通 JSON（不直接校验为模型的部分）所用的后端。
+    auto 在安装了 orjson 时使用 orjson，否则使用标准库。
+    :param name: 后端名。
+    """
+    global _backend
+    if name == "json":
+        _backend = json.loads
+        return
+    try:
+        import orjson
+        _backend = orjson.loads
+    except ImportError:
+        if name == "orjson":
+            raise
+        _backend = json.loads
+
+
+def loads(data: Raw) -> Any:
+    """
+    使用当前的后端解析 JSON，直接接受响应的字节，无需先解码为字符串。
+    """
+    if _backend is None:
+        set_json_backend()
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    return _backend(data)
+
+
+@functools.lru_cache(maxsize=None)
+def _adapter(tp) -> TypeAdapter:
+    return TypeAdapter(tp)
+
+
+def decode(model: type[M], data: Raw | dict | M) -> M:
+    """
+    将响应解析为模型实例，各管线的 parse_prediction 都应使用该函数。
+    字节与字符串由 pydantic-core 一次完成解析与校验，不会先构造中间的 dict。
+    :param model: 模型类。
+    :param data: 响应体（字节或字符串）、已解析的 dict，或已经是该模型的实例。
+    :return: 模型实例。
+    """
+    if isinstance(data, model):
+        return data
+    if isinstance(data, (bytes, bytearray, str)):
+        return model.model_validate_json(data)
+    if isinstance(data, memoryview):
+        return model.model_validate_json(bytes(data))
+    if isinstance(data, dict):
+        return model.model_validate(data)
+    raise ValueError(f"无法将 {type(data).__name__} 解析为 {model.__name__}")
+
+
+def decode_list(model: type[M], data: Raw | list) -> list[M]:
+    """
+    将批量接口返回的 JSON 数组一次解析并校验为模型列表。
+    """
+    adapter = _adapter(list[model])
+    if isinstance(data, list):
+        return adapter.validate_python(data)
+    return adapter.validate_json(bytes(data) if isinstance(data, memoryview) else data)
+
+
+class LazyList(Sequence[M]):
+
+    def __init__(self, model: type[M], items: list):
+        """
+        只在访问时才校验元素的列表。
+        结果很多而调用方只需要其中一部分（例如前几个或满足条件的少数几个）时，可以省去其余元素的模型构造。
+        :param model: 元素的模型类。
+        :param items: 已解析的原始元素。
+        """
+        self._adapter = _adapter(model)
+        self._raw = items
+        self._items: list = [None] * len(items)
+
+    def __len__(self) -> int:
+        return len(self._raw)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._raw)))]
+        item = self._items[index]
+        if item is None:
+            item = self._items[index] = self._adapter.validate_python(self._raw[index])
+        return item
+
+    def raw(self, index: int) -> Any:
+        """
+        :return: 未经校验的原始元素，可用于在构造模型前筛选。
+        """
+        return self._raw[index]
+
+
+def decode_lazy(model: type[M], data: Raw | list | dict, field: str | None = None) -> LazyList[M]:
+    """
+    解析 JSON 但推迟元素的校验。
+    :param model: 元素的模型类。
+    :param data: 响应体或已解析的对象。
+    :param field: 列表所在的字段，例如 OCRPrediction 的 region_results；为 None 时响应本身就是数组。
+    :return: LazyList。
+    """
+    value = data if isinstance(data, (list, dict)) else loads(data)
+    if field is not None:
+        value = value[field]
+    return LazyList(model, value)
@@ -0,0 +1,59 @@
+SENTENCE_PUNCTUATIONS = "。！？!?…\n"
+CLAUSE_PUNCTUATIONS = "，、；：,;:"
+CLOSING_MARKS = "」』”’）)】"
+
+
+class SentenceSegmenter:
+
+    def __init__(self, min_chars: int = 4, max_chars: int = 80,
+                 sentence_punc: str = SENTENCE_PUNCTUATIONS, clause_punc: str = CLAUSE_PUNCTUATIONS):
+        """
+        将流式到达的文本按句子或标点切分，支持中文与日文标点。
+        :param min_chars: 句子至少包含的字符数，过短时会与下一句合并。
+        :param max_chars: 句子的最大长度，超过后在最近的分句标点（或强制）切分。
+        :param sentence_punc: 句末标点。
+        :param clause_punc: 分句标点，仅在句子过长时使用。
+        """
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.sentence_punc = sentence_punc
+        self.clause_punc = clause_punc
+        self._buf = ""
+
+    def feed(self, text: str) -> list[str]:
+        """
+        输入一段增量文本。
+        :param text: 新增的文本。
+        :return: 已经完整的句子列表，可能为空。
+        """
+        self._buf += text
+        segments = []
+        start, i, n = 0, 0, len(self._buf)
+        while i < n:
+            if self._buf[i] in self.sentence_punc and i + 1 - start >= self.min_chars:
+                # 连续的句末标点与后引号（如“！？」”）归入同一句
+                while i + 1 < n and (self._buf[i + 1] in self.sentence_punc or self._buf[i + 1] in CLOSING_MARKS):
+                    i += 1
+                if i + 1 == n:
+                    # 标点位于末尾时，等待下一段文本以确认其后没有后引号
+                    break
+                segments.append(self._buf[start:i + 1])
+                start = i + 1
+            i += 1
+        rest = self._buf[start:]
+        while len(rest) > self.max_chars:
+            cut = max(rest.rfind(p, 0, self.max_chars) for p in self.clause_punc) + 1
+            if cut <= 0:
+                cut = self.max_chars
+            segments.append(rest[:cut])
+            rest = rest[cut:]
+        self._buf = rest
+        return [s for s in segments if s.strip()]
+
+    def flush(self) -> list[str]:
+        """
+        结束输入，取出剩余的文本。
+        :return: 剩余的句子列表，可能为空。
+        """
+        rest, self._buf = self._buf, ""
+        return [rest] if rest.strip() else []
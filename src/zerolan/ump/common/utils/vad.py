@@ -0,0 +1,34 @@
+import numpy as np
+
+
+class EnergyVAD:
+
+    def __init__(self, sample_rate: int, frame_ms: int = 30, threshold_db: float = -45.0, margin_db: float = 10.0,
+                 noise_alpha: float = 0.05):
+        """
+        基于能量的轻量语音活动检测（VAD）。
+        一帧的能量同时高于绝对阈值与自适应噪声基底加余量时判定为语音。
+        :param sample_rate: 采样率。
+        :param frame_ms: 帧长（毫秒）。
+        :param threshold_db: 绝对能量阈值（dBFS）。
+        :param margin_db: 高出噪声基底多少分贝才算语音。
+        :param noise_alpha: 噪声基底的更新速度。
+        """
+        self.frame_size = sample_rate * frame_ms // 1000
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self.noise_alpha = noise_alpha
+        self.noise_db = threshold_db - margin_db
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        """
+        :param frame: 单声道 float32 帧，取值范围 [-1, 1]。
+        :return: 该帧是否为语音。
+        """
+        rms = float(np.sqrt(np.mean(np.square(frame, dtype=np.float32)))) if frame.size else 0.0
+        energy_db = 20 * np.log10(max(rms, 1e-10))
+        speech = energy_db > self.threshold_db and energy_db > self.noise_db + self.margin_db
+        # 噪声基底主要由非语音帧更新；语音帧只极缓慢地拉高它，以免持续的背景噪声被一直当作语音
+        alpha = self.noise_alpha if not speech else self.noise_alpha * 0.01
+        self.noise_db += alpha * (energy_db - self.noise_db)
+        return speech
@@ -0,0 +1,53 @@
+from typing import Generator
+
+
+def _require_cv2():
+    try:
+        import cv2
+    except ImportError as e:
+        raise ImportError("在客户端抽取视频关键帧需要 OpenCV，请执行 pip install opencv-python") from e
+    return cv2
+
+
+def sample_keyframes(path: str, fps: float, max_resolution: int | None = None, quality: int = 85,
+                     start: float = 0.0) -> Generator[tuple[float, bytes], None, None]:
+    """
+    按固定频率从视频中抽取关键帧并编码为 JPEG。
+    未被抽中的帧只读取而不解码，任何时刻内存中最多只有一帧画面。
+    :param path: 视频路径。
+    :param fps: 每秒抽取的帧数。
+    :param max_resolution: 最长边的像素数，超过时等比缩小。
+    :param quality: JPEG 压缩质量。
+    :param start: 从该时间（秒）开始抽取，用于断点续传时跳过已处理的部分。
+    :return: (时间戳（秒）, JPEG 数据) 的 Generator。
+    """
+    cv2 = _require_cv2()
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"无法打开视频：{path}")
+    try:
+        source_fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        if start > 0:
+            capture.set(cv2.CAP_PROP_POS_MSEC, start * 1000)
+        step = 1.0 / fps
+        next_at = start
+        index = 0
+        while capture.grab():
+            timestamp = start + index / source_fps
+            index += 1
+            if timestamp + 1e-6 < next_at:
+                continue
+            ok, frame = capture.retrieve()
+            if not ok:
+                break
+            next_at += step
+            height, width = frame.shape[:2]
+            if max_resolution is not None and max(height, width) > max_resolution:
+                scale = max_resolution / max(height, width)
+                frame = cv2.resize(frame, (round(width * scale), round(height * scale)),
+                                   interpolation=cv2.INTER_AREA)
+            ok, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if ok:
+                yield timestamp, data.tobytes()
+    finally:
+        capture.release()
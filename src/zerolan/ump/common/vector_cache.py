@@ -0,0 +1,259 @@
+import threading
+import time
+import zlib
+from typing import Literal
+
+from pydantic import BaseModel
+from zerolan.data.pipeline.milvus import MilvusInsert, MilvusInsertResult, MilvusQuery, MilvusQueryResult, QueryRow
+
+
+class VectorCacheConfig(BaseModel):
+    enable: bool = False
+    # fallback：本地置信度不足时改用远程结果；merge：远程结果不足 limit 行时，在其后追加远程未返回而本地足够相似的行，
+    # 例如刚插入、服务器尚未建立索引的记忆
+    mode: Literal["fallback", "merge"] = "fallback"
+    dim: int = 512  # 本地向量的维数
+    ngram: int = 3  # 使用长度为 1 到 ngram 的字符片段计算向量
+    max_rows: int = 10000  # 每个集合保留的行数上限，超出时淘汰最久未使用的行
+    min_score: float = 0.9  # 本地行的余弦相似度不低于该值才可直接作答
+    anchor_score: float = 0.95  # 与之前的查询足够相似时直接复用其远程结果
+    max_anchors: int = 256  # 每个集合保留的查询数上限
+    anchor_ttl: float = 60.0  # 复用远程结果的有效期（秒），集合有新的插入时立即失效
+    text_field: str = "text"  # 实体中用于计算向量的字段
+
+
+class _Matrix:
+
+    def __init__(self, dim: int, capacity: int):
+        # 向量按行连续存放，容量不足时倍增，达到上限后覆盖最久未使用的行
+        import numpy as np
+
+        self.capacity = capacity
+        self.vectors = np.zeros((min(capacity, 64), dim), dtype=np.float32)
+        self.used = np.zeros(len(self.vectors), dtype=np.float64)
+        self.values: list = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, vector, value) -> int:
+        import numpy as np
+
+        n = len(self.values)
+        if n < self.capacity:
+            if n == len(self.vectors):
+                size = min(self.capacity, n * 2)
+                self.vectors = np.resize(self.vectors, (size, self.vectors.shape[1]))
+                self.used = np.resize(self.used, size)
+            self.values.append(value)
+            slot = n
+        else:
+            slot = int(np.argmin(self.used))
+            self.values[slot] = value
+        self.vectors[slot] = vector
+        self.used[slot] = time.monotonic()
+        return slot
+
+    def top(self, vector, k: int):
+        """
+        :return: [(slot, 余弦相似度)]，按相似度从高到低排列。
+        """
+        import numpy as np
+
+        n = len(self.values)
+        if n == 0 or k <= 0:
+            return []
+        scores = self.vectors[:n] @ vector
+        if k < n:
+            slots = np.argpartition(scores, -k)[-k:]
+            slots = slots[np.argsort(scores[slots])[::-1]]
+        else:
+            slots = np.argsort(scores)[::-1]
+        return [(int(slot), float(scores[slot])) for slot in slots]
+
+    def touch(self, slot: int):
+        self.used[slot] = time.monotonic()
+
+
+class _Anchor:
+    __slots__ = ("limit", "output_fields", "rows", "expires_at")
+
+    def __init__(self, limit: int, output_fields: frozenset, rows: list[QueryRow], expires_at: float):
+        self.limit = limit
+        self.output_fields = output_fields
+        self.rows = rows
+        self.expires_at = expires_at
+
+
+class _Collection:
+
+    def __init__(self, config: VectorCacheConfig):
+        self.rows = _Matrix(config.dim, config.max_rows)
+        self.slots: dict[int, int] = {}  # 行 id 到矩阵中位置的映射
+        self.anchors = _Matrix(config.dim, config.max_anchors)
+
+
+class LocalVectorIndex:
+
+    def __init__(self, config: VectorCacheConfig):
+        """
+        MilvusPipeline 的本地向量层。
+        插入与检索得到的记忆以字符 n-gram 的哈希向量保存在连续的 NumPy 数组中，检索时以一次矩阵乘法求余弦相似度。
+        本地向量是按字面计算的，与服务器的语义向量不同，因此只在相似度很高时直接作答，
+        直接作答时 QueryRow.distance 为本地的余弦相似度。
+        需要安装 numpy。
+        :param config: 本地向量层的配置。
+        """
+        self.config = config
+        self._collections: dict[str, _Collection] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, text: str):
+        """
+        计算文本的本地向量：长度 1 到 ngram 的字符片段以带符号的哈希映射到 dim 维并归一化。
+        :param text: 文本。
+        :return: float32 的单位向量。
+        """
+        import numpy as np
+
+        text = " ".join(text.lower().split())
+        grams = [text[i:i + n] for n in range(1, self.config.ngram + 1) for i in range(len(text) - n + 1)]
+        vector = np.zeros(self.config.dim, dtype=np.float32)
+        if not grams:
+            return vector
+        hashes = np.fromiter((zlib.crc32(gram.encode()) for gram in grams), dtype=np.uint32, count=len(grams))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, hashes % self.config.dim, signs)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _collection(self, name: str) -> _Collection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = _Collection(self.config)
+        return collection
+
+    def _add_row(self, collection: _Collection, id: int, entity: dict):
+        text = entity.get(self.config.text_field)
+        if not isinstance(text, str):
+            return
+        vector = self.embed(text)
+        slot = collection.slots.get(id)
+        if slot is not None:
+            collection.rows.vectors[slot] = vector
+            collection.rows.values[slot] = (id, {**collection.rows.values[slot][1], **entity})
+            collection.rows.touch(slot)
+            return
+        if len(collection.rows) == collection.rows.capacity:
+            evicted = collection.rows.values[int(collection.rows.used.argmin())][0]
+            collection.slots.pop(evicted, None)
+        collection.slots[id] = collection.rows.add(vector, (id, entity))
+
+    def add_inserted(self, insert: MilvusInsert, result: MilvusInsertResult):
+        """
+        记录插入成功的行，并使该集合中复用的远程结果失效。
+        :param insert: MilvusInsert 实例。
+        :param result: 服务器返回的插入结果。
+        """
+        # 服务器自动生成 id 时以返回的 id 为准
+        ids = result.ids if len(result.ids) == len(insert.texts) else [row.id for row in insert.texts]
+        with self._lock:
+            if insert.drop_if_exists:
+                self._collections.pop(insert.collection_name, None)
+            collection = self._collection(insert.collection_name)
+            collection.anchors = _Matrix(self.config.dim, self.config.max_anchors)
+            for id, row in zip(ids, insert.texts):
+                self._add_row(collection, id, row.model_dump(exclude={"id"}))
+
+    def search(self, query: MilvusQuery) -> MilvusQueryResult | None:
+        """
+        尝试在本地作答。
+        :param query: MilvusQuery 实例。
+        :return: 本地足够可信时返回结果，否则返回 None。
+        """
+        vector = self.embed(query.query)
+        fields = frozenset(query.output_fields)
+        now = time.monotonic()
+        with self._lock:
+            collection = self._collections.get(query.collection_name)
+            if collection is not None:
+                rows = self._from_anchors(collection, vector, query.limit, fields, now)
+                if rows is None:
+                    rows = self._from_rows(collection, vector, query.limit, fields)
+                if rows is not None:
+                    self.hits += 1
+                    return MilvusQueryResult(result=[rows])
+            self.misses += 1
+            return None
+
+    def _from_anchors(self, collection: _Collection, vector, limit: int, fields: frozenset, now: float):
+        for slot, score in collection.anchors.top(vector, 1):
+            anchor: _Anchor = collection.anchors.values[slot]
+            if score >= self.config.anchor_score and anchor.expires_at > now \
+                    and anchor.limit >= limit and fields <= anchor.output_fields:
+                collection.anchors.touch(slot)
+                return [row.model_copy(update={"entity": {f: row.entity[f] for f in fields if f in row.entity}})
+                        for row in anchor.rows[:limit]]
+        return None
+
+    def _confident_rows(self, collection: _Collection, vector, limit: int, fields: frozenset) -> list[QueryRow]:
+        rows = []
+        for slot, score in collection.rows.top(vector, limit):
+            id, entity = collection.rows.values[slot]
+            if score < self.config.min_score or not fields <= entity.keys():
+                break
+            collection.rows.touch(slot)
+            rows.append(QueryRow(id=id, distance=score, entity={f: entity[f] for f in fields}))
+        return rows
+
+    def _from_rows(self, collection: _Collection, vector, limit: int, fields: frozenset):
+        rows = self._confident_rows(collection, vector, limit, fields)
+        return rows if len(rows) == limit else None
+
+    def absorb(self, query: MilvusQuery, result: MilvusQueryResult) -> MilvusQueryResult:
+        """
+        记录远程检索的结果，merge 模式下追加本地足够相似的行。
+        :param query: MilvusQuery 实例。
+        :param result: 服务器返回的检索结果。
+        :return: 最终返回给调用方的结果。
+        """
+        vector = self.embed(query.query)
+        rows = result.result[0] if result.result else []
+        with self._lock:
+            collection = self._collection(query.collection_name)
+            for row in rows:
+                self._add_row(collection, row.id, dict(row.entity))
+            collection.anchors.add(vector, _Anchor(query.limit, frozenset(query.output_fields), list(rows),
+                                                   time.monotonic() + self.config.anchor_ttl))
+            room = query.limit - len(rows)
+            if self.config.mode != "merge" or not result.result or room <= 0:
+                return result
+            seen = {row.id for row in rows}
+            extra = [row for row in self._confident_rows(collection, vector, query.limit,
+                                                         frozenset(query.output_fields))
+                     if row.id not in seen][:room]
+        if not extra:
+            return result
+        # 本地的余弦相似度与服务器的距离不可比较；追加的行取远程结果中最后一行的距离，
+        # 这样无论服务器使用哪种度量，结果仍然有序，远程行的顺序与距离保持不变
+        tail = rows[-1].distance if rows else None
+        if tail is not None:
+            extra = [row.model_copy(update={"distance": tail}) for row in extra]
+        return result.model_copy(update={"result": [rows + extra] + result.result[1:]})
+
+    def clear(self):
+        with self._lock:
+            self._collections.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "collections": len(self._collections),
+                "rows": sum(len(c.rows) for c in self._collections.values()),
+            }
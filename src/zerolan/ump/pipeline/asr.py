@@ -1,13 +1,20 @@
+import json
+import os
 from http import HTTPStatus
 from typing import Literal
 
-import requests
 from loguru import logger
 from pydantic import BaseModel
 from zerolan.data.pipeline.asr import ASRQuery, ASRPrediction, ASRStreamQuery
 
-from zerolan.ump.abs_pipeline import CommonModelPipeline
+from zerolan.ump.abs_pipeline import CommonModelPipeline, _aread_files
+from zerolan.ump.common.balancer import LoadBalancerConfig
 from zerolan.ump.common.decorator import pipeline_resolve
+from zerolan.ump.common.hedging import HedgingConfig
+from zerolan.ump.common.session import HTTPSessionConfig
+from zerolan.ump.common.utils.framing import FRAME_CONTENT_TYPE, HEADER_SIZE, AudioCodec, BufferPool, \
+    iter_encoded_frames
+from zerolan.ump.common.utils.json_util import decode
 
 
 class ASRPipelineConfig(BaseModel):
@@ -16,6 +23,12 @@ class ASRPipelineConfig(BaseModel):
     sample_rate: int = 16000
     channels: int = 1
     format: Literal["float32"] = "float32"
+    session: HTTPSessionConfig = HTTPSessionConfig()
+    balancer: LoadBalancerConfig = LoadBalancerConfig()
+    # binary 表示以长度前缀的二进制帧上传音频，而不是 multipart 表单；需要服务器支持
+    transport: Literal["multipart", "binary"] = "multipart"
+    chunk_size: int = 16384  # 二进制帧负载的最大字节数
+    hedging: HedgingConfig = HedgingConfig()  # 对冲迟迟没有响应的请求
 
 
 class ASRPipeline(CommonModelPipeline):
@@ -23,13 +36,18 @@ class ASRPipeline(CommonModelPipeline):
     def __init__(self, config: ASRPipelineConfig):
         super().__init__(config, model_type="asr")
         self.check_urls()
+        self._pool = BufferPool(HEADER_SIZE + config.chunk_size)
 
     @pipeline_resolve()
     def predict(self, query: ASRQuery) -> ASRPrediction | None:
         assert isinstance(query, ASRQuery)
         try:
-            files, data = self.parse_query(query)
-            response = requests.post(url=self.urls["predict_url"], files=files, data=data)
+            if self.config.transport == "binary":
+                with open(query.audio_path, 'rb') as f:
+                    response = self._binary_request("POST", "predict_url", query, f.read())
+            else:
+                files, data = self.parse_query(query)
+                response = self._request("POST", "predict_url", files=files, data=data)
 
             if response.status_code == HTTPStatus.OK:
                 prediction = self.parse_prediction(response.content)
@@ -41,23 +59,76 @@ class ASRPipeline(CommonModelPipeline):
 
     @pipeline_resolve()
     def stream_predict(self, query: ASRStreamQuery):
+        if self.config.transport == "binary":
+            response = self._binary_request("GET", "stream_predict_url", query, query.audio_data)
+        else:
+            files, data = self.parse_query(query)
+            response = self._request("GET", "stream_predict_url", files=files, data=data)
+
+        if response.status_code == HTTPStatus.OK:
+            return self.parse_prediction(response.content)
+        else:
+            response.raise_for_status()
+
+    @pipeline_resolve()
+    async def apredict(self, query: ASRQuery) -> ASRPrediction | None:
+        assert isinstance(query, ASRQuery)
+        try:
+            files, data = self.parse_query(query)
+            files = await _aread_files(files)
+            response = await self._arequest("POST", "predict_url", files=files, data=data)
+
+            if response.status_code == HTTPStatus.OK:
+                prediction = self.parse_prediction(response.content)
+                return prediction
+
+        except Exception as e:
+            logger.exception(e)
+            return None
+
+    @pipeline_resolve()
+    async def astream_predict(self, query: ASRStreamQuery):
         files, data = self.parse_query(query)
-        response = requests.get(url=self.urls["stream_predict_url"], files=files, data=data)
+        response = await self._arequest("GET", "stream_predict_url", files=files, data=data)
 
         if response.status_code == HTTPStatus.OK:
             return self.parse_prediction(response.content)
         else:
             response.raise_for_status()
 
+    def _binary_request(self, method: str, url_name: str, query: ASRQuery | ASRStreamQuery, audio: bytes):
+        """
+        以二进制帧上传音频，Query 的其他字段放在 X-Zerolan-Query 请求头中。
+        帧从缓冲区池中分配并以分块传输编码逐帧发送。
+        """
+        meta = json.dumps(query.model_dump(mode="json", exclude={"audio_data"}))
+        frames = iter_encoded_frames(audio, AudioCodec.from_name(query.media_type), query.sample_rate,
+                                     query.channels, self.config.chunk_size, self._pool)
+        return self._request(method, url_name, data=frames,
+                             headers={"Content-Type": FRAME_CONTENT_TYPE, "X-Zerolan-Query": meta})
+
+    def open_session(self, config=None):
+        """
+        打开一个实时流式识别会话，持续输入 float32 PCM 帧即可得到部分与最终识别结果。
+        需要安装 numpy。
+        :param config: ASRSessionConfig 实例。
+        :return: ASRStreamSession 实例。
+        """
+        from zerolan.ump.pipeline.asr_session import ASRStreamSession
+
+        return ASRStreamSession(self, config)
+
     def parse_query(self, query: ASRQuery | ASRStreamQuery) -> tuple:
         if isinstance(query, ASRQuery):
-            files = {"audio": open(query.audio_path, 'rb')}
+            # 读入内存而不是传递文件对象，请求体才能在切换服务器或对冲时重发
+            with open(query.audio_path, 'rb') as f:
+                files = {"audio": (os.path.basename(query.audio_path), f.read())}
             data = {"json": query.model_dump_json()}
 
             return files, data
         elif isinstance(query, ASRStreamQuery):
             files = {"audio": query.audio_data}
-            query.audio_data = ""
+            query.audio_data = b""
             data = {"json": query.model_dump_json()}
 
             return files, data
@@ -65,4 +136,4 @@ class ASRPipeline(CommonModelPipeline):
             raise ValueError("Can not convert query.")
 
     def parse_prediction(self, json_val: str) -> ASRPrediction:
-        return ASRPrediction.model_validate_json(json_val)
+        return decode(ASRPrediction, json_val)
@@ -0,0 +1,180 @@
+import contextvars
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Generator
+
+import numpy as np
+from loguru import logger
+from pydantic import BaseModel
+from zerolan.data.pipeline.asr import ASRStreamQuery
+
+from zerolan.ump.common.utils.vad import EnergyVAD
+
+_END = object()
+
+
+class ASRSessionConfig(BaseModel):
+    frame_ms: int = 30  # VAD 的帧长
+    chunk_ms: int = 600  # 每次上传的语音块时长
+    preroll_ms: int = 150  # 语音开始前额外保留的音频，避免吞掉开头的辅音
+    hangover_ms: int = 400  # 连续静音多久视为一句话结束
+    max_utterance_ms: int = 30000  # 一句话的最长时长，超过后强制结束
+    threshold_db: float = -45.0
+    margin_db: float = 10.0
+
+
+class ASRTranscript(BaseModel):
+    utterance_id: str
+    text: str  # 当前这句话截至目前的识别结果
+    is_final: bool
+    latency: float | None = None  # 最终结果相对于检测到语音结束的延迟（秒）
+
+
+class ASRStreamSession:
+
+    def __init__(self, pipeline, config: ASRSessionConfig | None = None):
+        """
+        实时流式语音识别会话。
+        持续接收 float32 PCM 帧，在本地进行基于能量的 VAD，只把有声的片段按固定大小分块，
+        通过管线的 keep-alive 连接上传，并产出部分与最终识别结果。
+        请使用 ASRPipeline.open_session 创建。
+        :param pipeline: ASRPipeline 实例。
+        :param config: 会话配置。
+        """
+        self.pipeline = pipeline
+        self.config = config or ASRSessionConfig()
+        self.sample_rate = pipeline.config.sample_rate
+        self.channels = pipeline.config.channels
+        self._vad = EnergyVAD(self.sample_rate, self.config.frame_ms, self.config.threshold_db, self.config.margin_db)
+        self._frame_size = self._vad.frame_size
+        self._chunk_size = self.sample_rate * self.config.chunk_ms // 1000
+        self._hangover_frames = max(1, self.config.hangover_ms // self.config.frame_ms)
+        self._max_frames = max(1, self.config.max_utterance_ms // self.config.frame_ms)
+
+        self._pending = np.zeros((0, self.channels), dtype=np.float32)  # 尚未凑满一帧的样本
+        self._preroll = deque(maxlen=max(1, self.config.preroll_ms // self.config.frame_ms))
+        self._chunk: list[np.ndarray] = []
+        self._chunk_len = 0
+        self._utterance_id: str | None = None
+        self._utterance_frames = 0
+        self._silent_frames = 0
+
+        self._closed = False
+        self._outbox = queue.Queue()
+        self._results = queue.Queue()
+        # 发送线程在创建会话时的上下文中运行，use_priority 等设置对其中的请求同样有效
+        self._sender = threading.Thread(target=contextvars.copy_context().run, args=(self._send_loop,),
+                                        name="asr-session-sender", daemon=True)
+        self._sender.start()
+
+    def feed(self, pcm: np.ndarray | bytes):
+        """
+        输入一段音频，不会因网络请求而阻塞。
+        :param pcm: float32 PCM，多声道时为交错排列。
+        """
+        if self._closed:
+            raise RuntimeError("会话已关闭")
+        samples = np.frombuffer(pcm, dtype=np.float32) if isinstance(pcm, (bytes, bytearray, memoryview)) \
+            else np.asarray(pcm, dtype=np.float32)
+        samples = samples.reshape(-1, self.channels)
+        self._pending = np.concatenate([self._pending, samples]) if len(self._pending) else samples
+
+        n_frames = len(self._pending) // self._frame_size
+        for i in range(n_frames):
+            self._process_frame(self._pending[i * self._frame_size:(i + 1) * self._frame_size])
+        self._pending = self._pending[n_frames * self._frame_size:]
+
+    def _process_frame(self, frame: np.ndarray):
+        speech = self._vad.is_speech(frame.mean(axis=1))
+        if self._utterance_id is None:
+            if not speech:
+                self._preroll.append(frame)
+                return
+            self._utterance_id = str(uuid.uuid4())
+            self._utterance_frames = 0
+            for f in self._preroll:
+                self._append(f)
+            self._preroll.clear()
+
+        self._append(frame)
+        self._utterance_frames += 1
+        self._silent_frames = 0 if speech else self._silent_frames + 1
+        if self._silent_frames >= self._hangover_frames or self._utterance_frames >= self._max_frames:
+            self._ship(is_final=True)
+            self._utterance_id = None
+            self._silent_frames = 0
+        elif self._chunk_len >= self._chunk_size:
+            self._ship(is_final=False)
+
+    def _append(self, frame: np.ndarray):
+        self._chunk.append(frame)
+        self._chunk_len += len(frame)
+
+    def _ship(self, is_final: bool):
+        audio = np.concatenate(self._chunk) if self._chunk else np.zeros((0, self.channels), dtype=np.float32)
+        self._chunk, self._chunk_len = [], 0
+        query = ASRStreamQuery(id=self._utterance_id,
+                               is_final=is_final,
+                               audio_data=audio.tobytes(),
+                               media_type=self.pipeline.config.format,
+                               sample_rate=self.sample_rate,
+                               channels=self.channels)
+        self._outbox.put((query, time.perf_counter()))
+
+    def _send_loop(self):
+        texts: dict[str, str] = {}
+        while (item := self._outbox.get()) is not _END:
+            query, shipped_at = item
+            utterance_id, is_final = query.id, query.is_final
+            try:
+                prediction = self.pipeline.stream_predict(query)
+                # 服务器按块返回本块的识别结果，客户端负责拼接
+                text = texts.get(utterance_id, "") + (prediction.transcript if prediction is not None else "")
+            except Exception as e:
+                logger.exception(e)
+                text = texts.get(utterance_id, "")
+            if is_final:
+                texts.pop(utterance_id, None)
+            else:
+                texts[utterance_id] = text
+            self._results.put(ASRTranscript(utterance_id=utterance_id, text=text, is_final=is_final,
+                                            latency=time.perf_counter() - shipped_at if is_final else None))
+        self._results.put(_END)
+
+    def results(self, timeout: float | None = None) -> Generator[ASRTranscript, None, None]:
+        """
+        依次取出识别结果，直到会话关闭且所有结果都已取出。
+        :param timeout: 等待下一个结果的最长时间（秒），超时后结束迭代；None 表示一直等待。
+        :return: ASRTranscript 的 Generator。
+        """
+        while True:
+            try:
+                item = self._results.get(timeout=timeout)
+            except queue.Empty:
+                return
+            if item is _END:
+                return
+            yield item
+
+    def close(self):
+        """
+        结束会话。正在进行的语音会作为最终块发出。
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._utterance_id is not None:
+            if len(self._pending):
+                self._append(self._pending)
+            self._ship(is_final=True)
+            self._utterance_id = None
+        self._outbox.put(_END)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
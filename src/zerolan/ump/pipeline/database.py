@@ -1,32 +1,67 @@
-import json
+import threading
+from concurrent.futures import Future
+from http import HTTPStatus
+from typing import AsyncIterable, Iterable
 from urllib.parse import urljoin
 
-import requests
 from pydantic import BaseModel
 from zerolan.data.pipeline.milvus import MilvusInsert, MilvusInsertResult, MilvusQuery, MilvusQueryResult
 
 from zerolan.ump.abs_pipeline import AbstractPipeline
+from zerolan.ump.common.balancer import LoadBalancerConfig
+from zerolan.ump.common.batching import BatchingConfig, BatchUnsupported, MicroBatcher
+from zerolan.ump.common.hedging import HedgingConfig
+from zerolan.ump.common.session import HTTPSessionConfig
+from zerolan.ump.common.singleflight import query_key
+from zerolan.ump.common.utils.json_util import decode, decode_list, loads
+from zerolan.ump.common.vector_cache import VectorCacheConfig
+from zerolan.ump.pipeline.database_ingest import BulkInserter, BulkInsertConfig, BulkInsertReport, ProgressCallback, \
+    Record
 
 
 class MilvusDatabaseConfig(BaseModel):
     enable: bool = True
     server_url: str = "http://127.0.0.1:11010"
+    session: HTTPSessionConfig = HTTPSessionConfig()
+    batching: BatchingConfig = BatchingConfig()
+    balancer: LoadBalancerConfig = LoadBalancerConfig()
+    single_flight: bool = False  # 合并同时发出的相同请求，重复的请求共享同一个结果
+    local_cache: VectorCacheConfig = VectorCacheConfig()
+    bulk: BulkInsertConfig = BulkInsertConfig()
+    hedging: HedgingConfig = HedgingConfig()  # 对冲迟迟没有响应的请求
 
 
-def _post(url: str, obj: any, return_type: any):
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def _post(pipeline: AbstractPipeline, url_name: str, obj: any, return_type: any):
     if isinstance(obj, BaseModel):
         json_val = obj.model_dump()
     else:
         json_val = obj
 
-    response = requests.post(url=url, json=json_val)
+    response = pipeline._request("POST", url_name, json=json_val)
     response.raise_for_status()
 
-    json_val = response.json()
-    if hasattr(return_type, "model_validate"):
-        return return_type.model_validate(json_val)
+    if hasattr(return_type, "model_validate_json"):
+        return decode(return_type, response.content)
     else:
-        return json.loads(json_val)
+        return loads(response.content)
+
+
+async def _apost(pipeline: AbstractPipeline, url_name: str, obj: any, return_type: any):
+    if isinstance(obj, BaseModel):
+        json_val = obj.model_dump()
+    else:
+        json_val = obj
+
+    response = await pipeline._arequest("POST", url_name, json=json_val)
+    response.raise_for_status()
+
+    if hasattr(return_type, "model_validate_json"):
+        return decode(return_type, response.content)
+    else:
+        return loads(response.content)
 
 
 class MilvusPipeline(AbstractPipeline):
@@ -34,10 +69,152 @@ class MilvusPipeline(AbstractPipeline):
         super().__init__(config, "milvus")
         self.urls["insert_url"] = urljoin(config.server_url, f'/{self.model_type}/insert')
         self.urls["search_url"] = urljoin(config.server_url, f'/{self.model_type}/search')
+        self.urls["batch_search_url"] = urljoin(config.server_url, f'/{self.model_type}/batch-search')
         self.check_urls()
+        self._insert_batcher: MicroBatcher | None = None
+        self._search_batcher: MicroBatcher | None = None
+        self._batcher_lock = threading.Lock()
+        self.local = None
+        if config.local_cache.enable:
+            from zerolan.ump.common.vector_cache import LocalVectorIndex
+
+            self.local = LocalVectorIndex(config.local_cache)
+
+    def _local_search(self, query: MilvusQuery) -> MilvusQueryResult | None:
+        if self.local is None:
+            return None
+        result = self.local.search(query)
+        if result is not None and self.metrics is not None:
+            self.metrics.inc("zerolan_ump_local_hits_total", 1, (("model_type", self.model_type),))
+        return result
 
     def insert(self, insert: MilvusInsert) -> MilvusInsertResult:
-        return _post(url=self.urls["insert_url"], obj=insert, return_type=MilvusInsertResult)
+        result = _post(self, "insert_url", obj=insert, return_type=MilvusInsertResult)
+        if self.local is not None:
+            self.local.add_inserted(insert, result)
+        return result
 
     def search(self, query: MilvusQuery) -> MilvusQueryResult:
-        return _post(url=self.urls["search_url"], obj=query, return_type=MilvusQueryResult)
+        result = self._local_search(query)
+        return result if result is not None else self._remote_search(query)
+
+    def _remote_search(self, query: MilvusQuery) -> MilvusQueryResult:
+        if self.flight is None:
+            result = _post(self, "search_url", obj=query, return_type=MilvusQueryResult)
+        else:
+            result = self.flight.do(query_key(query),
+                                    lambda: _post(self, "search_url", obj=query, return_type=MilvusQueryResult))
+        return result if self.local is None else self.local.absorb(query, result)
+
+    def submit_insert(self, insert: MilvusInsert) -> Future:
+        """
+        提交一个插入请求。短时间内对同一集合的多个插入会被合并为一次插入。
+        :param insert: MilvusInsert 实例。
+        :return: MilvusInsertResult 的 Future，其中只包含本次插入的 id。
+        """
+        with self._batcher_lock:
+            if self._insert_batcher is None:
+                self._insert_batcher = MicroBatcher(single_fn=self.insert,
+                                                    batch_fn=self._batch_insert,
+                                                    config=self.config.batching,
+                                                    # 会删除集合的插入不能与其他插入合并
+                                                    key_fn=lambda i: None if i.drop_if_exists else i.collection_name,
+                                                    name="milvus-insert-batcher")
+        return self._insert_batcher.submit(insert)
+
+    def submit_search(self, query: MilvusQuery) -> Future:
+        """
+        提交一个检索请求。服务器提供批量检索接口时，短时间内的多个检索会被合并为一次请求，否则并行发送。
+        :param query: MilvusQuery 实例。
+        :return: MilvusQueryResult 的 Future。
+        """
+        result = self._local_search(query)
+        if result is not None:
+            future = Future()
+            future.set_result(result)
+            return future
+        with self._batcher_lock:
+            if self._search_batcher is None:
+                self._search_batcher = MicroBatcher(single_fn=self._remote_search,
+                                                    batch_fn=self._batch_search,
+                                                    config=self.config.batching,
+                                                    name="milvus-search-batcher")
+        return self._search_batcher.submit(query)
+
+    def close(self):
+        """
+        关闭插入与检索的微批处理调度器，已提交的请求仍会被发送。
+        """
+        with self._batcher_lock:
+            batchers = [self._insert_batcher, self._search_batcher]
+            self._insert_batcher = self._search_batcher = None
+        for batcher in batchers:
+            if batcher is not None:
+                batcher.close()
+        super().close()
+
+    def _batch_insert(self, inserts: list[MilvusInsert]) -> list[MilvusInsertResult]:
+        # /milvus/insert 本身接受多行数据，合并后按顺序把 id 分回给各个请求
+        merged = inserts[0].model_copy(update={"texts": [row for insert in inserts for row in insert.texts]})
+        result = self.insert(merged)
+        results, offset = [], 0
+        for insert in inserts:
+            ids = result.ids[offset:offset + len(insert.texts)]
+            results.append(result.model_copy(update={"insert_count": len(ids), "ids": ids}))
+            offset += len(insert.texts)
+        return results
+
+    def _batch_search(self, queries: list[MilvusQuery]) -> list[MilvusQueryResult]:
+        # 批量接口：请求体为 MilvusQuery 列表，返回等长的 MilvusQueryResult 列表
+        response = self._request("POST", "batch_search_url", json=[query.model_dump() for query in queries])
+        if response.status_code in (HTTPStatus.NOT_FOUND, HTTPStatus.METHOD_NOT_ALLOWED):
+            raise BatchUnsupported()
+        response.raise_for_status()
+        results = decode_list(MilvusQueryResult, response.content)
+        if self.local is not None:
+            results = [self.local.absorb(query, result) for query, result in zip(queries, results)]
+        return results
+
+    def bulk_insert(self, collection_name: str, records: Iterable[Record], checkpoint: str | None = None,
+                    on_progress: ProgressCallback | None = None) -> BulkInsertReport:
+        """
+        把大量记录分批并发地插入同一集合，例如导入聊天记录或文档，详见 BulkInserter。
+        :param collection_name: 集合名。
+        :param records: InsertRow 或可以转换为 InsertRow 的字典，可以是惰性的迭代器。
+        :param checkpoint: 断点文件的路径，失败后以同一路径重新调用即可从上次确认的批继续。
+        :param on_progress: 每确认一批时以 (进度, 该批的报告) 调用。
+        :return: 插入报告。
+        :raise BulkInsertError: 某一批在重试后仍然失败。
+        """
+        return BulkInserter(self, collection_name, self.config.bulk, checkpoint, on_progress).run(records)
+
+    def _insert_body(self, body: bytes):
+        # 批量插入的单批请求，请求体已由 BulkInserter 编码
+        return self._request("POST", "insert_url", data=body, headers=_JSON_HEADERS)
+
+    async def _ainsert_body(self, body: bytes):
+        return await self._arequest("POST", "insert_url", content=body, headers=_JSON_HEADERS)
+
+    async def abulk_insert(self, collection_name: str, records: Iterable[Record] | AsyncIterable[Record],
+                           checkpoint: str | None = None,
+                           on_progress: ProgressCallback | None = None) -> BulkInsertReport:
+        return await BulkInserter(self, collection_name, self.config.bulk, checkpoint, on_progress).arun(records)
+
+    async def ainsert(self, insert: MilvusInsert) -> MilvusInsertResult:
+        result = await _apost(self, "insert_url", obj=insert, return_type=MilvusInsertResult)
+        if self.local is not None:
+            self.local.add_inserted(insert, result)
+        return result
+
+    async def asearch(self, query: MilvusQuery) -> MilvusQueryResult:
+        # 本地检索只是一次矩阵乘法，直接在事件循环中进行
+        result = self._local_search(query)
+        if result is not None:
+            return result
+        if self.flight is None:
+            result = await _apost(self, "search_url", obj=query, return_type=MilvusQueryResult)
+        else:
+            result = await self.flight.ado(query_key(query),
+                                           lambda: _apost(self, "search_url", obj=query,
+                                                          return_type=MilvusQueryResult))
+        return result if self.local is None else self.local.absorb(query, result)
@@ -0,0 +1,327 @@
+import asyncio
+import contextvars
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import AsyncIterable, Callable, Iterable, Iterator
+
+from loguru import logger
+from pydantic import BaseModel
+from zerolan.data.pipeline.milvus import InsertRow, MilvusInsert, MilvusInsertResult
+
+
+class BulkInsertConfig(BaseModel):
+    batch_rows: int = 512  # 每批的行数上限
+    max_batch_bytes: int = 1024 * 1024  # 每批请求体大小的上限（估算值）
+    concurrency: int = 4  # 同时发出的批数
+    max_inflight_bytes: int = 8 * 1024 * 1024  # 在途请求体的总大小上限，达到时暂停读取输入
+    # 单批失败后的重试次数。注意：服务器已写入但响应丢失时，重试会产生重复的行
+    max_retries: int = 2
+    retry_backoff: float = 0.5  # 第一次重试前等待的秒数，之后每次翻倍
+
+
+class BatchReport(BaseModel):
+    index: int
+    rows: int
+    bytes: int
+    ids: list[int]
+    attempts: int
+    elapsed: float
+
+
+class BulkInsertProgress(BaseModel):
+    batches: int = 0  # 已确认的批数
+    rows: int = 0  # 已确认的行数
+    bytes: int = 0  # 已确认的请求体字节数
+    skipped: int = 0  # 因断点续传而跳过的批数
+    acked: int = -1  # 该序号及之前的批均已确认
+    elapsed: float = 0.0
+
+
+class BulkInsertReport(BaseModel):
+    progress: BulkInsertProgress
+    batches: list[BatchReport]
+
+
+class BulkInsertError(Exception):
+    """
+    某一批在重试后仍然失败。此前已确认的批记录在 report 与断点文件中，使用同一断点文件重新调用即可继续。
+    """
+
+    def __init__(self, message: str, report: BulkInsertReport):
+        super().__init__(message)
+        self.report = report
+
+
+Record = InsertRow | dict
+ProgressCallback = Callable[[BulkInsertProgress, BatchReport], None]
+
+
+class _Batch:
+    __slots__ = ("index", "rows", "body", "size")
+
+    def __init__(self, index: int, rows: list[InsertRow], body: bytes):
+        self.index = index
+        self.rows = rows
+        self.body = body
+        self.size = len(body)
+
+
+def _estimate(row: InsertRow) -> int:
+    # 比完整序列化便宜得多，只用于切分批次
+    return len(row.text.encode()) + len(row.subject.encode()) + 48
+
+
+class BulkInserter:
+
+    def __init__(self, pipeline, collection_name: str, config: BulkInsertConfig | None = None,
+                 checkpoint: str | None = None, on_progress: ProgressCallback | None = None):
+        """
+        把任意长度的记录流分批插入 Milvus。
+        多批并发发送，在途批数与请求体总大小均有上限，达到上限时暂停读取输入，因此内存占用与输入长度无关。
+        每批的请求体只序列化一次，重试时直接复用。
+        指定 checkpoint 时，已确认的批会记录到该文件；失败后以相同的输入、配置与断点文件重新调用即可跳过已确认的批。
+        请使用 MilvusPipeline.bulk_insert 或 abulk_insert。
+        :param pipeline: MilvusPipeline 实例。
+        :param collection_name: 集合名。
+        :param config: 批量插入配置。
+        :param checkpoint: 断点文件的路径。
+        :param on_progress: 每确认一批时以 (进度, 该批的报告) 调用。
+        """
+        self.pipeline = pipeline
+        self.collection_name = collection_name
+        self.config = config or BulkInsertConfig()
+        self.checkpoint = checkpoint
+        self.on_progress = on_progress
+        self.progress = BulkInsertProgress()
+        self.reports: list[BatchReport] = []
+        self._done: set[int] = set()
+        self._start = 0.0
+        self._load_checkpoint()
+
+    def _signature(self) -> dict:
+        return {"collection_name": self.collection_name, "batch_rows": self.config.batch_rows,
+                "max_batch_bytes": self.config.max_batch_bytes}
+
+    def _load_checkpoint(self):
+        if self.checkpoint is None or not os.path.exists(self.checkpoint):
+            return
+        with open(self.checkpoint, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("signature") != self._signature():
+            raise ValueError(f"断点文件 {self.checkpoint} 与当前的集合或分批配置不一致")
+        self.progress.acked = state["acked"]
+        self._done = set(state["done"])
+
+    def _save_checkpoint(self):
+        if self.checkpoint is None:
+            return
+        state = {"signature": self._signature(), "acked": self.progress.acked, "done": sorted(self._done)}
+        tmp = f"{self.checkpoint}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.checkpoint)
+
+    def _is_done(self, index: int) -> bool:
+        return index <= self.progress.acked or index in self._done
+
+    def _make_batch(self, index: int, rows: list[InsertRow]) -> _Batch | None:
+        if self._is_done(index):
+            self.progress.skipped += 1
+            return None
+        insert = MilvusInsert(collection_name=self.collection_name, texts=rows)
+        return _Batch(index, rows, insert.model_dump_json().encode())
+
+    def _chunks(self, records: Iterable[Record]) -> Iterator[tuple[int, list[InsertRow]]]:
+        # 切分只取决于输入与配置，断点续传时批的序号才能对应
+        rows, size, index = [], 0, 0
+        for record in records:
+            row = record if isinstance(record, InsertRow) else InsertRow.model_validate(record)
+            row_size = _estimate(row)
+            if rows and (len(rows) >= self.config.batch_rows or size + row_size > self.config.max_batch_bytes):
+                yield index, rows
+                rows, size, index = [], 0, index + 1
+            rows.append(row)
+            size += row_size
+        if rows:
+            yield index, rows
+
+    def _batches(self, records: Iterable[Record]) -> Iterator[_Batch]:
+        for index, rows in self._chunks(records):
+            batch = self._make_batch(index, rows)
+            if batch is not None:
+                yield batch
+
+    def _ack(self, batch: _Batch, result: MilvusInsertResult, attempts: int, elapsed: float):
+        if self.pipeline.local is not None:
+            self.pipeline.local.add_inserted(MilvusInsert(collection_name=self.collection_name, texts=batch.rows),
+                                             result)
+        report = BatchReport(index=batch.index, rows=len(batch.rows), bytes=batch.size, ids=result.ids,
+                             attempts=attempts, elapsed=elapsed)
+        self.reports.append(report)
+        self._done.add(batch.index)
+        while self.progress.acked + 1 in self._done:
+            self.progress.acked += 1
+            self._done.discard(self.progress.acked)
+        self.progress.batches += 1
+        self.progress.rows += report.rows
+        self.progress.bytes += report.bytes
+        self.progress.elapsed = time.perf_counter() - self._start
+        self._save_checkpoint()
+        if self.on_progress is not None:
+            self.on_progress(self.progress.model_copy(), report)
+
+    def _report(self) -> BulkInsertReport:
+        self.progress.elapsed = time.perf_counter() - self._start
+        return BulkInsertReport(progress=self.progress.model_copy(),
+                                batches=sorted(self.reports, key=lambda r: r.index))
+
+    def _fail(self, batch: _Batch, error: BaseException):
+        self._save_checkpoint()
+        raise BulkInsertError(f"第 {batch.index} 批插入失败：{error}", self._report()) from error
+
+    def _send(self, batch: _Batch) -> tuple[MilvusInsertResult, int, float]:
+        start = time.perf_counter()
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                response = self.pipeline._insert_body(batch.body)
+                response.raise_for_status()
+                return MilvusInsertResult.model_validate_json(response.content), attempt + 1, \
+                    time.perf_counter() - start
+            except Exception as e:
+                if attempt == self.config.max_retries:
+                    raise
+                delay = self.config.retry_backoff * 2 ** attempt
+                logger.warning(f"第 {batch.index} 批插入失败，{delay:.1f} 秒后重试：{e}")
+                time.sleep(delay)
+
+    def run(self, records: Iterable[Record]) -> BulkInsertReport:
+        """
+        :param records: InsertRow 或可以转换为 InsertRow 的字典。
+        :return: 插入报告。
+        :raise BulkInsertError: 某一批在重试后仍然失败。
+        """
+        self._start = time.perf_counter()
+        inflight: dict[Future, _Batch] = {}
+        inflight_bytes = 0
+        failure: tuple[_Batch, BaseException] | None = None
+
+        def collect(block: bool):
+            nonlocal inflight_bytes, failure
+            done, _ = wait(inflight, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = inflight.pop(future)
+                inflight_bytes -= batch.size
+                error = future.exception()
+                if error is not None:
+                    failure = failure or (batch, error)
+                else:
+                    self._ack(batch, *future.result())
+
+        with ThreadPoolExecutor(max_workers=self.config.concurrency, thread_name_prefix="milvus-bulk") as executor:
+            for batch in self._batches(records):
+                # 背压：在途的批过多或过大时等待，单独一批超过上限时仍允许发送
+                while inflight and (len(inflight) >= self.config.concurrency
+                                    or inflight_bytes + batch.size > self.config.max_inflight_bytes):
+                    collect(block=True)
+                collect(block=False)
+                if failure is not None:
+                    break
+                inflight[executor.submit(contextvars.copy_context().run, self._send, batch)] = batch
+                inflight_bytes += batch.size
+            while inflight:
+                collect(block=True)
+        if failure is not None:
+            self._fail(*failure)
+        return self._report()
+
+    async def _asend(self, batch: _Batch) -> tuple[MilvusInsertResult, int, float]:
+        start = time.perf_counter()
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                response = await self.pipeline._ainsert_body(batch.body)
+                response.raise_for_status()
+                return MilvusInsertResult.model_validate_json(response.content), attempt + 1, \
+                    time.perf_counter() - start
+            except Exception as e:
+                if attempt == self.config.max_retries:
+                    raise
+                delay = self.config.retry_backoff * 2 ** attempt
+                logger.warning(f"第 {batch.index} 批插入失败，{delay:.1f} 秒后重试：{e}")
+                await asyncio.sleep(delay)
+
+    async def arun(self, records: Iterable[Record] | AsyncIterable[Record]) -> BulkInsertReport:
+        """
+        run 的异步版本，也接受异步的记录流。
+        """
+        self._start = time.perf_counter()
+        inflight: dict[asyncio.Task, _Batch] = {}
+        inflight_bytes = 0
+        failure: tuple[_Batch, BaseException] | None = None
+
+        async def collect(block: bool):
+            nonlocal inflight_bytes, failure
+            if block:
+                done, _ = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                done = [task for task in inflight if task.done()]
+            for task in done:
+                batch = inflight.pop(task)
+                inflight_bytes -= batch.size
+                error = task.exception()
+                if error is not None:
+                    failure = failure or (batch, error)
+                else:
+                    self._ack(batch, *task.result())
+
+        try:
+            async for batch in self._abatches(records):
+                while inflight and (len(inflight) >= self.config.concurrency
+                                    or inflight_bytes + batch.size > self.config.max_inflight_bytes):
+                    await collect(block=True)
+                await collect(block=False)
+                if failure is not None:
+                    break
+                inflight[asyncio.ensure_future(self._asend(batch))] = batch
+                inflight_bytes += batch.size
+            while inflight:
+                await collect(block=True)
+        finally:
+            for task in inflight:
+                task.cancel()
+        if failure is not None:
+            self._fail(*failure)
+        return self._report()
+
+    async def _abatches(self, records: Iterable[Record] | AsyncIterable[Record]):
+        if not hasattr(records, "__aiter__"):
+            for batch in self._batches(records):
+                yield batch
+            return
+        # 异步的记录流先收集为一批再交给同一套切分逻辑
+        buffer: list[Record] = []
+        index = 0
+
+        async def drain(final: bool):
+            nonlocal buffer, index
+            chunks = list(self._chunks(buffer))
+            if not final:
+                # 最后一块可能还未满，留待更多记录
+                chunks, rest = chunks[:-1], chunks[-1][1] if chunks else []
+                buffer = list(rest)
+            else:
+                buffer = []
+            for offset, rows in chunks:
+                batch = self._make_batch(index, rows)
+                index += 1
+                if batch is not None:
+                    yield batch
+
+        async for record in records:
+            buffer.append(record)
+            if len(buffer) > self.config.batch_rows:
+                async for batch in drain(final=False):
+                    yield batch
+        async for batch in drain(final=True):
+            yield batch
@@ -3,12 +3,24 @@ from zerolan.data.pipeline.abs_data import AbstractModelQuery
 from zerolan.data.pipeline.img_cap import ImgCapQuery, ImgCapPrediction
 
 from zerolan.ump.abs_pipeline import AbstractImagePipeline
+from zerolan.ump.common.balancer import LoadBalancerConfig
 from zerolan.ump.common.decorator import pipeline_resolve
+from zerolan.ump.common.hedging import HedgingConfig
+from zerolan.ump.common.image_cache import ImageCacheConfig
+from zerolan.ump.common.session import HTTPSessionConfig
+from zerolan.ump.common.utils.img_util import ImageEncodeConfig, ImageLike
+from zerolan.ump.common.utils.json_util import decode
 
 
 class ImgCapPipelineConfig(BaseModel):
     enable: bool = True
     server_url: str = "http://127.0.0.1:11003"
+    session: HTTPSessionConfig = HTTPSessionConfig()
+    balancer: LoadBalancerConfig = LoadBalancerConfig()
+    single_flight: bool = False  # 合并同时发出的相同请求，重复的请求共享同一个结果
+    image: ImageEncodeConfig = ImageEncodeConfig()
+    cache: ImageCacheConfig = ImageCacheConfig()
+    hedging: HedgingConfig = HedgingConfig()  # 对冲迟迟没有响应的请求
 
 
 class ImgCapPipeline(AbstractImagePipeline):
@@ -18,8 +30,12 @@ class ImgCapPipeline(AbstractImagePipeline):
         self.check_urls()
 
     @pipeline_resolve()
-    def predict(self, query: ImgCapQuery) -> ImgCapPrediction | None:
-        return super().predict(query)
+    def predict(self, query: ImgCapQuery, image: ImageLike | None = None) -> ImgCapPrediction | None:
+        return super().predict(query, image)
+
+    @pipeline_resolve()
+    async def apredict(self, query: ImgCapQuery, image: ImageLike | None = None) -> ImgCapPrediction | None:
+        return await super().apredict(query, image)
 
     @pipeline_resolve()
     def stream_predict(self, query: AbstractModelQuery):
@@ -29,4 +45,4 @@ class ImgCapPipeline(AbstractImagePipeline):
         return super().parse_query(query)
 
     def parse_prediction(self, json_val: str) -> ImgCapPrediction:
-        return ImgCapPrediction.model_validate_json(json_val)
+        return decode(ImgCapPrediction, json_val)
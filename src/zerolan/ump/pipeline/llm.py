@@ -1,10 +1,15 @@
-from openai import OpenAI
+import time
+from typing import AsyncGenerator, Generator
+
 from pydantic import BaseModel
 from zerolan.data.pipeline.abs_data import AbstractModelQuery
 from zerolan.data.pipeline.llm import LLMQuery, LLMPrediction, RoleEnum, Conversation
 
 from zerolan.ump.abs_pipeline import CommonModelPipeline
+from zerolan.ump.common.balancer import LoadBalancerConfig
 from zerolan.ump.common.decorator import pipeline_resolve
+from zerolan.ump.common.session import HTTPSessionConfig
+from zerolan.ump.common.utils.json_util import decode
 
 
 def _to_openai_format(query: LLMQuery):
@@ -26,6 +31,9 @@ class LLMPipelineConfig(BaseModel):
     model: str | None = None  # ["moonshot-v1-8k", "deepseek-chat"]
     api_key: str | None = None
     server_url: str = "http://127.0.0.1:11002"
+    session: HTTPSessionConfig = HTTPSessionConfig()
+    balancer: LoadBalancerConfig = LoadBalancerConfig()
+    single_flight: bool = False  # 合并同时发出的相同请求，重复的请求共享同一个结果
 
 
 def _openai_predict(query: LLMQuery, wrapper):
@@ -37,7 +45,67 @@ def _openai_predict(query: LLMQuery, wrapper):
     return LLMPrediction(response=resp, history=query.history)
 
 
+async def _aopenai_predict(query: LLMQuery, wrapper):
+    messages = _to_openai_format(query)
+    completion = await wrapper(messages)
+    resp = completion.choices[0].message.content
+    query.history.append(Conversation(role=RoleEnum.user, content=query.text))
+    query.history.append(Conversation(role=RoleEnum.assistant, content=resp))
+    return LLMPrediction(response=resp, history=query.history)
+
+
+def _delta_content(chunk) -> str | None:
+    if not chunk.choices:
+        return None
+    return chunk.choices[0].delta.content
+
+
+def _openai_stream_predict(query: LLMQuery, stream):
+    # 与 ZerolanCore 的流式接口一致，每次产出的 response 都是截至目前的完整回复
+    history = query.history + [Conversation(role=RoleEnum.user, content=query.text)]
+    resp = ""
+    for chunk in stream:
+        delta = _delta_content(chunk)
+        if not delta:
+            continue
+        resp += delta
+        yield LLMPrediction.model_construct(
+            response=resp, history=history + [Conversation.model_construct(role=RoleEnum.assistant, content=resp)])
+    query.history.append(Conversation(role=RoleEnum.user, content=query.text))
+    query.history.append(Conversation(role=RoleEnum.assistant, content=resp))
+
+
+async def _aopenai_stream_predict(query: LLMQuery, stream):
+    history = query.history + [Conversation(role=RoleEnum.user, content=query.text)]
+    resp = ""
+    async for chunk in stream:
+        delta = _delta_content(chunk)
+        if not delta:
+            continue
+        resp += delta
+        yield LLMPrediction.model_construct(
+            response=resp, history=history + [Conversation.model_construct(role=RoleEnum.assistant, content=resp)])
+    query.history.append(Conversation(role=RoleEnum.user, content=query.text))
+    query.history.append(Conversation(role=RoleEnum.assistant, content=resp))
+
+
+class LLMTokenDelta(BaseModel):
+    delta: str  # 本次新增的文本
+    response: str  # 截至目前的完整回复
+    elapsed: float  # 自请求开始以来经过的秒数
+    ttft: float  # 首 token 延迟（秒）
+
+
+def _next_delta(response: str, text: str) -> tuple[str, str]:
+    # 服务器产出的是累积的回复；若不以已有回复开头，则视为增量
+    if text.startswith(response):
+        return text[len(response):], text
+    return text, response + text
+
+
 class LLMPipeline(CommonModelPipeline):
+    # delta 模式下服务器按 query.id 保存会话历史，不同会话的相同请求不能合并
+    stateful_id = True
 
     def __init__(self, config: LLMPipelineConfig):
         super().__init__(config, "llm")
@@ -47,7 +115,11 @@ class LLMPipeline(CommonModelPipeline):
         # Deepseek API supported
         # Reference: https://api-docs.deepseek.com/zh-cn/
         if self._model in ["moonshot-v1-8k", "deepseek-chat"]:
+            # openai 导入较慢，只在使用远程 API 时才导入
+            from openai import AsyncOpenAI, OpenAI
+
             self._remote_model = OpenAI(api_key=config.api_key, base_url=config.server_url)
+            self._async_remote_model = AsyncOpenAI(api_key=config.api_key, base_url=config.server_url)
             self._remote_api = True
         else:
             self.check_urls()
@@ -79,9 +151,109 @@ class LLMPipeline(CommonModelPipeline):
         else:
             return super().predict(query)
 
+    @pipeline_resolve()
+    async def apredict(self, query: LLMQuery) -> LLMPrediction | None:
+        if self._remote_api:
+            if self._model == "moonshot-v1-8k":
+                def wrapper_kimi(messages):
+                    return self._async_remote_model.chat.completions.create(
+                        model=self._model,
+                        messages=messages,
+                        temperature=0.3
+                    )
+
+                return await _aopenai_predict(query, wrapper_kimi)
+            elif self._model == "deepseek-chat":
+                def wrapper_deepseek(messages):
+                    return self._async_remote_model.chat.completions.create(
+                        model=self._model,
+                        messages=messages,
+                        stream=False
+                    )
+
+                return await _aopenai_predict(query, wrapper_deepseek)
+            else:
+                raise NotImplementedError(f"Unsupported model {self._model}")
+        else:
+            return await super().apredict(query)
+
+    def _remote_stream_kwargs(self) -> dict:
+        if self._model == "moonshot-v1-8k":
+            return {"temperature": 0.3}
+        elif self._model == "deepseek-chat":
+            return {}
+        else:
+            raise NotImplementedError(f"Unsupported model {self._model}")
+
     @pipeline_resolve()
     def stream_predict(self, query: AbstractModelQuery):
-        return super().stream_predict(query)
+        """
+        流式推理，每次产出截至目前的完整回复，最后一次产出后 query.history 会被追加本轮对话。
+        :param query: LLMQuery 实例。
+        :return: LLMPrediction 的 Generator。
+        """
+        if self._remote_api:
+            stream = self._remote_model.chat.completions.create(model=self._model,
+                                                                messages=_to_openai_format(query),
+                                                                stream=True,
+                                                                **self._remote_stream_kwargs())
+            return _openai_stream_predict(query, stream)
+        else:
+            return super().stream_predict(query)
+
+    @pipeline_resolve()
+    async def astream_predict(self, query: AbstractModelQuery):
+        if self._remote_api:
+            stream = await self._async_remote_model.chat.completions.create(model=self._model,
+                                                                            messages=_to_openai_format(query),
+                                                                            stream=True,
+                                                                            **self._remote_stream_kwargs())
+            async for prediction in _aopenai_stream_predict(query, stream):
+                yield prediction
+        else:
+            async for prediction in super().astream_predict(query):
+                yield prediction
+
+    def stream_tokens(self, query: LLMQuery) -> Generator[LLMTokenDelta, None, None]:
+        """
+        以 token 增量的方式流式推理，适合边生成边送入 TTS。
+        :param query: LLMQuery 实例。
+        :return: LLMTokenDelta 的 Generator，其中 ttft 为首 token 延迟。
+        """
+        start = time.perf_counter()
+        response, ttft = "", None
+        for prediction in self.stream_predict(query):
+            delta, response = _next_delta(response, prediction.response)
+            if not delta:
+                continue
+            elapsed = time.perf_counter() - start
+            if ttft is None:
+                ttft = elapsed
+            yield LLMTokenDelta(delta=delta, response=response, elapsed=elapsed, ttft=ttft)
+
+    async def astream_tokens(self, query: LLMQuery) -> AsyncGenerator[LLMTokenDelta, None]:
+        start = time.perf_counter()
+        response, ttft = "", None
+        async for prediction in self.astream_predict(query):
+            delta, response = _next_delta(response, prediction.response)
+            if not delta:
+                continue
+            elapsed = time.perf_counter() - start
+            if ttft is None:
+                ttft = elapsed
+            yield LLMTokenDelta(delta=delta, response=response, elapsed=elapsed, ttft=ttft)
+
+    def open_conversation(self, config=None, token_counter=None, summarizer=None):
+        """
+        打开一个会话，由会话管理对话历史、控制其长度，并保持历史前缀稳定以便命中前缀缓存。
+        :param config: LLMConversationConfig 实例。
+        :param token_counter: 计算文本 token 数的函数。
+        :param summarizer: 接收 (此前的摘要, 被丢弃的对话) 并返回新摘要的函数。
+        :return: LLMConversation 实例。
+        """
+        from zerolan.ump.pipeline.llm_session import LLMConversation
+
+        return LLMConversation(self, config, token_counter, summarizer)
 
     def parse_prediction(self, json_val: str) -> LLMPrediction:
-        return LLMPrediction.model_validate_json(json_val)
+        return decode(LLMPrediction, json_val)
@@ -0,0 +1,175 @@
+import uuid
+from typing import AsyncGenerator, Callable, Generator
+
+from pydantic import BaseModel
+from zerolan.data.pipeline.llm import Conversation, LLMPrediction, LLMQuery, RoleEnum
+
+
+class LLMConversationConfig(BaseModel):
+    system_prompt: str | None = None
+    max_tokens: int | None = 4096  # 每次发送的历史的 token 预算（估算值），None 表示不限制
+    # 超出预算时一次性压缩到预算的这个比例，而不是每轮只丢弃最早的一轮，
+    # 这样历史的前缀能在之后的许多轮中保持不变，服务器或 API 提供商的前缀缓存才能命中
+    compact_ratio: float = 0.5
+    keep_turns: int = 2  # 压缩时至少保留的最近轮数
+    # 仅发送服务器尚未收到的对话，需要服务器按 query.id 保存会话历史，并把 query.history 与本轮对话追加在其后
+    delta: bool = False
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算 token 数：CJK 字符约一个 token，其他字符约四个一个 token。
+    需要精确计数时请为 LLMConversation 提供 token_counter。
+    """
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return cjk + (len(text) - cjk + 3) // 4 + 1
+
+
+Summarizer = Callable[[str | None, list[Conversation]], str]
+
+
+class LLMConversation:
+
+    def __init__(self, pipeline, config: LLMConversationConfig | None = None,
+                 token_counter: Callable[[str], int] | None = None, summarizer: Summarizer | None = None):
+        """
+        会话级的对话历史。
+        历史保存在会话内，每轮构造新的 LLMQuery，不会修改调用方的列表，也不依赖服务器返回的 history。
+        超出 token 预算时按块压缩最早的对话，可选地由 summarizer 把被丢弃的对话总结为一条摘要。
+        请使用 LLMPipeline.open_conversation 创建。
+        :param pipeline: LLMPipeline 实例。
+        :param config: 会话配置。
+        :param token_counter: 计算文本 token 数的函数，默认使用 estimate_tokens。
+        :param summarizer: 接收 (此前的摘要, 被丢弃的对话) 并返回新摘要的函数；为 None 时直接丢弃。
+        """
+        self.pipeline = pipeline
+        self.config = config or LLMConversationConfig()
+        self.token_counter = token_counter or estimate_tokens
+        self.summarizer = summarizer
+        self.id = str(uuid.uuid4())
+        self.summary: str | None = None
+        self.turns: list[Conversation] = []
+        self._turn_tokens: list[int] = []
+        self._prefix: list[Conversation] = []
+        self._prefix_tokens = 0
+        self._synced = 0  # 服务器已保存的消息数，只在 delta 模式下使用
+        self._rebuild_prefix()
+
+    def _rebuild_prefix(self):
+        self._prefix = []
+        if self.config.system_prompt:
+            self._prefix.append(Conversation(role=RoleEnum.system, content=self.config.system_prompt))
+        if self.summary:
+            self._prefix.append(Conversation(role=RoleEnum.system, content=f"此前对话的摘要：{self.summary}"))
+        self._prefix_tokens = sum(self.token_counter(c.content) for c in self._prefix)
+
+    @property
+    def messages(self) -> list[Conversation]:
+        """
+        :return: 下一轮将作为历史发送的全部消息（系统提示、摘要与窗口内的对话）。
+        """
+        return self._prefix + self.turns
+
+    @property
+    def tokens(self) -> int:
+        return self._prefix_tokens + sum(self._turn_tokens)
+
+    def _use_delta(self) -> bool:
+        return self.config.delta and not getattr(self.pipeline, "_remote_api", False)
+
+    def build_query(self, text: str) -> LLMQuery:
+        """
+        构造本轮的 LLMQuery。delta 模式下只包含服务器尚未收到的消息。
+        :param text: 用户的输入。
+        :return: LLMQuery 实例，其 history 是新的列表。
+        """
+        messages = self.messages
+        history = messages[self._synced:] if self._use_delta() else messages
+        # 历史中的对象都已校验过，无需再次校验
+        return LLMQuery.model_construct(id=self.id, text=text, history=list(history))
+
+    def commit(self, text: str, response: str):
+        """
+        记录一轮完成的对话，必要时压缩历史。
+        :param text: 用户的输入。
+        :param response: 模型的回复。
+        """
+        for role, content in ((RoleEnum.user, text), (RoleEnum.assistant, response)):
+            self.turns.append(Conversation(role=role, content=content))
+            self._turn_tokens.append(self.token_counter(content))
+        self._synced = len(self._prefix) + len(self.turns)
+        self._compact()
+
+    def _compact(self):
+        budget = self.config.max_tokens
+        if budget is None or self.tokens <= budget:
+            return
+        target = budget * self.config.compact_ratio
+        keep = 2 * self.config.keep_turns
+        cut, total = 0, self.tokens
+        # 按轮（用户与助手各一条）丢弃，保证历史总是以用户消息开头
+        while total > target and len(self.turns) - cut > keep:
+            total -= sum(self._turn_tokens[cut:cut + 2])
+            cut += 2
+        if cut == 0:
+            return
+        dropped = self.turns[:cut]
+        self.turns = self.turns[cut:]
+        self._turn_tokens = self._turn_tokens[cut:]
+        if self.summarizer is not None:
+            self.summary = self.summarizer(self.summary, dropped)
+        self._rebuild_prefix()
+        # 前缀已经改变，服务器保存的历史不再可用；换一个新的会话 id，否则服务器会把完整历史追加到旧历史之后
+        self.id = str(uuid.uuid4())
+        self._synced = 0
+
+    def reset(self, keep_summary: bool = False):
+        """
+        清空对话历史。
+        :param keep_summary: 是否保留摘要。
+        """
+        self.turns.clear()
+        self._turn_tokens.clear()
+        if not keep_summary:
+            self.summary = None
+        self._rebuild_prefix()
+        self.id = str(uuid.uuid4())
+        self._synced = 0
+
+    def ask(self, text: str) -> LLMPrediction | None:
+        """
+        进行一轮对话。
+        :param text: 用户的输入。
+        :return: LLMPrediction 实例，失败时为 None 且不会记录本轮对话。
+        """
+        prediction = self.pipeline.predict(self.build_query(text))
+        if prediction is not None:
+            self.commit(text, prediction.response)
+        return prediction
+
+    async def aask(self, text: str) -> LLMPrediction | None:
+        prediction = await self.pipeline.apredict(self.build_query(text))
+        if prediction is not None:
+            self.commit(text, prediction.response)
+        return prediction
+
+    def stream_ask(self, text: str) -> Generator:
+        """
+        以 token 增量的方式进行一轮对话，迭代结束后才会记录本轮对话。
+        :param text: 用户的输入。
+        :return: LLMTokenDelta 的 Generator。
+        """
+        response = None
+        for delta in self.pipeline.stream_tokens(self.build_query(text)):
+            response = delta.response
+            yield delta
+        if response is not None:
+            self.commit(text, response)
+
+    async def astream_ask(self, text: str) -> AsyncGenerator:
+        response = None
+        async for delta in self.pipeline.astream_tokens(self.build_query(text)):
+            response = delta.response
+            yield delta
+        if response is not None:
+            self.commit(text, response)
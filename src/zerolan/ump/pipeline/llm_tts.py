@@ -0,0 +1,164 @@
+import asyncio
+import contextvars
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncGenerator, Generator
+
+from pydantic import BaseModel
+from zerolan.data.pipeline.llm import LLMQuery
+from zerolan.data.pipeline.tts import TTSQuery, TTSStreamPrediction
+
+from zerolan.ump.common.utils.text_util import SentenceSegmenter
+from zerolan.ump.pipeline.llm import LLMPipeline
+from zerolan.ump.pipeline.tts import TTSPipeline
+
+_END = object()
+
+
+class LLMToTTSPipelineConfig(BaseModel):
+    lookahead: int = 2  # 正在合成或已合成但尚未播放的句子数上限
+    min_chars: int = 4  # 过短的句子会与下一句合并
+    max_chars: int = 80  # 过长的句子会在分句标点处切开
+
+
+class LLMToTTSPipeline:
+
+    def __init__(self, llm: LLMPipeline, tts: TTSPipeline, config: LLMToTTSPipelineConfig | None = None):
+        """
+        边生成边合成的组合管线。
+        LLM 的 token 流按句子切分后立即送入 TTS，多个句子并发合成，按顺序输出音频，
+        因此首个音频块的延迟约等于生成一句话的时间，而不是整段回复的时间。
+        :param llm: LLMPipeline 实例。
+        :param tts: TTSPipeline 实例。
+        :param config: 组合管线配置。
+        """
+        self.llm = llm
+        self.tts = tts
+        self.config = config or LLMToTTSPipelineConfig()
+
+    def _segmenter(self) -> SentenceSegmenter:
+        return SentenceSegmenter(min_chars=self.config.min_chars, max_chars=self.config.max_chars)
+
+    def stream_predict(self, llm_query: LLMQuery, tts_query: TTSQuery) -> Generator[TTSStreamPrediction, None, None]:
+        """
+        流式推理。每个句子的音频都是一段完整的 TTS 流（拥有各自的 id，并以 is_final=True 的块结尾），
+        播放端可以在收到每句的结束块后立即播放。
+        注意：该方法非异步方法，会阻塞线程。
+        :param llm_query: LLMQuery 实例。
+        :param tts_query: TTSQuery 模板，其中的 text 会被替换为每个句子。
+        :return: TTSStreamPrediction 的 Generator。
+        """
+        segments = queue.Queue()
+        slots = threading.Semaphore(self.config.lookahead)
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=self.config.lookahead, thread_name_prefix="llm-tts")
+
+        def synthesize(text: str, out: queue.Queue):
+            try:
+                for prediction in self.tts.stream_predict(tts_query.model_copy(update={"text": text})):
+                    if stop.is_set():
+                        break
+                    out.put(prediction)
+            except Exception as e:
+                out.put(e)
+            finally:
+                out.put(_END)
+
+        def dispatch(text: str) -> bool:
+            # 合成中的句子数达到上限时等待，从而对 LLM 的读取施加背压
+            while not slots.acquire(timeout=0.1):
+                if stop.is_set():
+                    return False
+            out = queue.Queue()
+            segments.put(out)
+            executor.submit(contextvars.copy_context().run, synthesize, text, out)
+            return True
+
+        def produce():
+            try:
+                segmenter = self._segmenter()
+                for token in self.llm.stream_tokens(llm_query):
+                    for text in segmenter.feed(token.delta):
+                        if not dispatch(text):
+                            return
+                for text in segmenter.flush():
+                    if not dispatch(text):
+                        return
+            except Exception as e:
+                segments.put(e)
+            finally:
+                segments.put(_END)
+
+        producer = threading.Thread(target=contextvars.copy_context().run, args=(produce,), name="llm-tts-producer",
+                                    daemon=True)
+        producer.start()
+        try:
+            while (out := segments.get()) is not _END:
+                if isinstance(out, Exception):
+                    raise out
+                while (item := out.get()) is not _END:
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+                slots.release()
+        finally:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def astream_predict(self, llm_query: LLMQuery,
+                              tts_query: TTSQuery) -> AsyncGenerator[TTSStreamPrediction, None]:
+        """
+        stream_predict 的异步版本，请使用 async for 循环取出其中的值。
+        :param llm_query: LLMQuery 实例。
+        :param tts_query: TTSQuery 模板，其中的 text 会被替换为每个句子。
+        :return: TTSStreamPrediction 的 AsyncGenerator。
+        """
+        segments = asyncio.Queue()
+        slots = asyncio.Semaphore(self.config.lookahead)
+        tasks = set()
+
+        async def synthesize(text: str, out: asyncio.Queue):
+            try:
+                async for prediction in self.tts.astream_predict(tts_query.model_copy(update={"text": text})):
+                    out.put_nowait(prediction)
+            except Exception as e:
+                out.put_nowait(e)
+            finally:
+                out.put_nowait(_END)
+
+        async def dispatch(text: str):
+            await slots.acquire()
+            out = asyncio.Queue()
+            segments.put_nowait(out)
+            task = asyncio.create_task(synthesize(text, out))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        async def produce():
+            try:
+                segmenter = self._segmenter()
+                async for token in self.llm.astream_tokens(llm_query):
+                    for text in segmenter.feed(token.delta):
+                        await dispatch(text)
+                for text in segmenter.flush():
+                    await dispatch(text)
+            except Exception as e:
+                segments.put_nowait(e)
+            finally:
+                segments.put_nowait(_END)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while (out := await segments.get()) is not _END:
+                if isinstance(out, Exception):
+                    raise out
+                while (item := await out.get()) is not _END:
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+                slots.release()
+        finally:
+            producer.cancel()
+            for task in list(tasks):
+                task.cancel()
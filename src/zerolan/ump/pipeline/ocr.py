@@ -1,27 +1,114 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import Future
+from http import HTTPStatus
 from typing import List
+from urllib.parse import urljoin
 
 from pydantic import BaseModel
 from zerolan.data.pipeline.abs_data import AbstractModelQuery
 from zerolan.data.pipeline.ocr import OCRQuery, OCRPrediction, RegionResult
 
 from zerolan.ump.abs_pipeline import AbstractImagePipeline
+from zerolan.ump.common.balancer import LoadBalancerConfig
+from zerolan.ump.common.batching import BatchingConfig, BatchUnsupported, MicroBatcher
 from zerolan.ump.common.decorator import pipeline_resolve
+from zerolan.ump.common.hedging import HedgingConfig
+from zerolan.ump.common.image_cache import ImageCacheConfig
+from zerolan.ump.common.session import HTTPSessionConfig
+from zerolan.ump.common.utils.img_util import ImageEncodeConfig, ImageLike, encode_image
+from zerolan.ump.common.utils.json_util import LazyList, decode, decode_lazy, decode_list
 
 
 class OCRPipelineConfig(BaseModel):
     enable: bool = True
     server_url: str = "http://127.0.0.1:11004"
+    session: HTTPSessionConfig = HTTPSessionConfig()
+    balancer: LoadBalancerConfig = LoadBalancerConfig()
+    single_flight: bool = False  # 合并同时发出的相同请求，重复的请求共享同一个结果
+    image: ImageEncodeConfig = ImageEncodeConfig()
+    cache: ImageCacheConfig = ImageCacheConfig()
+    batching: BatchingConfig = BatchingConfig()
+    hedging: HedgingConfig = HedgingConfig()  # 对冲迟迟没有响应的请求
 
 
 class OCRPipeline(AbstractImagePipeline):
 
     def __init__(self, config: OCRPipelineConfig):
         super().__init__(config, "ocr")
+        self.urls["batch_predict_url"] = urljoin(config.server_url, f"/{self.model_type}/batch-predict")
         self.check_urls()
+        self._batcher: MicroBatcher | None = None
+        self._batcher_lock = threading.Lock()
 
     @pipeline_resolve()
-    def predict(self, query: OCRQuery) -> OCRPrediction | None:
-        return super().predict(query)
+    def predict(self, query: OCRQuery, image: ImageLike | None = None) -> OCRPrediction | None:
+        return super().predict(query, image)
+
+    @pipeline_resolve()
+    async def apredict(self, query: OCRQuery, image: ImageLike | None = None) -> OCRPrediction | None:
+        return await super().apredict(query, image)
+
+    @pipeline_resolve()
+    def predict_regions(self, query: OCRQuery, image: ImageLike | None = None) -> LazyList[RegionResult]:
+        """
+        只返回识别出的区域，且每个区域在访问时才构造为 RegionResult。
+        区域很多而只需要其中一部分时比 predict 更快；不经过结果缓存与请求合并。
+        :param query: OCRQuery 实例。
+        :param image: 可选，内存中的图片。
+        :return: RegionResult 的 LazyList。
+        """
+        response = self._post_image(query, self._load_image(query, image))
+        response.raise_for_status()
+        return decode_lazy(RegionResult, response.content, "region_results")
+
+    @pipeline_resolve()
+    async def apredict_regions(self, query: OCRQuery, image: ImageLike | None = None) -> LazyList[RegionResult]:
+        response = await self._apost_image(query, image if image is not None else
+                                           await asyncio.to_thread(self._load_image, query, None))
+        response.raise_for_status()
+        return decode_lazy(RegionResult, response.content, "region_results")
+
+    def submit(self, query: OCRQuery, image: ImageLike | None = None) -> Future:
+        """
+        提交一个 OCR 请求，短时间内提交的多个请求会被合并为一次批量请求。
+        适合一次性识别大量区域的场景。
+        :param query: OCRQuery 实例。
+        :param image: 可选，内存中的图片。
+        :return: OCRPrediction 的 Future。
+        """
+        with self._batcher_lock:
+            if self._batcher is None:
+                self._batcher = MicroBatcher(single_fn=lambda item: self.predict(*item),
+                                             batch_fn=self._batch_predict,
+                                             config=self.config.batching,
+                                             # 只存在于远程主机上的图片无法随批量请求上传，单独发送
+                                             key_fn=lambda item: () if item[1] is not None else None,
+                                             name="ocr-batcher")
+        return self._batcher.submit((query, self._load_image(query, image)))
+
+    def _batch_predict(self, items: list[tuple[OCRQuery, ImageLike | None]]) -> list[OCRPrediction]:
+        # 批量接口：多个 images 文件按顺序对应 json 字段中的 Query 列表，返回 OCRPrediction 列表
+        files, queries = [], []
+        for query, image in items:
+            files.append(('images', encode_image(image, self.image_config)))
+            queries.append(query.model_dump(mode="json"))
+        response = self._request("POST", "batch_predict_url", files=files, data={'json': json.dumps(queries)})
+        if response.status_code in (HTTPStatus.NOT_FOUND, HTTPStatus.METHOD_NOT_ALLOWED):
+            raise BatchUnsupported()
+        response.raise_for_status()
+        return decode_list(OCRPrediction, response.content)
+
+    def close(self):
+        """
+        关闭微批处理调度器，已提交的请求仍会被发送。
+        """
+        with self._batcher_lock:
+            batcher, self._batcher = self._batcher, None
+        if batcher is not None:
+            batcher.close()
+        super().close()
 
     @pipeline_resolve()
     def stream_predict(self, query: AbstractModelQuery):
@@ -31,7 +118,7 @@ class OCRPipeline(AbstractImagePipeline):
         return super().parse_query(query)
 
     def parse_prediction(self, json_val: str) -> OCRPrediction:
-        return OCRPrediction.model_validate_json(json_val)
+        return decode(OCRPrediction, json_val)
 
 
 def avg_confidence(p: OCRPrediction) -> float:
@@ -0,0 +1,155 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Literal
+
+from loguru import logger
+from pydantic import BaseModel
+from zerolan.data.pipeline.img_cap import ImgCapPrediction, ImgCapQuery
+from zerolan.data.pipeline.ocr import OCRPrediction, OCRQuery
+from zerolan.data.pipeline.vla import ShowUiPrediction, ShowUiQuery
+
+from zerolan.ump.common.utils.img_util import ImageEncodeConfig, ImageLike, encode_image
+from zerolan.ump.pipeline.img_cap import ImgCapPipeline
+from zerolan.ump.pipeline.ocr import OCRPipeline
+from zerolan.ump.pipeline.vla import ShowUIPipeline
+
+Branch = Literal["ocr", "img_cap", "showui"]
+
+
+class PerceptionPipelineConfig(BaseModel):
+    # 各分支的截止时间（秒，从调用开始计时），None 表示一直等待
+    ocr_deadline: float | None = 2.0
+    img_cap_deadline: float | None = 3.0
+    showui_deadline: float | None = 3.0
+    # 分发前统一编码一次，各分支直接上传编码后的图片；各分支管线自身的 image 配置应保持默认，否则会再次转码
+    image: ImageEncodeConfig = ImageEncodeConfig()
+    max_workers: int = 6  # 超时的分支仍会占用线程直到完成，因此多于分支数
+
+
+class PerceptionResult(BaseModel):
+    ocr: OCRPrediction | None = None
+    img_cap: ImgCapPrediction | None = None
+    showui: ShowUiPrediction | None = None
+    timed_out: list[str] = []  # 超过截止时间而被放弃的分支
+    errors: dict[str, str] = {}  # 出错的分支及其异常信息
+    elapsed: dict[str, float] = {}  # 按时完成的分支各自的耗时（秒）
+
+
+class PerceptionPipeline:
+
+    def __init__(self, ocr: OCRPipeline | None = None, img_cap: ImgCapPipeline | None = None,
+                 showui: ShowUIPipeline | None = None, config: PerceptionPipelineConfig | None = None):
+        """
+        并行分发的多模态感知组合管线。
+        同一帧画面只编码一次，随后同时发送给所选的图片管线，每个分支有各自的截止时间，
+        返回按时完成的分支合并后的结果，因此感知延迟取决于最慢的分支而不是各分支之和。
+        :param ocr: OCRPipeline 实例。
+        :param img_cap: ImgCapPipeline 实例。
+        :param showui: ShowUIPipeline 实例。
+        :param config: 组合管线配置。
+        """
+        self.pipelines = {"ocr": ocr, "img_cap": img_cap, "showui": showui}
+        self.config = config or PerceptionPipelineConfig()
+        self._executor = ThreadPoolExecutor(max_workers=self.config.max_workers,
+                                            thread_name_prefix="perception")
+
+    def _deadline(self, branch: Branch) -> float | None:
+        return getattr(self.config, f"{branch}_deadline")
+
+    def _branches(self, ocr_query: OCRQuery | None, img_cap_query: ImgCapQuery | None,
+                  showui_query: ShowUiQuery | None) -> dict[str, tuple]:
+        # OCR 与图像描述的请求都有默认值；ShowUI 需要指令，只在提供了请求时才分发
+        queries = {"ocr": ocr_query or OCRQuery(), "img_cap": img_cap_query or ImgCapQuery(),
+                   "showui": showui_query}
+        return {branch: (pipeline, queries[branch]) for branch, pipeline in self.pipelines.items()
+                if pipeline is not None and queries[branch] is not None}
+
+    def _encode(self, image: ImageLike) -> ImageLike:
+        _, data, _ = encode_image(image, self.config.image)
+        return data if isinstance(data, bytes) or data is image else bytes(data)
+
+    @staticmethod
+    def _record(result: PerceptionResult, branch: str, outcome, elapsed: float):
+        if isinstance(outcome, BaseException):
+            logger.warning(f"感知分支 {branch} 出错：{outcome}")
+            result.errors[branch] = f"{type(outcome).__name__}: {outcome}"
+        else:
+            setattr(result, branch, outcome)
+            result.elapsed[branch] = elapsed
+
+    def predict(self, image: ImageLike, ocr_query: OCRQuery | None = None,
+                img_cap_query: ImgCapQuery | None = None,
+                showui_query: ShowUiQuery | None = None) -> PerceptionResult:
+        """
+        感知一帧画面。
+        超时的分支不会被中断，其结果在完成后被丢弃。
+        注意：该方法非异步方法，会阻塞线程。
+        :param image: 内存中的图片（已编码的字节或 NumPy 数组）。
+        :param ocr_query: OCRQuery 实例，默认使用空请求。
+        :param img_cap_query: ImgCapQuery 实例，默认使用空请求。
+        :param showui_query: ShowUiQuery 实例，为 None 时不分发 ShowUI。
+        :return: PerceptionResult 实例。
+        """
+        start = time.perf_counter()
+        image = self._encode(image)
+        finished: dict[str, float] = {}
+
+        def run(branch: str, pipeline, query):
+            try:
+                return pipeline.predict(query, image)
+            finally:
+                finished[branch] = time.perf_counter() - start
+
+        futures: dict[str, Future] = {
+            branch: self._executor.submit(contextvars.copy_context().run, run, branch, pipeline, query)
+            for branch, (pipeline, query) in self._branches(ocr_query, img_cap_query, showui_query).items()
+        }
+        result = PerceptionResult()
+        for branch, future in futures.items():
+            deadline = self._deadline(branch)
+            timeout = None if deadline is None else max(0.0, start + deadline - time.perf_counter())
+            done, _ = wait([future], timeout=timeout)
+            if not done:
+                result.timed_out.append(branch)
+                continue
+            self._record(result, branch, future.exception() or future.result(), finished.get(branch, 0.0))
+        return result
+
+    async def apredict(self, image: ImageLike, ocr_query: OCRQuery | None = None,
+                       img_cap_query: ImgCapQuery | None = None,
+                       showui_query: ShowUiQuery | None = None) -> PerceptionResult:
+        """
+        predict 的异步版本，超时的分支会被取消。
+        """
+        start = time.perf_counter()
+        image = await asyncio.to_thread(self._encode, image)
+        finished: dict[str, float] = {}
+
+        async def run(branch: str, pipeline, query):
+            try:
+                return await pipeline.apredict(query, image)
+            finally:
+                finished[branch] = time.perf_counter() - start
+
+        tasks = {branch: asyncio.ensure_future(run(branch, pipeline, query))
+                 for branch, (pipeline, query) in self._branches(ocr_query, img_cap_query, showui_query).items()}
+        result = PerceptionResult()
+        try:
+            for branch, task in tasks.items():
+                deadline = self._deadline(branch)
+                timeout = None if deadline is None else max(0.0, start + deadline - time.perf_counter())
+                done, _ = await asyncio.wait({task}, timeout=timeout)
+                if not done:
+                    task.cancel()
+                    result.timed_out.append(branch)
+                    continue
+                self._record(result, branch, task.exception() or task.result(), finished.get(branch, 0.0))
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        return result
+
+    def close(self):
+        self._executor.shutdown(wait=False)
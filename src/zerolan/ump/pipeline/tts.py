@@ -1,17 +1,34 @@
+import asyncio
 import os.path
 import uuid
+from typing import AsyncGenerator, Generator, Literal
 
-import requests
 from pydantic import BaseModel
 from zerolan.data.pipeline.tts import TTSQuery, TTSPrediction, TTSStreamPrediction
 
 from zerolan.ump.abs_pipeline import CommonModelPipeline
+from zerolan.ump.common.audio_cache import TTSAudioCache, TTSCacheConfig
+from zerolan.ump.common.balancer import LoadBalancerConfig
 from zerolan.ump.common.decorator import pipeline_resolve
+from zerolan.ump.common.playback import JitterBuffer, JitterEstimator, PlaybackConfig, PlaybackFrame
+from zerolan.ump.common.session import HTTPSessionConfig
+from zerolan.ump.common.singleflight import query_key
+from zerolan.ump.common.utils.framing import FRAME_CONTENT_TYPE, AudioCodec, AudioFrame, BufferPool, read_frames, \
+    read_raw_frames
+from zerolan.ump.common.utils.json_util import decode
 
 
 class TTSPipelineConfig(BaseModel):
     enable: bool = True
     server_url: str = "http://127.0.0.1:11006"
+    session: HTTPSessionConfig = HTTPSessionConfig()
+    balancer: LoadBalancerConfig = LoadBalancerConfig()
+    single_flight: bool = False  # 合并同时发出的相同请求，重复的请求共享同一个结果
+    # binary 表示在 stream_frames 中请求服务器以长度前缀的二进制帧返回音频
+    transport: Literal["raw", "binary"] = "raw"
+    chunk_size: int = 4096  # stream_frames 读取原始音频流时每帧的字节数
+    cache: TTSCacheConfig = TTSCacheConfig()
+    playback: PlaybackConfig = PlaybackConfig()  # stream_playback 的帧长与抖动缓冲
 
 
 class TTSPipeline(CommonModelPipeline):
@@ -19,18 +36,88 @@ class TTSPipeline(CommonModelPipeline):
     def __init__(self, config: TTSPipelineConfig):
         super().__init__(config, "tts")
         self.check_urls()
+        self._pool = BufferPool(config.chunk_size)
+        self.cache = TTSAudioCache(config.cache) if config.cache.enable else None
+        self.jitter = JitterEstimator(config.playback)
+
+    def _cached_prediction(self, query: TTSQuery) -> tuple[str | None, TTSPrediction | None]:
+        if self.cache is None:
+            return None, None
+        key = self.cache.key(query)
+        wave_data = self.cache.read(key)
+        if wave_data is None:
+            return key, None
+        return key, TTSPrediction(id=str(uuid.uuid4()), wave_data=wave_data, audio_type=query.audio_type)
+
+    def _cached_replay(self, query: TTSQuery) -> tuple[str, Generator[TTSStreamPrediction, None, None] | None]:
+        key = self.cache.key(query)
+        return key, self.cache.replay(key, query.audio_type)
+
+    def _to_prediction(self, query: TTSQuery, response) -> TTSPrediction:
+        # 服务器可能直接返回音频，也可能返回 JSON 格式的 TTSPrediction
+        if response.headers.get("Content-Type", "").startswith("application/json"):
+            return self.parse_prediction(response.content)
+        return TTSPrediction(id=str(uuid.uuid4()), wave_data=response.content, audio_type=query.audio_type)
 
     @pipeline_resolve()
     def predict(self, query: TTSQuery) -> TTSPrediction | None:
         if os.path.exists(query.refer_wav_path):
             query.refer_wav_path = os.path.abspath(query.refer_wav_path)
-        return super().predict(query)
+        key, prediction = self._cached_prediction(query)
+        if prediction is not None:
+            return prediction
+        response = self._request("POST", "predict_url", json=self.parse_query(query))
+        response.raise_for_status()
+        prediction = self._to_prediction(query, response)
+        if key is not None:
+            self.cache.put(key, [prediction.wave_data])
+        return prediction
+
+    @pipeline_resolve()
+    async def apredict(self, query: TTSQuery) -> TTSPrediction | None:
+        if os.path.exists(query.refer_wav_path):
+            query.refer_wav_path = os.path.abspath(query.refer_wav_path)
+        key, prediction = await asyncio.to_thread(self._cached_prediction, query)
+        if prediction is not None:
+            return prediction
+        response = await self._arequest("POST", "predict_url", json=self.parse_query(query))
+        response.raise_for_status()
+        prediction = self._to_prediction(query, response)
+        if key is not None:
+            await asyncio.to_thread(self.cache.put, key, [prediction.wave_data])
+        return prediction
 
     @pipeline_resolve()
     def stream_predict(self, query: TTSQuery):
+        key = None
+        if self.cache is not None:
+            key, replay = self._cached_replay(query)
+            if replay is not None:
+                # 命中时直接从磁盘重放，不发出请求
+                yield from replay
+                return
+        if self.flight is None:
+            yield from self._recorded(key, self._stream_predictions(query))
+        else:
+            yield from self.flight.stream(query_key(query),
+                                          lambda: self._recorded(key, self._stream_predictions(query)))
+
+    def _recorded(self, key: str | None, stream: Generator[TTSStreamPrediction, None, None]):
+        # 只有完整读到最后一块时才写入缓存，中途退出或出错的流不会留下残缺的音频
+        if key is None:
+            yield from stream
+            return
+        chunks = []
+        for prediction in stream:
+            if prediction.is_final:
+                self.cache.put(key, chunks)
+            else:
+                chunks.append(prediction.wave_data)
+            yield prediction
+
+    def _stream_predictions(self, query: TTSQuery):
         query_dict = self.parse_query(query)
-        response = requests.post(url=self.urls["stream_predict_url"], stream=True,
-                                 json=query_dict)
+        response = self._request("POST", "stream_predict_url", stream=True, json=query_dict)
         response.raise_for_status()
         last = 0
         id = str(uuid.uuid4())
@@ -41,10 +128,106 @@ class TTSPipeline(CommonModelPipeline):
                                       is_final=False,
                                       wave_data=chunk,
                                       audio_type=query.audio_type)
-        yield TTSStreamPrediction(is_final=True, seq=last + 1, audio_type=query.audio_type, wave_data=b'')
+        yield TTSStreamPrediction(is_final=True, seq=last + 1, id=id, audio_type=query.audio_type, wave_data=b'')
+
+    @pipeline_resolve()
+    async def astream_predict(self, query: TTSQuery):
+        key = None
+        if self.cache is not None:
+            # 计算参考音频的摘要与打开缓存文件都是磁盘 IO，不在事件循环中进行
+            key, replay = await asyncio.to_thread(self._cached_replay, query)
+            if replay is not None:
+                for prediction in replay:
+                    yield prediction
+                return
+        if self.flight is None:
+            stream = self._arecorded(key, self._astream_predictions(query))
+        else:
+            stream = self.flight.astream(query_key(query),
+                                         lambda: self._arecorded(key, self._astream_predictions(query)))
+        async for prediction in stream:
+            yield prediction
+
+    async def _arecorded(self, key: str | None, stream):
+        chunks = []
+        async for prediction in stream:
+            if key is not None:
+                if prediction.is_final:
+                    await asyncio.to_thread(self.cache.put, key, chunks)
+                else:
+                    chunks.append(prediction.wave_data)
+            yield prediction
+
+    async def _astream_predictions(self, query: TTSQuery):
+        query_dict = self.parse_query(query)
+        async with self._astream("POST", "stream_predict_url", json=query_dict) as response:
+            if response.is_error:
+                await response.aread()
+            response.raise_for_status()
+            last = 0
+            id = str(uuid.uuid4())
+            idx = 0
+            async for chunk in response.aiter_bytes(chunk_size=1024):
+                last = idx
+                yield TTSStreamPrediction(seq=idx,
+                                          id=id,
+                                          is_final=False,
+                                          wave_data=chunk,
+                                          audio_type=query.audio_type)
+                idx += 1
+        yield TTSStreamPrediction(is_final=True, seq=last + 1, id=id, audio_type=query.audio_type, wave_data=b'')
+
+    @pipeline_resolve()
+    def stream_frames(self, query: TTSQuery) -> Generator[AudioFrame, None, None]:
+        """
+        低开销的流式推理，直接产出 AudioFrame 而不是 TTSStreamPrediction。
+        音频被读入预分配的缓冲区池，不为每个块创建 pydantic 实例或 UUID。
+        注意：frame.payload 只在取得下一帧之前有效，如需保留请使用 bytes(frame.payload)。
+        服务器返回原始音频流时，WAV 的采样率与声道数从文件头中读取，其他格式无法得知，均为 0。
+        :param query: TTSQuery 实例。
+        :return: AudioFrame 的 Generator，最后一帧的 is_final 为 True。
+        """
+        headers = {"Accept": f"{FRAME_CONTENT_TYPE}, */*"} if self.config.transport == "binary" else None
+        response = self._request("POST", "stream_predict_url", stream=True, json=self.parse_query(query),
+                                 headers=headers)
+        with response:
+            # 在 with 内检查状态码，出错时连接同样会被释放
+            response.raise_for_status()
+            # 直接读取 response.raw 时 requests 不会解压，经过压缩的代理时需要由 urllib3 按 Content-Encoding 解码
+            response.raw.decode_content = True
+            if response.headers.get("Content-Type", "").startswith(FRAME_CONTENT_TYPE):
+                yield from read_frames(response.raw, self._pool)
+            else:
+                yield from read_raw_frames(response.raw, AudioCodec.from_name(query.audio_type), 0, 0, self._pool)
+
+    def _jitter_buffer(self) -> JitterBuffer:
+        return JitterBuffer(self.config.playback, self.jitter, self.metrics, (("model_type", self.model_type),))
+
+    def stream_playback(self, query: TTSQuery) -> Generator[PlaybackFrame, None, None]:
+        """
+        面向播放的流式推理。
+        合成的 WAV 音频被切分为 playback.frame_ms 的 PCM 帧，经过抖动缓冲后按播放时钟产出，
+        调用方只需把 frame.pcm 依次写入声卡。开始播放前缓冲的时长根据以往各次合成的到达时间自适应调整。
+        注意：该方法非异步方法，会阻塞线程。
+        :param query: TTSQuery 实例，audio_type 需为 wav。
+        :return: PlaybackFrame 的 Generator。
+        """
+        chunks = (prediction.wave_data for prediction in self.stream_predict(query))
+        yield from self._jitter_buffer().play(chunks)
+
+    async def astream_playback(self, query: TTSQuery) -> AsyncGenerator[PlaybackFrame, None]:
+        """
+        stream_playback 的异步版本，请使用 async for 循环取出其中的值。
+        """
+        async def chunks():
+            async for prediction in self.astream_predict(query):
+                yield prediction.wave_data
+
+        async for frame in self._jitter_buffer().aplay(chunks()):
+            yield frame
 
     def parse_query(self, query: any) -> dict:
         return super().parse_query(query)
 
-    def parse_prediction(self, prediction: any) -> TTSPrediction:
-        raise NotImplementedError()
+    def parse_prediction(self, json_val: any) -> TTSPrediction:
+        return decode(TTSPrediction, json_val)
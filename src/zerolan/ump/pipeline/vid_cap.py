@@ -1,19 +1,64 @@
+import asyncio
+import contextvars
+import json
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncGenerator, Generator, Iterable, Iterator
+from urllib.parse import urljoin
 
 from pydantic import BaseModel
 from zerolan.data.pipeline.abs_data import AbstractModelQuery
 from zerolan.data.pipeline.vid_cap import VidCapQuery, VidCapPrediction
 
-from zerolan.ump.abs_pipeline import CommonModelPipeline
+from zerolan.ump.abs_pipeline import AbstractPipeline, CommonModelPipeline
+from zerolan.ump.common.balancer import LoadBalancerConfig
 from zerolan.ump.common.decorator import pipeline_resolve
+from zerolan.ump.common.session import HTTPSessionConfig
+from zerolan.ump.common.utils.img_util import ImageEncodeConfig, ImageLike, encode_image
+from zerolan.ump.common.utils.json_util import decode
+from zerolan.ump.common.utils.video_util import sample_keyframes
+
+# (时间戳（秒）, 图片) 组成的帧序列
+Frames = Iterable[tuple[float, ImageLike]]
+
+
+class VideoSamplingConfig(BaseModel):
+    fps: float = 1.0  # 每秒抽取的关键帧数
+    segment_seconds: float = 10.0  # 每段的时长，每段得到一条描述
+    max_frames: int = 16  # 每段上传的帧数上限，超出的帧被丢弃
+    max_resolution: int | None = 768  # 关键帧最长边的像素数
+    quality: int = 85  # 关键帧的 JPEG 压缩质量
+    image: ImageEncodeConfig = ImageEncodeConfig()  # 由调用方提供的帧的编码方式
 
 
 class VidCapPipelineConfig(BaseModel):
     enable: bool = True
     server_url: str = "http://127.0.0.1:11005"
+    session: HTTPSessionConfig = HTTPSessionConfig()
+    balancer: LoadBalancerConfig = LoadBalancerConfig()
+    sampling: VideoSamplingConfig = VideoSamplingConfig()
+
+
+class VidCapSegmentPrediction(VidCapPrediction):
+    index: int  # 段的序号，从 0 开始
+    start: float  # 段的起止时间（秒）
+    end: float
+    frames: int  # 实际上传的帧数
+
+
+class _Segment:
+    __slots__ = ("index", "start", "end", "frames")
+
+    def __init__(self, index: int, start: float, end: float):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.frames: list[ImageLike] = []
 
 
 class VidCapPipeline(CommonModelPipeline):
+    # 同一段重复描述不会产生副作用
+    idempotent_urls = AbstractPipeline.idempotent_urls | {"segment_predict_url"}
 
     def __init__(self, config: VidCapPipelineConfig):
         """
@@ -21,6 +66,7 @@ class VidCapPipeline(CommonModelPipeline):
         :param config:
         """
         super().__init__(config, "vid-cap")
+        self.urls["segment_predict_url"] = urljoin(config.server_url, f"/{self.model_type}/segment-predict")
         self.check_urls()
 
     @pipeline_resolve()
@@ -28,9 +74,159 @@ class VidCapPipeline(CommonModelPipeline):
         assert os.path.exists(query.vid_path), f"视频路径不存在：{query.vid_path}"
         return super().predict(query)
 
+    @pipeline_resolve()
+    async def apredict(self, query: VidCapQuery) -> VidCapPrediction | None:
+        assert os.path.exists(query.vid_path), f"视频路径不存在：{query.vid_path}"
+        return await super().apredict(query)
+
     @pipeline_resolve()
     def stream_predict(self, query: AbstractModelQuery):
         raise NotImplementedError()
 
+    def _load_checkpoint(self, checkpoint: str | None) -> dict[int, VidCapSegmentPrediction]:
+        if checkpoint is None or not os.path.exists(checkpoint):
+            return {}
+        done = {}
+        with open(checkpoint, "r", encoding="utf-8") as f:
+            for line in f:
+                # 写到一半就中断的最后一行直接忽略
+                try:
+                    segment = VidCapSegmentPrediction.model_validate_json(line)
+                except ValueError:
+                    continue
+                done[segment.index] = segment
+        return done
+
+    @staticmethod
+    def _save_segment(checkpoint: str | None, segment: VidCapSegmentPrediction):
+        if checkpoint is None:
+            return
+        with open(checkpoint, "a", encoding="utf-8") as f:
+            f.write(segment.model_dump_json() + "\n")
+
+    def _frames(self, query: VidCapQuery, frames: Frames | None, done: dict) -> tuple[Frames, float]:
+        if frames is not None:
+            return frames, 0.0
+        # 从连续完成的段之后开始抽帧，已描述的部分无需再次解码
+        resumed = 0
+        while resumed in done:
+            resumed += 1
+        start = resumed * self.config.sampling.segment_seconds
+        sampling = self.config.sampling
+        return sample_keyframes(query.vid_path, sampling.fps, sampling.max_resolution, sampling.quality, start), start
+
+    def _segments(self, frames: Frames) -> Iterator[_Segment]:
+        length = self.config.sampling.segment_seconds
+        current: _Segment | None = None
+        for timestamp, frame in frames:
+            index = int(timestamp // length)
+            if current is not None and index != current.index:
+                yield current
+                current = None
+            if current is None:
+                current = _Segment(index, index * length, (index + 1) * length)
+            if len(current.frames) < self.config.sampling.max_frames:
+                current.frames.append(frame)
+        if current is not None:
+            yield current
+
+    def _segment_payload(self, query: VidCapQuery, segment: _Segment) -> tuple[list, dict]:
+        files = []
+        for i, frame in enumerate(segment.frames):
+            filename, data, mime = encode_image(frame, self.config.sampling.image)
+            # httpx 不接受 memoryview
+            files.append(("images", (f"{i}-{filename}", bytes(data), mime)))
+        info = {"index": segment.index, "start": segment.start, "end": segment.end}
+        return files, {"json": query.model_dump_json(), "segment": json.dumps(info)}
+
+    def _segment_prediction(self, segment: _Segment, content: bytes) -> VidCapSegmentPrediction:
+        prediction = decode(VidCapPrediction, content)
+        return VidCapSegmentPrediction(**prediction.model_dump(), index=segment.index, start=segment.start,
+                                       end=segment.end, frames=len(segment.frames))
+
+    def _predict_segment(self, query: VidCapQuery, segment: _Segment) -> VidCapSegmentPrediction:
+        files, data = self._segment_payload(query, segment)
+        response = self._request("POST", "segment_predict_url", files=files, data=data)
+        response.raise_for_status()
+        return self._segment_prediction(segment, response.content)
+
+    @pipeline_resolve()
+    def stream_segments(self, query: VidCapQuery, frames: Frames | None = None,
+                        checkpoint: str | None = None) -> Generator[VidCapSegmentPrediction, None, None]:
+        """
+        分段描述长视频。
+        在客户端按 sampling.fps 抽取关键帧，每 sampling.segment_seconds 秒为一段，把该段的关键帧作为图片序列上传，
+        按顺序逐段产出描述。上传一段的同时抽取下一段，内存中最多只有两段的关键帧，与视频长度无关。
+        指定 checkpoint 时，每完成一段都会追加到该文件；失败后以同一文件重新调用，已完成的段直接从文件中产出而不再上传。
+        注意：该方法非异步方法，会阻塞线程。
+        :param query: VidCapQuery 实例。
+        :param frames: 可选，(时间戳, 图片) 的序列，例如来自屏幕录制；为 None 时从 query.vid_path 抽帧，需要 OpenCV。
+        :param checkpoint: 断点文件的路径。
+        :return: VidCapSegmentPrediction 的 Generator。
+        """
+        done = self._load_checkpoint(checkpoint)
+        frames, start = self._frames(query, frames, done)
+        yield from (done[i] for i in sorted(done) if done[i].start < start)
+        pending: Future | None = None
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="vid-cap-upload") as executor:
+            for segment in self._segments(frames):
+                submitted = None if segment.index in done else \
+                    executor.submit(contextvars.copy_context().run, self._predict_segment, query, segment)
+                if pending is not None:
+                    result = pending.result()
+                    pending = None
+                    self._save_segment(checkpoint, result)
+                    yield result
+                if submitted is None:
+                    yield done[segment.index]
+                else:
+                    pending = submitted
+            if pending is not None:
+                result = pending.result()
+                self._save_segment(checkpoint, result)
+                yield result
+
+    async def _apredict_segment(self, query: VidCapQuery, segment: _Segment) -> VidCapSegmentPrediction:
+        files, data = await asyncio.to_thread(self._segment_payload, query, segment)
+        response = await self._arequest("POST", "segment_predict_url", files=files, data=data)
+        response.raise_for_status()
+        return self._segment_prediction(segment, response.content)
+
+    @pipeline_resolve()
+    async def astream_segments(self, query: VidCapQuery, frames: Frames | None = None,
+                               checkpoint: str | None = None) -> AsyncGenerator[VidCapSegmentPrediction, None]:
+        """
+        stream_segments 的异步版本，抽帧在线程中进行，不会阻塞事件循环。
+        """
+        done = await asyncio.to_thread(self._load_checkpoint, checkpoint)
+        frames, start = self._frames(query, frames, done)
+        for i in sorted(done):
+            if done[i].start < start:
+                yield done[i]
+        segments = self._segments(frames)
+        end = object()
+        pending: asyncio.Task | None = None
+        try:
+            while (segment := await asyncio.to_thread(next, segments, end)) is not end:
+                task = None if segment.index in done else \
+                    asyncio.ensure_future(self._apredict_segment(query, segment))
+                if pending is not None:
+                    result = await pending
+                    pending = None
+                    await asyncio.to_thread(self._save_segment, checkpoint, result)
+                    yield result
+                if task is None:
+                    yield done[segment.index]
+                else:
+                    pending = task
+            if pending is not None:
+                result = await pending
+                pending = None
+                await asyncio.to_thread(self._save_segment, checkpoint, result)
+                yield result
+        finally:
+            if pending is not None:
+                pending.cancel()
+
     def parse_prediction(self, json_val: any) -> VidCapPrediction:
-        return VidCapPrediction.model_validate(json_val)
+        return decode(VidCapPrediction, json_val)
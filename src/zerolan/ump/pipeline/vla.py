@@ -2,12 +2,22 @@ from pydantic import BaseModel
 from zerolan.data.pipeline.vla import ShowUiQuery, ShowUiPrediction
 
 from zerolan.ump.abs_pipeline import AbstractImagePipeline
+from zerolan.ump.common.balancer import LoadBalancerConfig
 from zerolan.ump.common.decorator import pipeline_resolve
+from zerolan.ump.common.image_cache import ImageCacheConfig
+from zerolan.ump.common.session import HTTPSessionConfig
+from zerolan.ump.common.utils.img_util import ImageEncodeConfig, ImageLike
+from zerolan.ump.common.utils.json_util import decode
 
 
 class ShowUIConfig(BaseModel):
     enable: bool = True
     server_url: str = "http://127.0.0.1:11009"
+    session: HTTPSessionConfig = HTTPSessionConfig()
+    balancer: LoadBalancerConfig = LoadBalancerConfig()
+    single_flight: bool = False  # 合并同时发出的相同请求，重复的请求共享同一个结果
+    image: ImageEncodeConfig = ImageEncodeConfig()
+    cache: ImageCacheConfig = ImageCacheConfig()
 
 
 class ShowUIPipeline(AbstractImagePipeline):
@@ -17,8 +27,12 @@ class ShowUIPipeline(AbstractImagePipeline):
         self.check_urls()
 
     @pipeline_resolve()
-    def predict(self, query: ShowUiQuery) -> ShowUiPrediction | None:
-        return super().predict(query)
+    def predict(self, query: ShowUiQuery, image: ImageLike | None = None) -> ShowUiPrediction | None:
+        return super().predict(query, image)
+
+    @pipeline_resolve()
+    async def apredict(self, query: ShowUiQuery, image: ImageLike | None = None) -> ShowUiPrediction | None:
+        return await super().apredict(query, image)
 
     def stream_predict(self, query: ShowUiQuery):
         raise NotImplementedError()
@@ -27,4 +41,4 @@ class ShowUIPipeline(AbstractImagePipeline):
         return super().parse_query(query=query)
 
     def parse_prediction(self, json_val: any) -> ShowUiPrediction:
-        return ShowUiPrediction.model_validate_json(json_val)
+        return decode(ShowUiPrediction, json_val)
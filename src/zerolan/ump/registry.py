@@ -0,0 +1,120 @@
+import importlib
+import inspect
+import threading
+import typing
+
+ENTRY_POINT_GROUP = "zerolan.ump.pipelines"
+
+# model_type -> (模块, 管线类名, 配置类名)，只在第一次使用时导入
+_BUILTIN_PIPELINES: dict[str, tuple[str, str, str]] = {
+    "asr": ("zerolan.ump.pipeline.asr", "ASRPipeline", "ASRPipelineConfig"),
+    "llm": ("zerolan.ump.pipeline.llm", "LLMPipeline", "LLMPipelineConfig"),
+    "tts": ("zerolan.ump.pipeline.tts", "TTSPipeline", "TTSPipelineConfig"),
+    "ocr": ("zerolan.ump.pipeline.ocr", "OCRPipeline", "OCRPipelineConfig"),
+    "img-cap": ("zerolan.ump.pipeline.img_cap", "ImgCapPipeline", "ImgCapPipelineConfig"),
+    "vid-cap": ("zerolan.ump.pipeline.vid_cap", "VidCapPipeline", "VidCapPipelineConfig"),
+    "vla/showui": ("zerolan.ump.pipeline.vla", "ShowUIPipeline", "ShowUIConfig"),
+    "milvus": ("zerolan.ump.pipeline.database", "MilvusPipeline", "MilvusDatabaseConfig"),
+}
+
+_registered: dict[str, tuple[type, type | None] | str] = {}
+_resolved: dict[str, tuple[type, type | None]] = {}
+_lock = threading.Lock()
+_entry_points_loaded = False
+
+
+def register_pipeline(model_type: str, pipeline: type | str, config: type | None = None):
+    """
+    注册一个管线，之后即可通过 model_type 创建。
+    第三方包也可以在 entry_points 的 "zerolan.ump.pipelines" 组中声明，名称为 model_type，值为管线类。
+    :param model_type: 模型类型，例如 "asr"。
+    :param pipeline: 管线类，或 "模块:类名" 形式的字符串（此时在第一次使用时才导入）。
+    :param config: 配置类，为 None 时从管线 __init__ 的 config 参数的类型注解推断。
+    """
+    with _lock:
+        _registered[model_type] = pipeline if isinstance(pipeline, str) else (pipeline, config)
+        _resolved.pop(model_type, None)
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    from importlib.metadata import entry_points
+
+    for ep in entry_points(group=ENTRY_POINT_GROUP):
+        # 显式注册的管线优先于 entry points
+        _registered.setdefault(ep.name, ep.value)
+
+
+def _import(target: str):
+    module_name, _, attr = target.partition(":")
+    obj = importlib.import_module(module_name)
+    for part in attr.split(".") if attr else ():
+        obj = getattr(obj, part)
+    return obj
+
+
+def _infer_config(pipeline: type) -> type | None:
+    try:
+        hints = typing.get_type_hints(pipeline.__init__)
+    except Exception:
+        return None
+    config = hints.get("config")
+    return config if inspect.isclass(config) else None
+
+
+def resolve_pipeline(model_type: str) -> tuple[type, type | None]:
+    """
+    :param model_type: 模型类型。
+    :return: (管线类, 配置类)，配置类无法确定时为 None。
+    """
+    resolved = _resolved.get(model_type)
+    if resolved is not None:
+        return resolved
+    with _lock:
+        if model_type not in _registered and model_type not in _BUILTIN_PIPELINES:
+            _load_entry_points()
+        entry = _registered.get(model_type)
+        if entry is None and model_type in _BUILTIN_PIPELINES:
+            module_name, pipeline_name, config_name = _BUILTIN_PIPELINES[model_type]
+            module = importlib.import_module(module_name)
+            entry = getattr(module, pipeline_name), getattr(module, config_name)
+        elif isinstance(entry, str):
+            pipeline = _import(entry)
+            entry = pipeline, _infer_config(pipeline)
+        elif entry is not None and entry[1] is None:
+            entry = entry[0], _infer_config(entry[0])
+        if entry is None:
+            raise KeyError(f"未注册的管线：{model_type}")
+        _resolved[model_type] = entry
+        return entry
+
+
+def create_pipeline(model_type: str, config: typing.Any = None, **kwargs):
+    """
+    根据模型类型创建管线，只会导入该管线所需的模块。
+    :param model_type: 模型类型，例如 "asr"、"llm"、"vla/showui"、"milvus"。
+    :param config: 配置实例或字典，为 None 时使用默认配置。
+    :param kwargs: 覆盖配置中的字段。
+    :return: 管线实例。
+    :raise ValueError: 无法推断管线的配置类，却没有传入 config 而只传入了 kwargs。
+    """
+    pipeline, config_cls = resolve_pipeline(model_type)
+    if config_cls is not None and (config is None or isinstance(config, dict)):
+        config = config_cls.model_validate({**(config or {}), **kwargs})
+    elif kwargs:
+        if config is None:
+            raise ValueError(f"无法推断 {model_type} 管线的配置类，请通过 config 传入配置实例，而不是只传入要覆盖的字段")
+        config = {**config, **kwargs} if isinstance(config, dict) else config.model_copy(update=kwargs)
+    return pipeline(config)
+
+
+def available_pipelines() -> list[str]:
+    """
+    :return: 所有可用的模型类型，包括通过 entry points 声明的管线。
+    """
+    with _lock:
+        _load_entry_points()
+        return sorted(set(_BUILTIN_PIPELINES) | set(_registered))
@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+import pytest
+from zerolan.data.pipeline.milvus import InsertRow, MilvusInsertResult
+
+from zerolan.ump.pipeline.database_ingest import BulkInserter, BulkInsertConfig, BulkInsertError
+
+
+class _Response:
+
+    def __init__(self, content: bytes, status_code: int = 200):
+        self.content = content
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class _FakeMilvus:
+
+    def __init__(self, fail_batches: set[int] = frozenset()):
+        self.local = None
+        self.fail_batches = set(fail_batches)
+        self.sent: list[list[int]] = []
+
+    def _insert_body(self, body: bytes) -> _Response:
+        ids = [row["id"] for row in json.loads(body)["texts"]]
+        if ids[0] // 2 in self.fail_batches:
+            return _Response(b"", 500)
+        self.sent.append(ids)
+        return _Response(MilvusInsertResult(insert_count=len(ids), ids=ids).model_dump_json().encode())
+
+    async def _ainsert_body(self, body: bytes) -> _Response:
+        return self._insert_body(body)
+
+
+_CONFIG = BulkInsertConfig(batch_rows=2, concurrency=1, max_retries=0)
+
+
+def _records(count: int = 10) -> list[InsertRow]:
+    return [InsertRow(id=i, subject="s", text=f"t{i}") for i in range(count)]
+
+
+def test_failed_run_resumes_from_checkpoint(tmp_path):
+    checkpoint = str(tmp_path / "bulk.json")
+    first = _FakeMilvus(fail_batches={2})
+    with pytest.raises(BulkInsertError) as info:
+        BulkInserter(first, "memory", _CONFIG, checkpoint).run(_records())
+    assert info.value.report.progress.acked == 1
+    assert first.sent == [[0, 1], [2, 3]]
+
+    second = _FakeMilvus()
+    report = BulkInserter(second, "memory", _CONFIG, checkpoint).run(_records())
+    assert second.sent == [[4, 5], [6, 7], [8, 9]]
+    assert report.progress.skipped == 2
+    assert report.progress.acked == 4
+
+
+def test_async_run_resumes_from_checkpoint(tmp_path):
+    checkpoint = str(tmp_path / "bulk.json")
+    with pytest.raises(BulkInsertError):
+        asyncio.run(BulkInserter(_FakeMilvus(fail_batches={3}), "memory", _CONFIG, checkpoint).arun(_records()))
+
+    second = _FakeMilvus()
+    asyncio.run(BulkInserter(second, "memory", _CONFIG, checkpoint).arun(_records()))
+    assert second.sent == [[6, 7], [8, 9]]
+
+
+def test_checkpoint_from_other_batching_is_rejected(tmp_path):
+    checkpoint = str(tmp_path / "bulk.json")
+    BulkInserter(_FakeMilvus(), "memory", _CONFIG, checkpoint).run(_records())
+    with pytest.raises(ValueError):
+        BulkInserter(_FakeMilvus(), "memory", _CONFIG.model_copy(update={"batch_rows": 3}), checkpoint)
@@ -0,0 +1,27 @@
+import io
+import wave
+
+from zerolan.ump.common.utils.framing import AudioCodec, BufferPool, read_raw_frames
+
+
+def _wav(sample_rate: int, channels: int) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(b"\0" * 10000)
+    return buf.getvalue()
+
+
+def test_raw_wav_frames_carry_header_format():
+    frames = [(f.sample_rate, f.channels) for f in
+              read_raw_frames(io.BytesIO(_wav(22050, 2)), AudioCodec.WAV, 0, 0, BufferPool(4096))]
+    assert len(frames) > 1
+    assert set(frames) == {(22050, 2)}
+
+
+def test_raw_frames_of_unknown_format_stay_zero():
+    frames = [(f.sample_rate, f.channels) for f in
+              read_raw_frames(io.BytesIO(b"OggS" * 100), AudioCodec.OGG, 0, 0, BufferPool(64))]
+    assert set(frames) == {(0, 0)}
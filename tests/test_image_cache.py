@@ -0,0 +1,25 @@
+import io
+
+from PIL import Image
+from zerolan.data.pipeline.ocr import OCRPrediction, OCRQuery
+
+from zerolan.ump.common.image_cache import ImageCacheConfig, PerceptualCache
+
+
+def _png() -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (16, 16), "white").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_cached_prediction_is_isolated_from_callers():
+    cache = PerceptualCache(ImageCacheConfig(enable=True))
+    key = cache.key(OCRQuery(), _png())
+    prediction = OCRPrediction(region_results=[])
+    cache.put(key, prediction)
+    prediction.region_results.append(None)
+
+    hit = cache.get(key)
+    assert hit.region_results == []
+    hit.region_results.append(None)
+    assert cache.get(key).region_results == []
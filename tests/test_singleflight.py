@@ -0,0 +1,89 @@
+import asyncio
+import threading
+
+from zerolan.data.pipeline.llm import LLMQuery
+from zerolan.data.pipeline.ocr import OCRPrediction
+
+from zerolan.ump.common.singleflight import SingleFlight, query_key
+
+
+def test_cancelled_consumer_does_not_truncate_shared_stream():
+    async def source():
+        for i in range(5):
+            await asyncio.sleep(0.01)
+            yield i
+
+    async def main():
+        flight = SingleFlight()
+        received = {"a": [], "b": []}
+
+        async def consume(name: str):
+            async for item in flight.astream("key", source):
+                received[name].append(item)
+
+        a = asyncio.ensure_future(consume("a"))
+        b = asyncio.ensure_future(consume("b"))
+        await asyncio.sleep(0.015)
+        a.cancel()
+        await b
+        return received, a.cancelled()
+
+    received, cancelled = asyncio.run(main())
+    assert cancelled
+    assert received["b"] == [0, 1, 2, 3, 4]
+
+
+def test_stream_source_closed_when_all_consumers_leave():
+    closed = asyncio.Event()
+
+    async def source():
+        try:
+            for i in range(5):
+                await asyncio.sleep(0.01)
+                yield i
+        finally:
+            closed.set()
+
+    async def main():
+        flight = SingleFlight()
+        task = asyncio.ensure_future(flight.astream("key", source).__anext__())
+        await asyncio.sleep(0.005)
+        task.cancel()
+        await asyncio.wait_for(closed.wait(), 1)
+
+    asyncio.run(main())
+
+
+def test_collapsed_callers_get_independent_results():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    prediction = OCRPrediction(region_results=[])
+    results = []
+
+    def fn():
+        started.set()
+        release.wait()
+        return prediction
+
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", fn)))
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=lambda: results.append(flight.do("key", fn)))
+    follower.start()
+    while flight.collapsed == 0:
+        pass
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert len(results) == 2
+    assert results[0] is not results[1]
+    results[0].region_results.append(None)
+    assert results[1].region_results == []
+
+
+def test_query_key_keeps_session_id_when_asked():
+    a = LLMQuery(id="a", text="hi", history=[])
+    b = LLMQuery(id="b", text="hi", history=[])
+    assert query_key(a) == query_key(b)
+    assert query_key(a, keep_id=True) != query_key(b, keep_id=True)
@@ -0,0 +1,34 @@
+from zerolan.data.pipeline.milvus import InsertRow, MilvusInsert, MilvusInsertResult, MilvusQuery, MilvusQueryResult, \
+    QueryRow
+
+from zerolan.ump.common.vector_cache import LocalVectorIndex, VectorCacheConfig
+
+
+def _index() -> LocalVectorIndex:
+    index = LocalVectorIndex(VectorCacheConfig(enable=True, mode="merge", min_score=0.5))
+    rows = [InsertRow(id=i, subject="s", text=f"今天天气很好 {i}") for i in range(5)]
+    index.add_inserted(MilvusInsert(collection_name="memory", texts=rows),
+                       MilvusInsertResult(insert_count=len(rows), ids=[row.id for row in rows]))
+    return index
+
+
+def test_merge_fills_up_to_limit_without_touching_remote_rows():
+    index = _index()
+    query = MilvusQuery(collection_name="memory", limit=3, output_fields=["text"], query="今天天气很好")
+    remote = [QueryRow(id=100, distance=0.2, entity={"text": "远程"}),
+              QueryRow(id=101, distance=0.4, entity={"text": "远程"})]
+
+    rows = index.absorb(query, MilvusQueryResult(result=[remote])).result[0]
+
+    assert len(rows) == query.limit
+    assert rows[:2] == remote
+    assert rows[2].id not in (100, 101)
+    assert rows[2].distance == remote[-1].distance
+
+
+def test_merge_adds_nothing_when_remote_is_full():
+    index = _index()
+    query = MilvusQuery(collection_name="memory", limit=1, output_fields=["text"], query="今天天气很好")
+    remote = [QueryRow(id=100, distance=0.2, entity={"text": "远程"})]
+
+    assert index.absorb(query, MilvusQueryResult(result=[remote])).result[0] == remote